@@ -0,0 +1,114 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Audit Log Benchmark
+
+Filename:    audit.py
+            
+Description: Appends measurement records to the audit logs of several
+             domains from a thread each, as fast as they can, and reports the
+             sustained records per second, the time appends take, and the 
+             durability lag: how long the oldest record of a commit waited 
+             to be synced.  Runs once per commit interval.  The slowest 
+             appends include time the thread was not scheduled.
+
+                python -m bench.audit [seconds] [domains] [intervals ...]
+
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+from time import time
+from util import audit
+
+DIGEST = '5a' * 20
+
+def produce(log, end, samples):
+    n = 0
+    times = []
+    while True:
+        start = time()
+        if start >= end:
+            break
+        log.measurement(n, DIGEST)
+        times.append(time() - start)
+        n += 1
+    samples.extend(times)
+
+def run(seconds, domains, interval):
+    path = tempfile.mkdtemp()
+    writer = audit.Writer(interval)
+    writer.start()
+    logs = [writer.open(os.path.join(path, 'dom%d.audit' % i)) 
+        for i in range(domains)]
+    
+    samples = []
+    end = time() + seconds
+    threads = [threading.Thread(target=produce, args=(log, end, samples))
+        for log in logs]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    appended = sum(log.appended for log in logs)
+    
+    start = time()
+    for log in logs:
+        writer.flush(log)
+    drain = time() - start
+    records = sum(1 for i in range(domains) 
+        for r in audit.read(os.path.join(path, 'dom%d.audit' % i)))
+    shutil.rmtree(path)
+    
+    samples.sort()
+    print "interval %.3f s  %7.0f records/s  %d read back  append p99 " \
+        "%.1f us max %.1f ms  max lag %.3f s  drain %.3f s  %d commits" % (
+        interval, appended / seconds, records, 
+        1e6 * samples[int(len(samples) * 0.99)], 1e3 * samples[-1],
+        writer.max_lag, drain, writer.commits)
+
+
+if __name__ == "__main__":
+    
+    seconds = 5.0
+    if len(sys.argv) > 1:
+        seconds = float(sys.argv[1])
+    domains = 4
+    if len(sys.argv) > 2:
+        domains = int(sys.argv[2])
+    intervals = [0.01, 0.05, 0.2]
+    if len(sys.argv) > 3:
+        intervals = [float(i) for i in sys.argv[3:]]
+
+    for interval in intervals:
+        run(seconds, domains, interval)
@@ -0,0 +1,114 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Client Rules Benchmark
+
+Filename:    clients.py
+            
+Description: Compiles random [Clients] rules, mostly IPv4 prefixes from /8 to
+             /32 and some IPv6 ones, and measures lookups per second of 
+             addresses inside the rules, and of unknown addresses the first
+             time and when they are in the negative cache.
+
+                python -m bench.clients [rules] [lookups]
+
+"""
+import sys
+import random
+import socket
+import struct
+from time import time
+from ConfigParser import ConfigParser
+from util.clients import Rules
+
+def ipv4(addr):
+    return socket.inet_ntoa(struct.pack('!I', addr))
+
+def ipv6(addr):
+    return socket.inet_ntop(socket.AF_INET6, 
+        ('%032x' % addr).decode('hex'))
+
+def host(length):
+    """ Random host part for a prefix leaving @length bits """
+    return length and random.getrandbits(length)
+
+def rules(n):
+    """ Returns a config of @n rules and addresses each rule covers.
+    IPv4 rules stay out of 192.0.0.0/8 so there are addresses to miss. """
+    
+    cfg = ConfigParser()
+    cfg.add_section('Clients')
+    hits = []
+    for i in range(n):
+        if i % 20 == 0:
+            length = random.randint(32, 128)
+            addr = (0x2001 << 112 | random.getrandbits(112)) 
+            addr &= ~((1 << (128 - length)) - 1)
+            cfg.set('Clients', 'v6-%d' % i, '%s/%d cfg/%d.crt' % (
+                ipv6(addr), length, i))
+            hits.append(ipv6(addr | host(128 - length)))
+        else:
+            length = random.randint(8, 32)
+            addr = random.getrandbits(32) & ~((1 << (32 - length)) - 1)
+            if addr >> 24 == 192:
+                addr ^= 1 << 31
+            cfg.set('Clients', '%s/%d' % (ipv4(addr), length), 
+                'cfg/%d.crt' % i)
+            hits.append(ipv4(addr | host(32 - length)))
+    return (cfg, hits)
+
+def run(name, lookup, addrs):
+    start = time()
+    for addr in addrs:
+        lookup(addr)
+    print "%-16s %9.0f lookups/s" % (name, len(addrs) / (time() - start))
+
+
+if __name__ == "__main__":
+    
+    n = 100000
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    count = 200000
+    if len(sys.argv) > 2:
+        count = int(sys.argv[2])
+    
+    (cfg, hits) = rules(n)
+    start = time()
+    table = Rules(cfg)
+    print "compiled %d rules in %.2f s" % (len(table), time() - start)
+
+    hits = [random.choice(hits) for i in range(count)]
+    misses = [ipv4(0xc0 << 24 | random.getrandbits(24)) 
+        for i in range(count)]
+    run("hits", table.lookup, hits)
+    run("misses", table.lookup, misses)
+    run("cached misses", table.lookup, misses)
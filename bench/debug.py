@@ -0,0 +1,109 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+GDB Reader Benchmark
+
+Filename:    debug.py
+            
+Description: Compares the buffered Dbg reader against the previous per-line
+             poll/marker/readline loop on a process that streams gdb-like
+             watchpoint output.  Each event is six lines: the watchpoint hit
+             plus the five lines a module feeds.  The legacy marker goes to
+             /dev/null unless a path is given, which understates its cost.
+
+                python -m bench.debug [events] [marker path]
+
+"""
+import os
+import sys
+import select
+from time import time
+from subprocess import *
+from util.debug import Dbg
+
+LINE = "Hardware watchpoint 2: *(long *) 18446744071580000000"
+
+class Output(Dbg):
+    """ Dbg on a process that prints watchpoint lines forever """
+    command = 'yes'
+
+class Legacy():
+    """ The reader Dbg used before: poll, marker and readline per line """
+    
+    def __init__(self, args, marker):
+        self.proc = Popen("yes " + args, shell=True, stdin=PIPE, stdout=PIPE)
+        self.poll = select.poll()
+        self.poll.register(self.proc.stdout, select.POLLIN)
+        self.marker_fd = open(marker, 'w')
+
+    def readline(self):
+        self.poll.poll()
+        self.marker_fd.write('gdb-marker')
+        try:
+            self.marker_fd.flush()
+        except IOError:
+            pass
+        return self.proc.stdout.readline().rstrip()
+
+    def feed(self, n):
+        res = []
+        for x in range(n):
+            res += [self.proc.stdout.readline().rstrip()]
+        return res
+
+def run(dbg, events):
+    (start, cpu) = (time(), os.times())
+    for i in range(events):
+        dbg.readline()
+        dbg.feed(5)
+    (wall, end) = (time() - start, os.times())
+    cpu = (end[0] - cpu[0]) + (end[1] - cpu[1])
+    dbg.proc.kill()
+    return (wall, cpu)
+
+def report(name, events, result):
+    (wall, cpu) = result
+    print "%-8s %9.0f lines/sec\t %6.2f us CPU/event" % (name, 
+        6 * events / wall, 1e6 * cpu / events)
+
+
+if __name__ == "__main__":
+    
+    events = 200000
+    marker = '/dev/null'
+    if len(sys.argv) > 1:
+        events = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        marker = sys.argv[2]
+
+    args = '"%s" 2>/dev/null' % LINE
+    report("legacy", events, run(Legacy(args, marker), events))
+    report("buffered", events, run(Output(args), events))
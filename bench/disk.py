@@ -0,0 +1,92 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Disk Measurement Benchmark
+
+Filename:    disk.py
+            
+Description: Builds a sparse image (10GB by default) with data spread over
+             it, then times a cold Merkle measurement, a re-measurement of
+             the unchanged image, and a re-measurement after a small write.
+
+                python -m bench.disk [GB] [MB of data] [dir]
+
+"""
+import os
+import sys
+import shutil
+import tempfile
+from time import time, sleep
+from util import merkle
+
+def timed(name, path, cache):
+    start = time()
+    tree = merkle.measure(path, cache)
+    print "%-12s %8.2f s\t read: %5d chunks\t changed: %5d\t root: %s" % (
+        name, time() - start, tree.rehashed, tree.changed, tree.root[:16])
+
+
+if __name__ == "__main__":
+    
+    gb = 10
+    data = 512
+    tmp = None
+    if len(sys.argv) > 1:
+        gb = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        data = int(sys.argv[2])
+    tmp = tempfile.mkdtemp(dir=len(sys.argv) > 3 and sys.argv[3] or None)
+    
+    try:
+        path = os.path.join(tmp, 'disk.img')
+        cache = os.path.join(tmp, 'cache')
+        size = gb << 30
+        
+        # Spread @data MB over the image in 1MB extents
+        f = open(path, 'wb')
+        f.truncate(size)
+        block = os.urandom(1 << 20)
+        for i in range(data):
+            f.seek(i * (size / data))
+            f.write(block)
+        f.close()
+
+        timed("cold", path, cache)
+        timed("unchanged", path, cache)
+
+        sleep(0.01)
+        f = open(path, 'r+b')
+        f.seek(size / 3)
+        f.write('changed')
+        f.close()
+        timed("small write", path, cache)
+    finally:
+        shutil.rmtree(tmp)
@@ -0,0 +1,280 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Prima Watch/Poll Benchmark
+
+Filename:    prima.py
+            
+Description: Replays a boot-like burst of IMA measurements into a synthetic
+             measurement list in this process's memory and runs the Prima
+             module on it twice: watching every append, as it did before it
+             could poll, and switching to polling under the burst.  Reports
+             the VM halts each caused and the guest pause they add up to at
+             the per-halt cost measured over the RSP stub.  Both runs must
+             end up with every measurement.  First checks that each way
+             Prima reads the list audits measurements with their position
+             in it.
+
+                python -m bench.prima [burst rate] [seconds]
+
+"""
+import sys
+import struct
+import threading
+from time import time, sleep
+from ConfigParser import ConfigParser
+from util import timing
+from util.mods import Prima
+from util.memory import LocalMemory, START_KERNEL_MAP
+from bench.rsp import bench_rsp
+
+# List head, list length, and the queue entries after them
+HEAD = START_KERNEL_MAP + 0x1000
+LENGTH = START_KERNEL_MAP + 0x1010
+ENTRIES = START_KERNEL_MAP + 0x2000
+
+# Queue entries are {next, prev, template entry pointer, digest}
+ENTRY = 48
+SYMS = {'ima_measurements': HEAD, 'ima_measurements_prev': HEAD + 8,
+    'ima_htable_len': LENGTH, 'qe_later': 0, 'qe_entry': 16, 'te_digest': 0}
+
+class Guest():
+    """ Appends measurements to the list and reports each write of the 
+    watched list pointer to the watcher """
+    
+    def __init__(self, mem, watcher):
+        self.mem = mem
+        self.watcher = watcher
+        self.count = 0
+        self.tail = HEAD
+        mem.write_ulong(HEAD, HEAD)
+        mem.write_ulong(HEAD + 8, HEAD)
+        mem.write_ulong(LENGTH, 0)
+
+    def append(self):
+        node = ENTRIES + self.count * ENTRY
+        self.count += 1
+        self.mem.write(node, struct.pack('<QQQ', HEAD, self.tail, node + 24) + 
+            self.digest(self.count).decode('hex'))
+        self.mem.write_ulong(self.tail, node)
+        self.mem.write_ulong(HEAD + 8, node)
+        self.mem.write_ulong(LENGTH, self.count)
+        self.tail = node
+        if self.watcher is not None:
+            self.watcher.write()
+
+    def digest(self, seq):
+        """ Digest of measurement number @seq """
+        return struct.pack('<Q', seq).rjust(20, '\0').encode('hex')
+
+    def run(self, phases, tick=0.005):
+        """ Appends at each (rate, seconds) of @phases in turn """
+        
+        for (rate, seconds) in phases:
+            (due, end) = (0.0, time() + seconds)
+            while time() < end:
+                due += rate * tick
+                while due >= 1:
+                    self.append()
+                    due -= 1
+                sleep(tick)
+
+
+class Watcher():
+    """ Counts the VM halts Prima causes.  Refreshes run on a thread of their
+    own, and events that arrive meanwhile are merged into the next one, as on
+    a Reactor. """
+    
+    def __init__(self, module):
+        self.module = module
+        self.armed = True
+        self.disarming = False
+        self.halts = 0
+        self.lock = threading.Lock()
+        self.pending = threading.Event()
+        self.running = True
+        self.thread = threading.Thread(target=self.run)
+        self.thread.daemon = True
+        self.thread.start()
+
+    def write(self):
+        with self.lock:
+            if not self.armed:
+                return
+            self.halts += 1
+            if self.disarming:
+                (self.armed, self.disarming) = (False, False)
+        self.pending.set()
+
+    def disarm(self, name):
+        # The watchpoint goes at the next halt
+        self.disarming = True
+        return True
+
+    def arm(self, name, done):
+        with self.lock:
+            self.halts += 1
+            self.armed = True
+        done()
+        return True
+
+    def trigger(self, name):
+        pass
+
+    def run(self):
+        while self.running:
+            self.pending.wait(0.1)
+            if self.pending.is_set():
+                self.pending.clear()
+                self.module.Refresh()
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+
+
+class Audit():
+    """ Records the sequence number each measurement was audited with """
+    
+    def __init__(self):
+        self.seqs = {}
+
+    def measurement(self, seq, digest):
+        self.seqs[digest] = seq
+
+
+class Dbg():
+    """ Answers the gdb commands Prima.Initialize sends the way the macros 
+    in cfg/ivc.gdb do, so print_mlist_since lists the newest first """
+    
+    def __init__(self, guest):
+        self.guest = guest
+        self.lines = []
+
+    def cmd(self, c, feed=0):
+        if c.startswith('print_mlist_since'):
+            since = int(c.split()[1])
+            self.lines = [self.guest.digest(seq) for seq in 
+                range(self.guest.count, since, -1)]
+            return ['(gdb) %d' % len(self.lines)]
+        return ['(gdb) Hardware watchpoint 2: ' + c[6:]]
+
+    def feed(self, n):
+        (lines, self.lines) = (self.lines[:n], self.lines[n:])
+        return lines
+
+
+def numbering():
+    """ Reads the list through gdb, by walking it and by resuming from a 
+    checkpoint, a few entries at a time, and checks that each measurement
+    is audited with its position in the list """
+    
+    mem = LocalMemory(ENTRIES - START_KERNEL_MAP + ENTRY * 64)
+    guest = Guest(mem, None)
+    (gdb, walk, resume) = (Prima(), Prima(), Prima())
+    for m in (gdb, walk, resume):
+        (m.syms, m.audit) = (SYMS, Audit())
+    (walk.mem, walk.tail) = (mem, HEAD)
+    
+    for n in [5, 1, 3]:
+        for i in range(n):
+            guest.append()
+        gdb.Initialize(Dbg(guest))
+        walk.catchup()
+        if resume.mem is None:
+            # Checkpointed before the first entries were read
+            (resume.mem, resume.count) = (mem, guest.count)
+        else:
+            resume.resume()
+    
+    for (name, m, first) in [("gdb", gdb, 1), ("walk", walk, 1), 
+            ("resume", resume, 6)]:
+        expected = dict((guest.digest(seq), seq) for seq in 
+            range(first, guest.count + 1))
+        wrong = sorted((seq, m.audit.seqs.get(d, None)) for (d, seq) in 
+            expected.items() if m.audit.seqs.get(d, None) != seq)
+        if wrong or len(m.audit.seqs) != len(expected):
+            raise Exception("%s audits measurements out of list order, "
+                "(position, seq): %s" % (name, wrong))
+    print "audit sequence numbers match list order"
+
+def run(name, phases, halt, **opts):
+    cfg = ConfigParser()
+    cfg.add_section(Prima.name)
+    for (k, v) in opts.items():
+        cfg.set(Prima.name, k, str(v))
+    m = Prima(cfg)
+    mem = LocalMemory(ENTRIES - START_KERNEL_MAP + ENTRY * 
+        int(sum(r * s for (r, s) in phases) * 1.1 + 1024))
+    watcher = Watcher(m)
+    guest = Guest(mem, watcher)
+    (m.mem, m.syms, m.watcher) = (mem, SYMS, watcher)
+    
+    # What Initialize does before it sets the watchpoint
+    m.tail = HEAD
+    m.catchup()
+    
+    guest.run(phases)
+    sleep(0.5)
+    m.polling = False
+    watcher.stop()
+    m.catchup()
+    if m.count != guest.count or len(m.mlist) != guest.count:
+        raise Exception("%s lost measurements: %d of %d" % (name, m.count,
+            guest.count))
+    print "%-6s %6d measurements  %6d halts  paused %7.3f s  %d polled  " \
+        "%d switches" % (name, guest.count, watcher.halts, watcher.halts * 
+        halt, m.polled, m.switches)
+    return watcher.halts
+
+
+if __name__ == "__main__":
+
+    timing.disable = True
+    burst = len(sys.argv) > 1 and float(sys.argv[1]) or 5000
+    seconds = len(sys.argv) > 2 and float(sys.argv[2]) or 2.0
+    
+    # Quiet, a package install, quiet again
+    phases = [(20, 1.0), (burst, seconds), (20, 1.0)]
+    
+    # Median cost of one watchpoint stop and resume
+    samples = sorted(bench_rsp(LocalMemory(1 << 16), 500))
+    halt = samples[len(samples) / 2]
+    print "halt %.1f us over RSP" % (1e6 * halt)
+    
+    Prima.sets.setdefault('bench', set())
+    numbering()
+    watch = run("watch", phases, halt)
+    hybrid = run("hybrid", phases, halt, poll_rate=1000, watch_rate=50, 
+        rate_window=0.5, poll_interval=0.05)
+    print "hybrid saves %d halts (%.1f%%), %.3f s of guest pause" % (
+        watch - hybrid, 100.0 * (watch - hybrid) / watch, 
+        (watch - hybrid) * halt)
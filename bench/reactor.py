@@ -0,0 +1,215 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Watcher Reactor Benchmark
+
+Filename:    reactor.py
+            
+Description: Runs RemoteWatchers for simulated domains, each on a thread of
+             its own and then all on one Reactor, and reports the process's
+             thread count and the latency from a watchpoint hit to its
+             dispatch and to its criteria check.  A single driver thread plays
+             every VM: it reports a watchpoint hit on a domain's RSP socket
+             and waits for the watcher to resume it before the next one.
+
+                python -m bench.reactor [events/s] [seconds] [domains ...]
+
+"""
+import sys
+import heapq
+import select
+import socket
+import threading
+from random import random
+from time import time, sleep
+from hashlib import sha1
+from util import timing
+from util.rsp import Connection, Remote, frame
+from util.monitor import RemoteWatcher
+from util.reactor import Reactor
+
+WATCH = 0x1000
+PAGE = 'x' * 65536
+
+class Target(Remote):
+    """ RSP client on an already connected socket """
+
+    def __init__(self, sock):
+        Connection.__init__(self, sock)
+        self.ack = False
+
+
+class Module():
+    """ Measures a page of memory on every event """
+    
+    mem = None
+
+    def __init__(self, domain):
+        self.domain = domain
+
+    def Refresh(self):
+        sha1(PAGE).digest()
+        return True
+
+
+class Domain(RemoteWatcher):
+    """ RemoteWatcher for a simulated domain """
+    
+    def __init__(self, sock, samples):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.target = Target(sock)
+        self.samples = samples
+        self.sent = None
+        self.modules = {'Sim': Module(self)}
+        self.watchpoints = [(WATCH, 4, 'Sim')]
+        self.actions = []
+        self.lock = threading.Lock()
+        self.detaching = False
+
+    def attach(self):
+        self.target.cont()
+
+    def handle(self, sig, info):
+        self.dispatched = time()
+        RemoteWatcher.handle(self, sig, info)
+
+    def trigger(self, name):
+        now = time()
+        self.samples.append((self.dispatched - self.sent, now - self.sent))
+
+
+def pair():
+    listener = socket.socket()
+    listener.bind(('127.0.0.1', 0))
+    listener.listen(1)
+    client = socket.create_connection(listener.getsockname())
+    (server, addr) = listener.accept()
+    listener.close()
+    return (client, server)
+
+def drive(domains, vms, rate, seconds):
+    """ Plays the VMs: each runs for a while after it is resumed, then hits
+    its watchpoint, so that hits arrive at @rate per second in all """
+    
+    period = float(len(domains)) / rate
+    poll = select.epoll()
+    owner = {}
+    for (dom, vm) in zip(domains, vms):
+        owner[vm.fileno()] = (dom, vm)
+        poll.register(vm.fileno(), select.EPOLLIN)
+    
+    # VMs start out of phase so hits do not come in bursts
+    timers = []
+    started = set()
+    end = time() + seconds
+    while time() < end:
+        wait = timers and max(0, timers[0][0] - time()) or 0.01
+        for (fd, mask) in poll.poll(wait):
+            (dom, vm) = owner[fd]
+            vm.fill()
+            while vm.ready():
+                if vm.recv() != 'c':
+                    continue
+                delay = period
+                if fd not in started:
+                    started.add(fd)
+                    delay *= random()
+                heapq.heappush(timers, (time() + delay, fd))
+        while timers and timers[0][0] <= time():
+            (dom, vm) = owner[heapq.heappop(timers)[1]]
+            dom.sent = time()
+            vm.sock.sendall(frame('T05watch:%x;' % WATCH))
+
+def run(n, rate, seconds, reactor):
+    samples = []
+    domains = []
+    vms = []
+    for i in range(n):
+        (client, server) = pair()
+        domains.append(Domain(client, samples))
+        vm = Connection(server)
+        vm.ack = False
+        vms.append(vm)
+    
+    for dom in domains:
+        if reactor is None:
+            dom.start()
+        else:
+            dom.reactor = reactor
+            dom.attach()
+            reactor.add(dom)
+    
+    driver = threading.Thread(target=drive, args=(domains, vms, rate, 
+        seconds))
+    driver.start()
+    sleep(seconds / 2.0)
+    threads = threading.active_count()
+    driver.join()
+    sleep(0.5)
+    
+    # The VMs exit, and so do their watchers
+    for vm in vms:
+        vm.sock.sendall(frame('W00'))
+    sleep(0.5)
+    for (dom, vm) in zip(domains, vms):
+        dom.target.close()
+        vm.close()
+    return (threads, samples)
+
+def report(name, n, threads, samples):
+    dispatch = sorted(s[0] for s in samples)
+    checked = sorted(s[1] for s in samples)
+    pct = lambda s, p: 1e3 * s[min(len(s) - 1, int(p * len(s)))]
+    print "%-8s %4d domains %4d threads %6d events  dispatch p50 %.2f " \
+        "p99 %.2f ms  checked p50 %.2f p99 %.2f ms" % (name, n, threads,
+        len(samples), pct(dispatch, 0.5), pct(dispatch, 0.99), 
+        pct(checked, 0.5), pct(checked, 0.99))
+
+
+if __name__ == "__main__":
+    
+    timing.disable = True
+    rate = 500
+    if len(sys.argv) > 1:
+        rate = int(sys.argv[1])
+    seconds = 5.0
+    if len(sys.argv) > 2:
+        seconds = float(sys.argv[2])
+    counts = [10, 100, 500]
+    if len(sys.argv) > 3:
+        counts = [int(n) for n in sys.argv[3:]]
+
+    reactor = Reactor()
+    reactor.start()
+    for n in counts:
+        report("threads", n, *run(n, rate, seconds, None))
+        report("reactor", n, *run(n, rate, seconds, reactor))
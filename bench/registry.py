@@ -0,0 +1,115 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Client Registry Benchmark
+
+Filename:    registry.py
+            
+Description: Churns the clients of one VM, connecting and disconnecting 
+             random peers under a few criteria and revoking a criteria now
+             and then.  It compares the client Registry to the lists of 
+             clients per criteria that monitors kept before, for growing
+             numbers of peers.
+
+                python -m bench.registry [operations] [peers ...]
+
+"""
+import sys
+import random
+from time import time
+from util.clients import Registry
+
+class Lists():
+    """ Clients as the monitor kept them in lists per criteria """
+    
+    def __init__(self):
+        self.clients = {}
+
+    def add(self, key, ip):
+        if key in self.clients:
+            if ip not in self.clients[key]:
+                self.clients[key] += [ip]
+                return True
+            return False
+        self.clients[key] = [ip]
+        return True
+
+    def remove(self, key, ip):
+        if ip not in self.clients.get(key, []):
+            return False
+        self.clients[key].remove(ip)
+        if not self.clients[key]:
+            self.clients.pop(key)
+        return True
+
+    def revoke(self, key):
+        return self.clients.pop(key, [])
+
+
+def churn(registry, peers, ops, criteria=10):
+    """ Returns operations per second of @ops random connects and 
+    disconnects over @peers clients, with a revocation every 10000 """
+    
+    ips = ['10.%d.%d.%d' % (i >> 16, (i >> 8) & 0xff, i & 0xff) 
+        for i in range(peers)]
+    key = dict((ip, 'crt-%d' % (hash(ip) % criteria)) for ip in ips)
+    
+    # Start with every peer connected
+    for ip in ips:
+        registry.add(key[ip], ip)
+    
+    lists = isinstance(registry, Lists)
+    start = time()
+    for i in xrange(ops):
+        ip = random.choice(ips)
+        if i % 10000 == 9999:
+            registry.revoke(key[ip])
+        elif i % 2:
+            registry.add(key[ip], ip)
+        elif lists:
+            registry.remove(key[ip], ip)
+        else:
+            registry.remove(ip)
+    return ops / (time() - start)
+
+
+if __name__ == "__main__":
+    
+    ops = 20000
+    if len(sys.argv) > 1:
+        ops = int(sys.argv[1])
+    counts = [1000, 10000, 50000]
+    if len(sys.argv) > 2:
+        counts = [int(n) for n in sys.argv[2:]]
+
+    for peers in counts:
+        print "%6d peers  lists %9.0f ops/s  registry %9.0f ops/s" % (peers,
+            churn(Lists(), peers, ops), churn(Registry(), peers, ops))
@@ -0,0 +1,135 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Policy Replay Benchmark
+
+Filename:    replay.py
+            
+Description: Replays synthetic VMs against candidate criteria that each name
+             a trusted set of their own, and compares the vectorized replay 
+             with checking every (VM, criteria) pair the way Prima.Check 
+             does, which is timed on a sample and extrapolated.  Each VM 
+             measures mostly digests common to its image, plus a few of its
+             own; each set trusts all of the pool but a few digests.
+
+                python -m bench.replay [VMs] [criteria] [measurements]
+
+"""
+import sys
+import numpy
+import random
+from time import time
+from hashlib import sha1
+from ConfigParser import ConfigParser
+from util.replay import Replay, VM, encode, decode
+from util.mods import Prima, ZERO
+
+POOL = 20000
+IMAGES = 20
+
+def digest(i):
+    return sha1(str(i)).hexdigest()
+
+def build(vms, criteria, measured):
+    """ Returns a Replay and the hex digest sets of its VMs and sets """
+    
+    pool = [digest(i) for i in range(POOL)]
+    images = [random.sample(pool, measured) for i in range(IMAGES)]
+    
+    replay = Replay()
+    lists = []
+    for i in range(vms):
+        mlist = random.choice(images)[:measured - 10] + \
+            random.sample(pool, 10) + [ZERO]
+        replay.vms.append(VM('vm%d' % i, mlist))
+        lists.append(set(mlist))
+    
+    # Sets are cut from the encoded pool rather than encoded one by one
+    encoded = encode(pool)
+    where = dict((decode(d), i) for (i, d) in enumerate(encoded))
+    sets = {}
+    for i in range(criteria):
+        name = 'set%d' % i
+        lacks = random.sample(pool, random.randrange(8))
+        replay.sets[name] = numpy.delete(encoded, [where[d] for d in lacks])
+        sets[name] = set(pool).difference(lacks)
+        crt = ConfigParser()
+        crt.add_section(Prima.name)
+        crt.set(Prima.name, 'trusted', name)
+        replay.candidates.append((name, crt))
+    return (replay, lists, sets)
+
+def check(mlist, trusted):
+    """ Prima.Check on one pair """
+    
+    untrusted = mlist.difference(trusted)
+    untrusted.discard(ZERO)
+    return not untrusted
+
+
+if __name__ == "__main__":
+
+    vms = len(sys.argv) > 1 and int(sys.argv[1]) or 2000
+    criteria = len(sys.argv) > 2 and int(sys.argv[2]) or 500
+    measured = len(sys.argv) > 3 and int(sys.argv[3]) or 1500
+    random.seed(1)
+    
+    start = time()
+    (replay, lists, sets) = build(vms, criteria, measured)
+    print "%d VMs x %d criteria, %d measurements each, built in %.1f s" % (
+        vms, criteria, measured, time() - start)
+    
+    start = time()
+    passed = replay.evaluate(sorted(sets))
+    evaluated = time() - start
+    start = time()
+    (candidates, revoked) = replay.run()
+    ran = time() - start
+    failures = sum(len(v) for v in candidates.values())
+    print "vectorized: verdicts %.2f s, with culprit digests %.2f s, " \
+        "%d of %d pairs fail" % (evaluated, ran, failures, vms * criteria)
+    
+    # Check a sample of pairs one at a time and compare the verdicts
+    names = sorted(sets)
+    sample = [(random.randrange(vms), random.randrange(criteria)) 
+        for i in range(2000)]
+    start = time()
+    verdicts = [check(lists[i], sets[names[j]]) for (i, j) in sample]
+    per = (time() - start) / len(sample)
+    for ((i, j), verdict) in zip(sample, verdicts):
+        if passed[i, j] != verdict:
+            raise Exception("Verdicts differ for vm%d and %s" % (i, names[j]))
+        culprits = dict(candidates[names[j]]).get(replay.vms[i], [])
+        if replay.digests(culprits) != sorted(lists[i] - sets[names[j]] - 
+                set([ZERO])):
+            raise Exception("Culprits differ for vm%d and %s" % (i, names[j]))
+    print "pairwise:   %.1f us per pair, %.0f s estimated for all pairs" % (
+        1e6 * per, per * vms * criteria)
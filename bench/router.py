@@ -0,0 +1,365 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Router Harness
+
+Filename:    router.py
+            
+Description: Runs the router (ivc.py --router) in front of several local
+             backend processes and checks it end to end: domains spread over
+             the backends, connect routed by dom_ip, reloads sent to every
+             backend, events merged from all of them, a profile longer than
+             the router's timeout, and a backend killed and its domains 
+             started again on the others.  Then compares status calls per
+             second through the router with calls straight to a backend.
+
+             Backends are stand-ins serving the VMServer surface with a 
+             real event bus, so no VMs are needed.  With --ivc they are
+             ivc.py monitor servers instead, which need libvirt and the 
+             config's domains.
+
+                python -m bench.router [backends] [domains] [--ivc]
+
+"""
+import os
+import sys
+import socket
+import shutil
+import tempfile
+import threading
+import subprocess
+from time import time, sleep
+from ConfigParser import ConfigParser
+from util.config import domains as domain_tables
+from util.events import Bus
+from util.server import Server
+from util.transport import connect
+from util.router import backend_config
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+class Backend(Server):
+    """ Stand-in for VMServer that starts domains without VMs """
+    
+    def __init__(self, cfg):
+        self.port = cfg.getint('VMServer', 'port')
+        self.ip_to_dom = domain_tables(cfg)[1]
+        self.running = set()
+        self.bus = Bus(delay=0.01)
+        Server.__init__(self, (cfg.get('VMServer', 'host'), self.port), 
+            logRequests=False)
+
+    def _dispatch(self, method, params):
+        try:
+            func = getattr(self, 'export_' + method)
+        except AttributeError:
+            raise Exception('method "%s" is not supported' % method)
+        return func(*params)
+
+    def export_ping(self):
+        return True
+
+    def export_start(self, domain):
+        self.running.add(domain)
+        self.bus.publish(domain, 'state', 'Domain running.')
+        return "%s started on %d" % (domain, self.port)
+
+    def export_stop(self, domain):
+        self.running.discard(domain)
+        self.bus.publish(domain, 'state', 'Domain stopped.')
+        return "%s stopped on %d" % (domain, self.port)
+
+    export_force_stop = export_detach = export_stop
+
+    def export_status(self, domain):
+        if domain in self.running:
+            return "%s running on %d" % (domain, self.port)
+        return "%s is not running." % domain
+
+    def export_connect(self, src_ip, dom_ip):
+        return self.ip_to_dom.get(dom_ip, None) in self.running
+
+    export_disconnect = export_connect
+
+    def export_reload(self):
+        return "Reloaded on %d" % self.port
+
+    def export_reload_sets(self):
+        return [{}, {}]
+
+    def export_events(self, since=0, timeout=30, epoch=0, domains=[]):
+        since = self.bus.resume(since, epoch)
+        return self.bus.wait(since, min(timeout, 300), 
+            domains=domains or None)
+
+    def export_subscribe(self, url, since=0, epoch=0, domains=[]):
+        self.bus.subscribe(url, since, epoch, domains or None)
+        return True
+
+    def export_unsubscribe(self, url):
+        return self.bus.unsubscribe(url)
+
+    def export_profile(self, domain, seconds=10, mode='both'):
+        sleep(seconds)
+        return "profiled %s on %d" % (domain, self.port)
+
+
+def free_port():
+    s = socket.socket()
+    s.bind(('localhost', 0))
+    port = s.getsockname()[1]
+    s.close()
+    return port
+
+def config(backends, domains):
+    """ Returns a router config for @backends local backends """
+    
+    cfg = ConfigParser()
+    cfg.add_section('VMServer')
+    cfg.set('VMServer', 'host', 'localhost')
+    cfg.set('VMServer', 'port', '0')
+    cfg.set('VMServer', 'netproxy', 'http://localhost:9')
+    cfg.add_section('Router')
+    cfg.set('Router', 'host', 'localhost')
+    cfg.set('Router', 'port', str(free_port()))
+    cfg.set('Router', 'backends', ' '.join('http://localhost:%d' % 
+        free_port() for i in range(backends)))
+    cfg.set('Router', 'timeout', '1')
+    cfg.set('Router', 'health_interval', '0.2')
+    cfg.add_section('Domains')
+    for i in range(domains):
+        cfg.set('Domains', 'dom%d' % i, '10.0.%d.%d %d' % (i / 250, 
+            i % 250 + 1, 1234 + i))
+    return cfg
+
+def spawn(args):
+    null = open(os.devnull, 'w')
+    return subprocess.Popen([sys.executable] + args, cwd=ROOT, stdout=null,
+        stderr=null)
+
+def wait_up(url, seconds=10):
+    proxy = connect(url, 1, timeout=1)
+    end = time() + seconds
+    while time() < end:
+        try:
+            return proxy.ping()
+        except Exception:
+            sleep(0.05)
+    raise Exception("%s did not come up" % url)
+
+def check(what, ok):
+    print "%-48s %s" % (what, ok and "ok" or "FAILED")
+    if not ok:
+        check.failed += [what]
+check.failed = []
+
+def owners(router, domains):
+    """ Maps each running domain to the port of the backend it runs on.
+    Calls to a dead backend fail until health checks notice. """
+    
+    res = {}
+    for domain in domains:
+        try:
+            words = router.status(domain).split()
+        except Exception:
+            continue
+        if 'running' in words and 'on' in words:
+            res[domain] = int(words[-1])
+    return res
+
+def threads(proc):
+    """ Number of threads of process @proc """
+    
+    for line in open('/proc/%d/status' % proc.pid):
+        if line.startswith('Threads:'):
+            return int(line.split()[1])
+
+def rate(proxy, domains, seconds=1.0):
+    """ Status calls per second """
+    
+    (n, end) = (0, time() + seconds)
+    while time() < end:
+        proxy.status(domains[n % len(domains)])
+        n += 1
+    return n / seconds
+
+def harness(cfg, dirname, ivc):
+    backends = cfg.get('Router', 'backends').split()
+    url = 'http://localhost:%d' % cfg.getint('Router', 'port')
+    domains = [name for (name, value) in cfg.items('Domains')]
+    
+    procs = {}
+    for backend in backends:
+        path = os.path.join(dirname, 'backend-%d.cfg' % 
+            int(backend.rsplit(':', 1)[1]))
+        backend_config(cfg, backend).write(open(path, 'w'))
+        procs[backend] = spawn(ivc and ['ivc.py', path] or 
+            ['-m', 'bench.router', '--backend', path])
+    path = os.path.join(dirname, 'router.cfg')
+    cfg.write(open(path, 'w'))
+    procs[url] = spawn(['ivc.py', '--router', path])
+    for u in backends + [url]:
+        wait_up(u)
+    router = connect(url, 4, timeout=30)
+    
+    try:
+        for domain in domains:
+            router.start(domain)
+        placed = owners(router, domains)
+        spread = {}
+        for port in placed.values():
+            spread[port] = spread.get(port, 0) + 1
+        print "domains per backend: %s" % ' '.join(str(n) for (p, n) in 
+            sorted(spread.items()))
+        check("every domain started", len(placed) == len(domains))
+        check("domains spread over every backend", 
+            len(spread) == len(backends))
+        
+        ip = cfg.get('Domains', domains[0]).split()[0]
+        check("connect routed by dom_ip", router.connect('10.9.9.9', ip))
+        check("reload sent to every backend", 
+            sorted(router.reload()) == sorted(backends))
+        check("reload_sets sent to every backend", 
+            sorted(router.reload_sets()) == sorted(backends))
+        
+        # The router copies each backend's events once it reaches it
+        end = time() + 10
+        while 0 in router.events(0, 0)['epoch'].values() and time() < end:
+            sleep(0.05)
+        batch = router.events(0, 0)
+        check("events merged from every backend", 
+            len(batch['events']) == len(domains) and 
+            sorted(batch['last']) == sorted(backends))
+        check("events resume after the merged cursor", 
+            not router.events(batch['last'], 0, batch['epoch'])['events'])
+        threading.Timer(0.3, router.stop, [domains[0]]).start()
+        start = time()
+        later = router.events(batch['last'], 5, batch['epoch'])
+        check("events long-poll wakes on a new event", 
+            len(later['events']) == 1 and time() - start < 2)
+        router.start(domains[0])
+        
+        # Polling in a loop while only one backend is busy
+        before = threads(procs[url])
+        cursor = router.events(0, 0)
+        for i in range(10):
+            router.stop(domains[0])
+            router.start(domains[0])
+            cursor = router.events(cursor['last'], 5, cursor['epoch'])
+        check("event calls leave no polls behind", 
+            threads(procs[url]) <= before)
+        
+        # Every backend pushes to the subscriber
+        pushed = []
+        sink = Server(('localhost', 0), logRequests=False)
+        sink.register_function(lambda batch: pushed.append(batch) or True,
+            'events')
+        listener = threading.Thread(target=sink.serve_forever)
+        listener.daemon = True
+        listener.start()
+        sub = 'http://localhost:%d' % sink.server_address[1]
+        drained = router.events(later['last'], 2, later['epoch'])
+        accepted = router.subscribe(sub, drained['last'], drained['epoch'])
+        check("subscribe sent to every backend", 
+            sorted(accepted) == sorted(backends) and all(accepted.values()))
+        for domain in domains:
+            router.stop(domain)
+            router.start(domain)
+        end = time() + 5
+        while sum(len(b['events']) for b in pushed) < 2 * len(domains) and \
+                time() < end:
+            sleep(0.05)
+        check("subscriber gets the events of every backend", 
+            sum(len(b['events']) for b in pushed) == 2 * len(domains))
+        check("unsubscribe sent to every backend", 
+            all(router.unsubscribe(sub).values()))
+        sink.shutdown()
+        
+        check("profile outlasts the router timeout", 
+            router.profile(domains[0], 2).startswith('profiled'))
+        try:
+            router.monitors()
+            rejected = False
+        except Exception:
+            rejected = True
+        check("unknown methods rejected", rejected)
+        
+        # Through the router and straight to a backend
+        first = connect(backends[0], 1)
+        print "status: %.0f calls/s through the router, %.0f direct" % (
+            rate(router, domains), rate(first, domains))
+        
+        # Kill the backend with the most domains and wait for health checks
+        port = max(spread, key=spread.get)
+        dead = [b for b in backends if b.endswith(':%d' % port)][0]
+        procs[dead].kill()
+        procs[dead].wait()
+        moved = [d for (d, p) in placed.items() if p == port]
+        end = time() + 10
+        while time() < end:
+            now = owners(router, moved)
+            if len(now) == len(moved) and port not in now.values():
+                break
+            sleep(0.1)
+        now = owners(router, domains)
+        check("%d domains moved off the dead backend" % len(moved), 
+            len(now) == len(domains) and port not in now.values())
+        check("domains on live backends stayed put", not [d for (d, p) in 
+            placed.items() if p != port and now.get(d) != p])
+    finally:
+        for proc in procs.values():
+            if proc.poll() is None:
+                proc.kill()
+                proc.wait()
+
+
+if __name__ == "__main__":
+
+    args = sys.argv[1:]
+    if args[:1] == ['--backend']:
+        cfg = ConfigParser()
+        cfg.read(args[1])
+        Backend(cfg).serve_forever()
+    
+    ivc = '--ivc' in args
+    if ivc:
+        args.remove('--ivc')
+    backends = args and int(args[0]) or 3
+    domains = len(args) > 1 and int(args[1]) or 30
+    
+    dirname = tempfile.mkdtemp()
+    try:
+        harness(config(backends, domains), dirname, ivc)
+    finally:
+        shutil.rmtree(dirname)
+    if check.failed:
+        print "failed: %s" % ", ".join(check.failed)
+        sys.exit(1)
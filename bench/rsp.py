@@ -0,0 +1,118 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+RSP Latency Benchmark
+
+Filename:    rsp.py
+            
+Description: Measures per-event latency of a watchpoint hit followed by a
+             20 byte digest read and a resume, once over the native RSP client
+             and once through a gdb process attached to the same stub.
+
+                python -m bench.rsp [events]
+
+"""
+import sys
+import threading
+from time import time
+from distutils.spawn import find_executable
+from util.rsp import Remote, Stub
+from util.debug import Dbg
+from util.memory import LocalMemory, START_KERNEL_MAP
+
+WATCH = START_KERNEL_MAP + 0x1000
+DIGEST = START_KERNEL_MAP + 0x2000
+
+def fire(stub, n):
+    for i in range(n):
+        stub.fire(WATCH)
+
+def report(name, samples):
+    samples.sort()
+    print "%-6s n: %d\t mean: %.1f us\t median: %.1f us\t max: %.1f us" % (
+        name, len(samples), 1e6 * sum(samples) / len(samples), 
+        1e6 * samples[len(samples) / 2], 1e6 * samples[-1])
+
+def bench_rsp(mem, n):
+    stub = Stub(mem)
+    stub.start()
+    target = Remote('127.0.0.1', stub.port)
+    target.watch(WATCH, 4)
+    target.cont()
+    threading.Thread(target=fire, args=(stub, n)).start()
+
+    samples = []
+    for i in range(n):
+        target.wait()
+        start = time()
+        target.read(DIGEST, 20)
+        target.cont()
+        samples += [time() - start]
+    target.detach()
+    return samples
+
+def bench_gdb(mem, n):
+    stub = Stub(mem)
+    stub.start()
+    dbg = Dbg()
+    dbg.cmd('set confirm off')
+    dbg.cmd('target remote 127.0.0.1:%d' % stub.port)
+    dbg.cmd('watch *(int *) %d' % WATCH)
+    dbg.cmd('continue')
+    threading.Thread(target=fire, args=(stub, n)).start()
+
+    samples = []
+    for i in range(n):
+        while 'atchpoint' not in dbg.readline():
+            pass
+        start = time()
+        dbg.cmd('x/20xb %d' % DIGEST)
+        dbg.cmd('echo bench-marker\\n')
+        while 'bench-marker' not in dbg.readline():
+            pass
+        dbg.cmd('continue')
+        samples += [time() - start]
+    dbg.cmd('detach')
+    return samples
+
+
+if __name__ == "__main__":
+    
+    n = 1000
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+
+    mem = LocalMemory(1 << 16)
+    report("rsp", bench_rsp(mem, n))
+    if find_executable('gdb') is None:
+        print "gdb   skipped: gdb not found"
+    else:
+        report("gdb", bench_gdb(mem, n))
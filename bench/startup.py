@@ -0,0 +1,141 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Startup Benchmark
+
+Filename:    startup.py
+            
+Description: Times a cold start of the client, the monitor server and the 
+             router in a fresh interpreter each run, up to the point where 
+             they would connect or serve, and fails if the median time over a
+             bare interpreter is over budget.  Budgets are in milliseconds.
+             Bindings that are not installed here, such as libvirt, are 
+             replaced by empty stand-ins so only our own import cost is 
+             measured.
+
+                python -m bench.startup [runs] [client] [server]
+
+"""
+import os
+import sys
+import shutil
+import tempfile
+import subprocess
+from time import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Milliseconds over a bare interpreter
+CLIENT_BUDGET = 40
+SERVER_BUDGET = 150
+
+# Stand-ins for bindings the server imports, as path: source
+STUBS = {
+    'libvirt': ('libvirt.py', 
+        'class libvirtError(Exception): pass\n'
+        'def open(uri): raise libvirtError("libvirt stand-in")\n'),
+    'lxml': ('lxml/__init__.py', ''),
+    }
+
+ENV = dict(os.environ)
+
+def stub(dirname):
+    """ Writes stand-ins for the missing STUBS under @dirname and returns 
+        their names """
+    
+    missing = []
+    for (name, (path, source)) in sorted(STUBS.items()):
+        try:
+            __import__(name)
+        except ImportError:
+            path = os.path.join(dirname, path)
+            if not os.path.isdir(os.path.dirname(path)):
+                os.makedirs(os.path.dirname(path))
+            open(path, 'w').write(source)
+            missing.append(name)
+    return missing
+
+def start(args):
+    """ Returns the seconds a new interpreter takes to run @args """
+    
+    null = open(os.devnull, 'w')
+    begin = time()
+    subprocess.check_call([sys.executable] + args, cwd=ROOT, stdout=null, 
+        env=ENV)
+    return time() - begin
+
+def median(args, runs):
+    # The first run compiles anything stale and is not counted
+    start(args)
+    times = sorted(start(args) for i in range(runs))
+    return times[runs / 2]
+
+if __name__ == "__main__":
+
+    runs = len(sys.argv) > 1 and int(sys.argv[1]) or 21
+    budgets = {
+        'client': len(sys.argv) > 2 and float(sys.argv[2]) or CLIENT_BUDGET,
+        'server': len(sys.argv) > 3 and float(sys.argv[3]) or SERVER_BUDGET,
+        }
+
+    # client.py without a command prints its usage without connecting
+    cases = [
+        ('client', 'client', ['client.py']),
+        ('server', 'server', ['-c', 'from util import config, vmctl']),
+        ('router', 'server', ['-c', 'from util import router']),
+        ]
+
+    dirname = tempfile.mkdtemp()
+    try:
+        missing = stub(dirname)
+        if missing:
+            print "stand-ins: %s" % ", ".join(missing)
+            ENV['PYTHONPATH'] = os.pathsep.join([dirname] + 
+                filter(None, [os.environ.get('PYTHONPATH')]))
+
+        # The bare run sees the same path, so only the imports are counted
+        bare = median(['-c', 'pass'], runs)
+        print "%-8s %7.1f ms" % ('python', 1e3 * bare)
+
+        failed = []
+        for (name, budget, args) in cases:
+            over = 1e3 * (median(args, runs) - bare)
+            ok = over <= budgets[budget]
+            print "%-8s %+7.1f ms  budget %.0f ms  %s" % (name, over, 
+                budgets[budget], ok and "ok" or "OVER")
+            if not ok:
+                failed.append(name)
+    finally:
+        shutil.rmtree(dirname)
+
+    if failed:
+        print "over budget: %s" % ", ".join(failed)
+        sys.exit(1)
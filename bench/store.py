@@ -0,0 +1,155 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Shared Measurement Store Benchmark
+
+Filename:    store.py
+            
+Description: Starts domains that all boot the same kernel and initrd at 
+             once, each hashing both images from a thread of its own, first 
+             the way Hash did on its own and then through the shared store,
+             and reports the time until every domain has its measurements 
+             and the bytes hashed.  A second start through the store finds
+             the measurements in it.  Then times the static check of every 
+             domain against a set of criteria, calling Hash.Check and with
+             verdicts memoized the way Monitor.check does.
+
+                python -m bench.store [domains] [kernel MB] [initrd MB]
+
+"""
+import os
+import sys
+import shutil
+import tempfile
+import threading
+from time import time
+from hashlib import sha1
+from ConfigParser import ConfigParser
+from util import timing
+from util.mods import Hash
+from util.store import Store
+from util.monitor import fingerprint, measured
+
+def alone(path):
+    """ Hash's measurement before the store """
+    return sha1(open(path, 'rb').read()).hexdigest()
+
+def start(domains, images, measure):
+    """ Measures @images from a thread per domain and returns the seconds
+    until all are done and the digests of the first domain """
+    
+    results = [{} for i in range(domains)]
+    def domain(res):
+        for (k, path) in images.items():
+            res[k] = measure(path)
+    threads = [threading.Thread(target=domain, args=(res,)) 
+        for res in results]
+    begin = time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    for res in results[1:]:
+        if res != results[0]:
+            raise Exception("Domains measured different digests")
+    return (time() - begin, results[0])
+
+def criteria(hashes, n):
+    """ Returns @n criteria, half of which expect @hashes """
+    
+    res = []
+    for i in range(n):
+        crt = ConfigParser()
+        crt.add_section(Hash.name)
+        for (k, v) in hashes.items():
+            crt.set(Hash.name, k, i % 2 and v or sha1(str(i)).hexdigest())
+        res.append(crt)
+    return res
+
+def checks(modules, crts, memo):
+    """ Checks @crts, which are (fingerprint, criteria), on every module """
+    
+    begin = time()
+    for m in modules:
+        digest = measured(m)
+        for (key, crt) in crts:
+            if memo:
+                m.store.verdict((m.name, digest, key), lambda: m.Check(crt))
+            else:
+                m.Check(crt)
+    return time() - begin
+
+
+if __name__ == "__main__":
+
+    timing.disable = True
+    domains = len(sys.argv) > 1 and int(sys.argv[1]) or 8
+    kernel = len(sys.argv) > 2 and int(sys.argv[2]) or 32
+    initrd = len(sys.argv) > 3 and int(sys.argv[3]) or 16
+    
+    tmp = tempfile.mkdtemp()
+    try:
+        images = {}
+        for (k, mb) in [('kernel', kernel), ('initrd', initrd)]:
+            images[k] = os.path.join(tmp, k)
+            f = open(images[k], 'wb')
+            for i in range(mb):
+                f.write(os.urandom(1 << 20))
+            f.close()
+        size = (kernel + initrd) << 20
+        print "%d domains, %d MB kernel, %d MB initrd" % (domains, kernel, 
+            initrd)
+        
+        (took, expected) = start(domains, images, alone)
+        print "alone   %.3f s  %5d MB hashed" % (took, 
+            domains * size >> 20)
+        
+        store = Store()
+        for run in ['store', 'warm']:
+            read = store.read
+            (took, hashes) = start(domains, images, store.measure)
+            if hashes != expected:
+                raise Exception("The store measured different digests")
+            print "%-7s %.3f s  %5d MB hashed  %s" % (run, took, 
+                (store.read - read) >> 20, store.stats())
+
+        modules = []
+        for i in range(domains):
+            m = Hash(None, None)
+            m.hashes = dict(hashes)
+            modules.append(m)
+        crts = [(fingerprint(crt), crt) for crt in criteria(hashes, 200)]
+        n = domains * len(crts)
+        print "check   %.1f us Hash.Check  %.1f us memoized  (%d checks)" % (
+            1e6 * checks(modules, crts, False) / n, 
+            1e6 * checks(modules, crts, True) / n, n)
+    finally:
+        shutil.rmtree(tmp)
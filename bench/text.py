@@ -0,0 +1,175 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Kernel Text Integrity Benchmark
+
+Filename:    text.py
+            
+Description: Measures the Kernel_Text module on a synthetic kernel image in
+             this process's memory.  Reports the throughput of a full sweep 
+             for several read sizes, through /proc/<pid>/mem and through an 
+             RSP stub (which halts the VM while it reads), against reading a
+             word at a time the way gdb's x command does.  Then rehashes in 
+             the background under a CPU budget and reports the CPU used, the
+             time the VM was halted, and how long a modified page took to be
+             noticed.
+
+                python -m bench.text [text MB] [seconds]
+
+"""
+import os
+import sys
+import random
+import threading
+from time import time, sleep
+from ConfigParser import ConfigParser
+from util import timing
+from util.mods import Kernel_Text
+from util.memory import LocalMemory, START_KERNEL_MAP
+from util.rsp import Stub, Remote
+
+# The image starts 16MB into guest RAM
+BASE = START_KERNEL_MAP + (16 << 20)
+
+class Watcher():
+    """ Runs halted actions right away and records when triggered """
+    
+    def __init__(self):
+        self.triggered = []
+
+    def schedule(self, action, wake):
+        action()
+
+    def trigger(self, name):
+        self.triggered.append(time())
+
+
+def image(mb):
+    """ Returns guest RAM holding a kernel with @mb of text and half that of
+    rodata, and its symbol table """
+    
+    text = mb << 20
+    rodata = text / 2
+    mem = LocalMemory((16 << 20) + text + rodata + (1 << 20))
+    mem.write(BASE, os.urandom(text + rodata))
+    syms = {'stext': BASE, 'etext': BASE + text, 
+        'start_rodata': BASE + text, 'end_rodata': BASE + text + rodata}
+    return (mem, syms)
+
+def module(mem, syms, **opts):
+    cfg = ConfigParser()
+    cfg.add_section(Kernel_Text.name)
+    for (k, v) in opts.items():
+        cfg.set(Kernel_Text.name, k, str(v))
+    m = Kernel_Text(cfg)
+    (m.mem, m.syms, m.watcher) = (mem, syms, Watcher())
+    return m
+
+def remote(mem):
+    stub = Stub(mem)
+    stub.start()
+    return Remote('127.0.0.1', stub.port)
+
+def sweep(name, mem, syms, chunk):
+    m = module(mem, syms, chunk=chunk, period=3600)
+    m.Initialize(None)
+    print "%-5s %8d B reads  %7.1f MB/s  sweep %.3f s  halted %.3f s" % (
+        name, chunk, m.Stats()['rate'], m.last, m.paused)
+    return m.root
+
+def words(name, mem, syms, size=256 << 10):
+    """ Reads @size bytes 8 at a time """
+    
+    start = time()
+    for vaddr in range(syms['stext'], syms['stext'] + size, 8):
+        mem.read(vaddr, 8)
+    rate = size / (time() - start) / (1 << 20)
+    print "%-5s %8d B reads  %7.1f MB/s  sweep %.1f s (estimated)" % (name,
+        8, rate, (syms['end_rodata'] - syms['stext']) / (1 << 20) / rate)
+
+def background(name, mem, syms, budget, chunk, seconds, local):
+    """ Rehashes for @seconds, modifying a page halfway """
+    
+    m = module(mem, syms, budget=budget, chunk=chunk, period=0, slice=0.01)
+    m.Initialize(None)
+    (paused, m.longest) = (m.paused, 0)
+    before = os.times()
+    start = time()
+    sleep(seconds / 2.0)
+    
+    page = random.randrange(len(m.leaves))
+    vaddr = syms['stext'] + page * m.page
+    old = local.read(vaddr, 8)
+    local.write(vaddr, '\xcc' * 8)
+    modified = time()
+    sleep(seconds / 2.0)
+    local.write(vaddr, old)
+    m.rehashing = False
+    
+    after = os.times()
+    wall = time() - start
+    cpu = (after[0] - before[0]) + (after[1] - before[1])
+    found = [t - modified for t in m.watcher.triggered]
+    print "%-5s budget %.2f  %7d B reads  cpu %.3f  halted %.3f  longest " \
+        "%.3f s  %.2f sweeps/s  modified page found in %s" % (name, budget,
+        chunk, cpu / wall, (m.paused - paused) / wall, m.longest, 
+        (m.sweeps - 1) / wall, found and "%.3f s" % found[0] or "-")
+    
+    # Let the rehashing thread finish its slice
+    sleep(0.5)
+
+
+if __name__ == "__main__":
+
+    timing.disable = True
+    mb = len(sys.argv) > 1 and int(sys.argv[1]) or 8
+    seconds = len(sys.argv) > 2 and float(sys.argv[2]) or 4.0
+    
+    (mem, syms) = image(mb)
+    rsp = remote(mem)
+    print "%d MB text, %d MB rodata" % (mb, mb / 2)
+    
+    roots = set()
+    for chunk in [4096, 65536, 1 << 20]:
+        roots.add(sweep("mem", mem, syms, chunk))
+    for chunk in [4096, 65536, 1 << 20]:
+        roots.add(sweep("rsp", rsp, syms, chunk))
+    words("rsp", rsp, syms)
+    if len(roots) != 1:
+        raise Exception("Sweeps disagree on the root")
+    
+    for budget in [0.05, 0.25]:
+        background("mem", mem, syms, budget, 1 << 20, seconds, mem)
+    
+    # The stub runs in this process, so its CPU is counted too
+    for chunk in [4096, 65536]:
+        background("rsp", rsp, syms, 0.05, chunk, seconds, mem)
+    rsp.detach()
@@ -0,0 +1,98 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+XML-RPC Transport Benchmark
+
+Filename:    transport.py
+            
+Description: Measures XML-RPC calls per second against a local server, with
+             the default transport and a single threaded HTTP/1.0 server as 
+             before, and with the pooled keep-alive transport and threaded
+             HTTP/1.1 server.  Each is run from one thread and from several.
+
+                python -m bench.transport [calls] [threads]
+
+"""
+import sys
+import threading
+import xmlrpclib
+from time import time
+from SimpleXMLRPCServer import SimpleXMLRPCServer
+from util.server import Server
+from util.transport import PooledTransport, connect
+
+def serve(server):
+    server.register_function(lambda src, dst: True, 'connect')
+    t = threading.Thread(target=server.serve_forever)
+    t.daemon = True
+    t.start()
+    return 'http://127.0.0.1:%d' % server.server_address[1]
+
+def calls(proxy, n):
+    for i in range(n):
+        proxy.connect('10.0.0.1', '192.168.122.10')
+
+def run(proxies, n):
+    """ Returns calls per second of @n calls spread over @proxies """
+    
+    threads = [threading.Thread(target=calls, args=(p, n / len(proxies)))
+        for p in proxies]
+    start = time()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return n / (time() - start)
+
+def report(name, rate):
+    print "%-24s %8.0f calls/s" % (name, rate)
+
+
+if __name__ == "__main__":
+    
+    n = 5000
+    if len(sys.argv) > 1:
+        n = int(sys.argv[1])
+    threads = 8
+    if len(sys.argv) > 2:
+        threads = int(sys.argv[2])
+
+    url = serve(SimpleXMLRPCServer(('127.0.0.1', 0), logRequests=False))
+    report("default, 1 thread", run([xmlrpclib.ServerProxy(url)], n))
+    report("default, %d threads" % threads, run([xmlrpclib.ServerProxy(url)
+        for i in range(threads)], n))
+    
+    url = serve(Server(('127.0.0.1', 0), logRequests=False))
+    report("pooled, 1 thread", run([connect(url)], n))
+    transport = PooledTransport(threads)
+    report("pooled, %d threads" % threads, run([connect(url, 
+        transport=transport) for i in range(threads)], n))
+    print "connections opened, reused: %s" % transport.stats()
@@ -29,33 +29,61 @@
 
 
 #!/usr/bin/env python
-from xmlrpclib import ServerProxy
+import sys
+from util.transport import connect
+
+URL = 'http://localhost:9001'
+COMMANDS = ['start', 'stop', 'force_stop', 'status', 'detach']
+
+usage = """client [start|stop|force_stop|status|detach] [domain]
+client -	(one "command domain" per line from stdin)"""
+
+c = None
 
 def pxy():
-	return  ServerProxy('http://localhost:9001')
+	""" Returns the server session, which is opened on first use """
+	global c
+	if c is None:
+		c = connect(URL, 1)
+	return c
 
-c = pxy()
-ctab = {}
-ctab['start'] = c.start
-ctab['stop'] = c.stop
-ctab['force_stop'] = c.force_stop
-ctab['status'] = c.status
-ctab['detach'] = c.detach
+def call(cmd, dom):
+	if cmd not in COMMANDS:
+		return usage
+	return getattr(pxy(), cmd)(dom)
 
-if __name__ == "__main__":
-	import sys
+def batch(stream, prompt=False):
+	""" Runs commands read from @stream over one keep-alive connection """
 
-	usage =  "client [start|stop|force_stop|status|detach] [domain]"
+	while True:
+		if prompt:
+			sys.stdout.write('> ')
+			sys.stdout.flush()
+		line = stream.readline()
+		if not line:
+			break
+		args = line.split()
+		if not args or args[0].startswith('#'):
+			continue
+		if len(args) < 2:
+			print usage
+			continue
+		try:
+			print call(args[0], args[1].strip())
+		except Exception as e:
+			# Report the failure and go on with the next command
+			print e
+		sys.stdout.flush()
 
+if __name__ == "__main__":
+
+	if len(sys.argv) == 2 and sys.argv[1] == '-':
+		batch(sys.stdin, sys.stdin.isatty())
+		exit()
 
 	if len(sys.argv) < 3:
 		print	usage
 		exit()
 
-	dom = sys.argv[2].strip()
-	cmd = ctab.get(sys.argv[1], None)
-	if cmd is None:
-		print usage
-	else:
-		print cmd(dom)
+	print call(sys.argv[1], sys.argv[2].strip())
 	exit()
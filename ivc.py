@@ -49,18 +49,41 @@ Description: VM Integrity Monitor for Integrity Verified Channels (IVC) project.
 
 """
 
-import subprocess
-from util import *
+import sys
+import signal
+import threading
 from ConfigParser import ConfigParser
 CONF_FILE = "cfg/monitor.cfg"
 
 
 if __name__ == "__main__":
 
-    cfg = ConfigParser()
-    cfg.read(CONF_FILE)
+    # ivc.py [--router] [config]
+    args = sys.argv[1:]
+    routed = '--router' in args
+    if routed:
+        args.remove('--router')
     
-    server = vmctl.VMServer(cfg)
+    path = args and args[0] or CONF_FILE
+    
+    # Only import the side being started; the monitor pulls in libvirt,
+    # which the router does not need.
+    if routed:
+        from util import router
+        cfg = ConfigParser()
+        cfg.read(path)
+        server = router.Router(cfg)
+    else:
+        from util import config, vmctl
+        server = vmctl.VMServer(config.load(path))
+        
+        # SIGHUP reloads the config like the reload call.  Reload in another
+        # thread so the handler does not wait on a request in progress.
+        def reload():
+            with server.lock:
+                print server.export_reload()
+        signal.signal(signal.SIGHUP, 
+            lambda signum, frame: threading.Thread(target=reload).start())
     server.register_introspection_functions()
     try:
         server.serve_forever()
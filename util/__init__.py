@@ -28,4 +28,4 @@
 
 
 
-__all__ = ["debug", "monitor", "vmctl", "mods"]
\ No newline at end of file
+__all__ = ["debug", "monitor", "vmctl", "mods", "router", "config"]
\ No newline at end of file
@@ -0,0 +1,327 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Measurement and Verdict Audit Log
+
+Filename:    audit.py
+            
+Description: Append-only binary log, one file per domain, of every 
+             measurement a module records and every admission, rejection,
+             release and revocation of a client.  Records are 64 bytes.
+             Appending only packs and queues a record; a single background
+             writer writes the queued records of every log and makes them
+             durable together with one fsync per log ("group commit") once
+             @size bytes are waiting or the oldest has waited @interval 
+             seconds.  Records dropped because the queue was full leave a
+             GAP record in their place.
+
+                python -m util.audit <log> [-f] [-k kind] [-c client] 
+                    [-s first:last] [-t since]
+
+             -s keeps the sequence numbers from first to last, either of
+             which may be left out, and -t the records written at or after
+             time since, in seconds since the epoch.
+
+"""
+import os
+import sys
+import zlib
+import socket
+import struct
+import threading
+import traceback
+from time import time, sleep, strftime, localtime
+from getopt import gnu_getopt
+
+MAGIC = 'IVPAUDIT'
+
+# Record kinds
+MEASUREMENT = 1
+ADMIT = 2
+REJECT = 3
+RELEASE = 4
+REVOKE = 5
+GAP = 255
+KINDS = {MEASUREMENT: 'measurement', ADMIT: 'admit', REJECT: 'reject',
+    RELEASE: 'release', REVOKE: 'revoke', GAP: 'gap'}
+
+# Time, kind, sequence number, digest (a measurement or a criteria 
+# fingerprint) and client address, behind a CRC32 of all of them
+BODY = struct.Struct('<dB3xQ20s16s4x')
+CRC = struct.Struct('<I')
+RECORD = CRC.size + BODY.size
+HEADER = MAGIC + '\0' * (RECORD - len(MAGIC))
+
+def pack_addr(ip):
+    """ Packs a client address into 16 bytes; IPv4 is IPv4-mapped """
+    
+    if not ip:
+        return '\0' * 16
+    if ':' in ip:
+        return socket.inet_pton(socket.AF_INET6, ip)
+    return '\0' * 10 + '\xff\xff' + socket.inet_pton(socket.AF_INET, ip)
+
+def unpack_addr(addr):
+    if addr == '\0' * 16:
+        return ''
+    if addr[:12] == '\0' * 10 + '\xff\xff':
+        return socket.inet_ntop(socket.AF_INET, addr[12:])
+    return socket.inet_ntop(socket.AF_INET6, addr)
+
+def pack(kind, seq=0, digest='', ip=None, stamp=None):
+    """ Returns a record.  @digest is hex, as modules and monitors keep 
+    measurements and fingerprints. """
+    
+    body = BODY.pack(stamp or time(), kind, seq, 
+        digest.decode('hex')[:20], pack_addr(ip))
+    return CRC.pack(zlib.crc32(body) & 0xffffffff) + body
+
+def unpack(record):
+    """ Returns (time, kind, seq, digest, ip) of a record, or None if its
+    checksum does not match """
+    
+    body = record[CRC.size:]
+    if CRC.unpack(record[:CRC.size])[0] != zlib.crc32(body) & 0xffffffff:
+        return None
+    (stamp, kind, seq, digest, addr) = BODY.unpack(body)
+    return (stamp, kind, seq, digest.encode('hex'), unpack_addr(addr))
+
+
+class Log():
+    """ Audit log of one domain 
+    
+    Records are queued in memory until the writer takes them.  At most
+    @limit records wait; further ones are counted as dropped.
+    """
+
+    def __init__(self, writer, path, limit=1000000):
+        self.writer = writer
+        self.path = path
+        self.limit = limit
+        self.fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0600)
+        size = os.fstat(self.fd).st_size
+        if size == 0:
+            os.write(self.fd, HEADER)
+        elif size % RECORD:
+            # Drop a record torn by a crash so the next ones stay aligned
+            os.ftruncate(self.fd, size - size % RECORD)
+        self.lock = threading.Lock()
+        self.writing = threading.Lock()
+        self.queue = []
+        self.first = None   # Time the oldest queued record was appended
+        self.dropped = 0
+        self.appended = 0
+        self.durable = 0    # Records appended that are on disk
+
+    def append(self, kind, seq=0, digest='', ip=None):
+        """ Queues a record.  Never waits for the disk. """
+        
+        record = pack(kind, seq, digest, ip)
+        with self.lock:
+            if len(self.queue) >= self.limit:
+                self.dropped += 1
+                return
+            if not self.queue:
+                self.first = time()
+            self.queue.append(record)
+            self.appended += 1
+            full = len(self.queue) * RECORD >= self.writer.size
+        if full:
+            self.writer.wake.set()
+
+    def measurement(self, seq, digest):
+        self.append(MEASUREMENT, seq, digest)
+
+    def verdict(self, kind, key, ip):
+        self.append(kind, 0, key, ip)
+
+    def take(self):
+        """ Returns the queued records and when the oldest was queued, with
+        a GAP record for any that were dropped """
+        
+        with self.lock:
+            (queue, self.queue) = (self.queue, [])
+            (first, self.first) = (self.first, None)
+            (dropped, self.dropped) = (self.dropped, 0)
+        if dropped:
+            queue.append(pack(GAP, dropped))
+        return (queue, first)
+
+    def close(self):
+        self.writer.remove(self)
+        with self.writing:
+            os.close(self.fd)
+            self.fd = None
+
+    def stats(self):
+        first = self.first
+        return {'appended': self.appended, 'durable': self.durable, 
+            'lag': first and time() - first or 0}
+
+
+class Writer(threading.Thread):
+    """ Writes and syncs the queued records of every log """
+
+    def __init__(self, interval=0.05, size=1 << 20):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.interval = interval
+        self.size = size
+        self.logs = []
+        self.lock = threading.Lock()
+        self.wake = threading.Event()
+        self.synced = threading.Condition()
+        self.commits = 0
+        self.max_lag = 0
+
+    def open(self, path, limit=1000000):
+        log = Log(self, path, limit)
+        with self.lock:
+            self.logs.append(log)
+        return log
+
+    def remove(self, log):
+        with self.lock:
+            if log in self.logs:
+                self.logs.remove(log)
+        self.commit([log])
+
+    def commit(self, logs=None):
+        """ Writes out and syncs the queued records of @logs """
+        
+        with self.lock:
+            logs = logs or list(self.logs)
+        for log in logs:
+            with log.writing:
+                if log.fd is None:
+                    continue
+                (queue, first) = log.take()
+                if not queue:
+                    continue
+                count = len(queue)
+                try:
+                    os.write(log.fd, ''.join(queue))
+                    os.fsync(log.fd)
+                except OSError:
+                    # Leave a gap rather than lose records silently
+                    with log.lock:
+                        log.dropped += count
+                    raise
+            
+            now = time()
+            self.max_lag = max(self.max_lag, now - first)
+            with self.synced:
+                log.durable += count
+                self.commits += 1
+                self.synced.notify_all()
+
+    def run(self):
+        while True:
+            # Sleep until the interval is up or a log fills a batch
+            self.wake.wait(self.interval)
+            self.wake.clear()
+            try:
+                self.commit()
+            except Exception:
+                traceback.print_exc()
+
+    def flush(self, log):
+        """ Waits until everything appended to @log so far is on disk """
+        
+        target = log.appended
+        self.wake.set()
+        with self.synced:
+            while log.durable < target:
+                self.synced.wait(self.interval)
+                self.wake.set()
+
+
+def read(path, follow=False):
+    """ Yields the records of the log at @path.  Stops at a torn or corrupt
+    record, or with @follow waits for more to be written. """
+    
+    f = open(path, 'rb')
+    if f.read(RECORD)[:len(MAGIC)] != MAGIC:
+        raise Exception("%s is not an audit log" % path)
+    while True:
+        pos = f.tell()
+        data = f.read(RECORD)
+        if len(data) < RECORD:
+            if not follow:
+                return
+            f.seek(pos)
+            sleep(0.2)
+            continue
+        record = unpack(data)
+        if record is None:
+            raise Exception("Corrupt audit record at offset %d" % pos)
+        yield record
+
+def show(record):
+    (stamp, kind, seq, digest, ip) = record
+    return "%s.%03d %-11s %8d %s %s" % (strftime('%Y-%m-%d %H:%M:%S', 
+        localtime(stamp)), int(stamp * 1000) % 1000, KINDS.get(kind, kind),
+        seq, digest, ip)
+
+
+if __name__ == "__main__":
+    
+    (opts, args) = gnu_getopt(sys.argv[1:], 'fk:c:s:t:')
+    if len(args) != 1:
+        print "audit <log> [-f] [-k kind] [-c client] [-s first:last] " \
+            "[-t since]"
+        exit()
+    opts = dict(opts)
+    kinds = dict((v, k) for (k, v) in KINDS.items())
+    kind = opts.get('-k', None) and kinds[opts['-k']]
+    since = float(opts.get('-t', 0))
+    
+    # A lone sequence number keeps just that record
+    (first, last) = (0, None)
+    if '-s' in opts:
+        bounds = opts['-s'].split(':')
+        first = int(bounds[0] or 0)
+        if bounds[-1]:
+            last = int(bounds[-1])
+    
+    try:
+        for record in read(args[0], '-f' in opts):
+            if kind is not None and record[1] != kind:
+                continue
+            if '-c' in opts and record[4] != opts['-c']:
+                continue
+            if record[0] < since:
+                continue
+            if record[2] < first or (last is not None and record[2] > last):
+                continue
+            print show(record)
+    except (KeyboardInterrupt, IOError):
+        pass
@@ -0,0 +1,229 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Client Rules
+
+Filename:    clients.py
+            
+Description: Maps client addresses to criteria files by longest prefix match
+             over the rules in the [Clients] section.  A rule's option is an
+             address or CIDR prefix and its value a criteria file:
+
+                 127.0.0.1: cfg/client.crt
+                 10.0.0.0/8: cfg/tenant.crt
+
+             ConfigParser options cannot hold a ':', so IPv6 rules, and any
+             others, may instead give the prefix in the value after a label:
+
+                 tenant6: 2001:db8::/32 cfg/tenant.crt
+
+"""
+import socket
+import struct
+import binascii
+
+# Misses remembered before the cache is cleared
+MISSES = 65536
+
+def parse(addr):
+    """ Returns the address family's bit length and integer value of @addr """
+    
+    if ':' in addr:
+        packed = socket.inet_pton(socket.AF_INET6, addr)
+        return (128, int(binascii.hexlify(packed), 16))
+    return (32, struct.unpack('!I', socket.inet_pton(socket.AF_INET, addr))[0])
+
+
+class Trie():
+    """ Binary trie of prefixes.  Nodes are [zero, one, value] lists. """
+    
+    def __init__(self, bits):
+        self.bits = bits
+        self.root = [None, None, None]
+        self.size = 0
+
+    def insert(self, addr, length, value):
+        node = self.root
+        for i in xrange(self.bits - 1, self.bits - length - 1, -1):
+            bit = (addr >> i) & 1
+            if node[bit] is None:
+                node[bit] = [None, None, None]
+            node = node[bit]
+        if node[2] is None:
+            self.size += 1
+        node[2] = value
+
+    def lookup(self, addr):
+        """ Returns the value of the longest prefix of @addr, or None """
+        
+        node = self.root
+        best = node[2]
+        for i in xrange(self.bits - 1, -1, -1):
+            node = node[(addr >> i) & 1]
+            if node is None:
+                break
+            if node[2] is not None:
+                best = node[2]
+        return best
+
+
+class Rules():
+    """ Compiled [Clients] section """
+    
+    def __init__(self, cfg):
+        self.tries = {32: Trie(32), 128: Trie(128)}
+        self.misses = {}
+        if cfg.has_section('Clients'):
+            for (key, value) in cfg.items('Clients'):
+                self.add(key, value)
+
+    def add(self, key, value):
+        fields = value.split()
+        if len(fields) == 2:
+            (prefix, crt) = fields
+        else:
+            (prefix, crt) = (key, value.strip())
+        
+        try:
+            (addr, length) = (prefix.split('/') + [None])[:2]
+            (bits, addr) = parse(addr)
+            length = length is None and bits or int(length)
+            if not 0 <= length <= bits:
+                raise ValueError(length)
+        except (socket.error, ValueError):
+            raise Exception("Bad client rule %s: %s" % (key, value))
+        
+        # Keep only the prefix bits
+        addr &= ~((1 << (bits - length)) - 1)
+        self.tries[bits].insert(addr, length, crt)
+        self.misses.clear()
+
+    def lookup(self, ip):
+        """ Returns the criteria file for client @ip, or None """
+        
+        if ip in self.misses:
+            return None
+        try:
+            (bits, addr) = parse(ip)
+        except socket.error:
+            return None
+        crt = self.tries[bits].lookup(addr)
+        if crt is None:
+            if len(self.misses) >= MISSES:
+                self.misses.clear()
+            self.misses[ip] = True
+        return crt
+
+    def __len__(self):
+        return sum(t.size for t in self.tries.values())
+
+
+class Registry():
+    """ Clients admitted under each criteria of a monitor 
+    
+    Each client is under one criteria, and counts its connections so it
+    stays admitted until its last one ends.  Adding, removing and revoking
+    clients takes constant time per client.
+    """
+
+    def __init__(self):
+        self.members = {}   # Criteria fingerprint to set of client IPs
+        self.index = {}     # Client IP to criteria fingerprint
+        self.refs = {}      # Client IP to open connections
+
+    def add(self, key, ip):
+        """ Counts a connection of @ip under criteria @key.  Returns whether
+        the client is new to the criteria. """
+        
+        old = self.index.get(ip, None)
+        if old == key:
+            self.refs[ip] += 1
+            return False
+        if old is not None:
+            # The client's rule changed criteria
+            self.discard(ip)
+        self.members.setdefault(key, set()).add(ip)
+        self.index[ip] = key
+        self.refs[ip] = 1
+        return True
+
+    def remove(self, ip):
+        """ Ends a connection of @ip.  Returns the client's criteria, or None
+        if it had none, and whether it has connections left. """
+        
+        key = self.index.get(ip, None)
+        if key is None:
+            return (None, False)
+        self.refs[ip] -= 1
+        if self.refs[ip] > 0:
+            return (key, True)
+        self.discard(ip)
+        return (key, False)
+
+    def discard(self, ip):
+        key = self.index.pop(ip)
+        self.refs.pop(ip)
+        self.members[key].discard(ip)
+        if not self.members[key]:
+            del self.members[key]
+
+    def revoke(self, key):
+        """ Drops every client of criteria @key and returns their IPs """
+        
+        ips = list(self.members.pop(key, []))
+        for ip in ips:
+            del self.index[ip]
+            del self.refs[ip]
+        return ips
+
+    def has(self, key):
+        return key in self.members
+
+    def criteria(self, ip):
+        return self.index.get(ip, None)
+
+    def items(self):
+        return [(key, sorted(ips)) for (key, ips) in self.members.items()]
+
+    def save(self):
+        return dict((key, [(ip, self.refs[ip]) for ip in ips]) 
+            for (key, ips) in self.members.items())
+
+    def restore(self, key, clients):
+        """ Restores the clients of @key returned by save.  Journals from 
+        before connections were counted list bare IPs. """
+        
+        for client in clients:
+            if isinstance(client, basestring):
+                client = (client, 1)
+            (ip, refs) = client
+            self.add(key, ip)
+            self.refs[ip] = refs
@@ -0,0 +1,101 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Compiled Configuration
+
+Filename:    config.py
+            
+Description: Parses the monitor configuration once into a Snapshot of typed
+             values and lookup tables, so requests and watchers do not query
+             and split ConfigParser strings.  Snapshots are never changed
+             after they are built; a reload builds a new one and swaps it in.
+             Options that modules read for themselves stay in the snapshot's
+             ConfigParser.
+
+"""
+from time import time
+from ConfigParser import ConfigParser
+from util.clients import Rules
+
+class Domain():
+    """ A domain's entry in [Domains]: its IP and gdbstub port """
+    
+    def __init__(self, name, value):
+        fields = value.split()
+        self.name = name
+        self.ip = fields[0]
+        self.port = len(fields) > 1 and fields[1] or None
+
+
+def domains(cfg):
+    """ Returns the Domains of @cfg by name, and the name of the domain at
+    each IP """
+    
+    (domains, ip_to_dom) = ({}, {})
+    for (name, value) in cfg.items('Domains'):
+        domains[name] = Domain(name, value)
+        ip_to_dom[domains[name].ip] = name
+    return (domains, ip_to_dom)
+
+
+class Snapshot():
+    """ Compiled view of a monitor config """
+
+    def __init__(self, cfg, path=None):
+        self.cfg = cfg
+        self.path = path
+        self.loaded = time()
+        
+        (self.domains, self.ip_to_dom) = domains(cfg)
+        self.rules = Rules(cfg)
+        
+        self.static = cfg.get('Monitor', 'static').split()
+        self.dynamic = cfg.get('Monitor', 'dynamic').split()
+        self.pause = cfg.getint('Monitor', 'pause')
+        self.coalesce = {}
+        for (opt, key, kind) in [('coalesce_window', 'window', float),
+                ('coalesce_events', 'events', int), 
+                ('coalesce_stale', 'stale', float)]:
+            if cfg.has_option('Monitor', opt):
+                self.coalesce[key] = kind(cfg.get('Monitor', opt))
+        
+        self.backend = 'gdb'
+        if cfg.has_option('Watcher', 'backend'):
+            self.backend = cfg.get('Watcher', 'backend')
+
+
+def load(path):
+    """ Reads and compiles the config at @path """
+    
+    cfg = ConfigParser()
+    if not cfg.read(path):
+        raise Exception("Cannot read config %s" % path)
+    return Snapshot(cfg, path)
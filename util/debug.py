@@ -41,52 +41,133 @@ import select
 from subprocess import *
 from util.timing import timecall
 from threading import Lock
+from collections import deque
 from time import *
 import sys
 import os
+import errno
+import fcntl
+import signal
 #from timer import getticks
 
+class TraceMarker():
+    """ Batched ftrace marker sink 
+    
+    Records a timestamp for each stop event and writes them to the ftrace
+    marker file @batch at a time, so tracing costs one write per batch
+    instead of one per gdb output line.
+    """
+    
+    path = '/sys/kernel/debug/tracing/trace_marker'
+
+    def __init__(self, path=None, batch=32):
+        self.fd = os.open(path or self.path, os.O_WRONLY)
+        self.batch = batch
+        self.marks = []
+
+    def mark(self, label):
+        self.marks += ['%s@%.6f' % (label, time())]
+        if len(self.marks) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if not self.marks:
+            return
+        try:
+            os.write(self.fd, 'gdb-marker ' + ' '.join(self.marks))
+        except OSError:
+            pass
+        self.marks = []
+
+
 class Dbg():
     """ GDB Interactive Terminal Wrapper """
     
     proc = None
-    marker_fd = None
+    command = 'gdb'
+
+    # Bytes to ask for per read of gdb's output
+    chunk = 65536
     
-    def __init__(self, args='-q'):
-        """ Spawns a new GDB process with @args """
+    def __init__(self, args='-q', sink=None):
+        """ Spawns a new GDB process with @args.  Stop events are reported to
+        @sink (e.g. a TraceMarker) if one is given. """
         
-        self.proc = Popen("gdb " + args, shell=True, stdin=PIPE, stdout=PIPE)
+        self.proc = Popen(self.command + " " + args, shell=True, stdin=PIPE, 
+            stdout=PIPE)
+        self.sink = sink
+
+        # Read gdb's output in large non-blocking chunks and hand out lines 
+        # from the buffer
+        self.fd = self.proc.stdout.fileno()
+        fcntl.fcntl(self.fd, fcntl.F_SETFL, 
+            fcntl.fcntl(self.fd, fcntl.F_GETFL) | os.O_NONBLOCK)
         self.poll = select.poll()
-        self.poll.register(self.proc.stdout, select.POLLIN)
-	self.marker_fd = open('/sys/kernel/debug/tracing/trace_marker', 'w')
+        self.poll.register(self.fd, select.POLLIN)
+        self.lines = deque()
+        self.partial = ''
+
+    def fileno(self):
+        return self.fd
+
+    def fill(self, block=True):
+        """ Reads everything gdb has written so far into the line buffer.
+        Waits for output if there is none and @block is set. """
+        
+        while True:
+            try:
+                data = os.read(self.fd, self.chunk)
+            except OSError as e:
+                if e.errno != errno.EAGAIN:
+                    raise
+                if not block:
+                    return
+                self.poll.poll()
+                continue
+            if not data:
+                raise EOFError("gdb exited")
+            break
+
+        lines = (self.partial + data).split('\n')
+        self.partial = lines.pop()
+        self.lines.extend(lines)
+
+    def pending(self):
+        """ Number of complete lines already buffered """
+        return len(self.lines)
+
+    def mark(self, label='stop'):
+        """ Reports a stop event to the trace sink """
+        if self.sink is not None:
+            self.sink.mark(label)
         
     def readline(self):
         """ 
         Reads a line from gdb.  
         This is blocking.
         """
-        self.poll.poll()
-	self.marker_fd.write('gdb-marker')
-	try:
-		self.marker_fd.flush()
-	except IOError:
-		pass
-#        t = float(getticks())
-#        print "Poll: %f" % time()
-#        print "Poll: " + t/ 3473848105.59
-        line = self.proc.stdout.readline().rstrip()
-        #print "read value is ---",line
-        return line
+        while not self.lines:
+            self.fill()
+        return self.lines.popleft().rstrip()
 
     def feed(self,n):
         """ Clears @n lines from stdout """
         
-        res = []
-        for x in range(n):
-            res += [self.proc.stdout.readline().rstrip()]
-        #print "return value is --",res 
-        return res
+        return [self.readline() for x in range(n)]
     
+    def sync(self, marker='@@ivp-sync@@'):
+        """ 
+        Reads and returns everything gdb prints before it echoes @marker.
+        Useful for clearing stdout when the number of lines is not known.
+        """
+        self.cmd('echo %s\\n' % marker)
+        lines = []
+        line = self.readline()
+        while marker not in line:
+            lines += [line]
+            line = self.readline()
+        return lines
+
     def cmd(self, c, newline=True, feed=0):
         """ 
         Sends a command to GDB and returns after @feed number of getlines.
@@ -97,11 +178,7 @@ class Dbg():
 
         self.proc.stdin.write(c)
 
-        res = []        
-        for x in range(feed):
-            res += [self.proc.stdout.readline()]
-
-        return res
+        return self.feed(feed)
 
     def interrupt(self):
 	"""
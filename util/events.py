@@ -0,0 +1,201 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Monitor Event Bus
+
+Filename:    events.py
+            
+Description: Sequence numbered log of monitor events: lifecycle state
+             changes, verdicts on client criteria and new measurements.
+             Consumers either long-poll for the events after the last one
+             they saw, or subscribe a callback URL that is sent batches of
+             events as they happen.  Both resume from a sequence number, and
+             report when events they asked for were dropped from the log.
+
+"""
+import threading
+from time import time, sleep
+from collections import deque
+from util.transport import connect
+
+class Bus():
+    """ Keeps the last @size events for consumers to catch up from 
+    
+    Events are lists of [seq, time, domain, kind, data].  Batches of events
+    are dicts of the bus epoch, the sequence number to resume after, whether
+    events were lost and the events themselves.  The epoch changes when the
+    server restarts, and so do sequence numbers.
+    """
+
+    def __init__(self, size=10000, batch=100, delay=0.05, expire=300):
+        self.events = deque(maxlen=size)
+        self.seq = 0
+        self.epoch = int(time())
+        self.batch = batch
+        self.delay = delay
+        self.expire = expire
+        self.cond = threading.Condition()
+        self.subscribers = {}
+
+    def publish(self, domain, kind, data):
+        """ Appends an event and wakes up consumers waiting for it """
+        
+        with self.cond:
+            self.seq += 1
+            self.events.append([self.seq, time(), domain, kind, data])
+            self.cond.notify_all()
+
+    def resume(self, seq, epoch=None):
+        """ Returns where to resume a consumer that last saw event @seq of
+        bus @epoch.  Consumers from before a restart start over. """
+        
+        if (epoch and epoch != self.epoch) or seq > self.seq:
+            return 0
+        return seq
+
+    def since(self, seq, limit, domains=None):
+        """ Returns a batch of at most @limit events after @seq """
+        
+        with self.cond:
+            first = self.seq + 1
+            if self.events:
+                first = self.events[0][0]
+            lost = first > seq + 1
+            events = []
+            last = max(seq, first - 1)
+            # Events are in order, so skip straight to the first one we need
+            for i in xrange(max(0, seq + 1 - first), len(self.events)):
+                if len(events) >= limit:
+                    break
+                event = self.events[i]
+                last = event[0]
+                if not domains or event[2] in domains:
+                    events.append(event)
+            return {'epoch': self.epoch, 'last': last, 'lost': lost, 
+                'events': events}
+
+    def wait(self, seq, timeout, limit=None, domains=None):
+        """ Long-polls for events after @seq for up to @timeout seconds.  
+        Returns once a batch has events or is full, so that callers gather
+        the events published within the bus's delay of the first. """
+        
+        limit = limit or self.batch
+        end = time() + timeout
+        with self.cond:
+            while True:
+                batch = self.since(seq, limit, domains)
+                if batch['events'] or batch['lost']:
+                    break
+                # Skip over events of other domains
+                seq = batch['last']
+                left = end - time()
+                if left <= 0:
+                    return batch
+                self.cond.wait(left)
+        
+        if len(batch['events']) < limit and self.delay:
+            sleep(self.delay)
+            batch = self.since(seq, limit, domains)
+        return batch
+
+    def subscribe(self, url, since=0, epoch=None, domains=None):
+        """ Pushes events after @since to the "events" method at @url """
+        
+        since = self.resume(since, epoch)
+        with self.cond:
+            old = self.subscribers.get(url, None)
+            if old is not None:
+                old.stop()
+            sub = Subscriber(self, url, since, domains)
+            self.subscribers[url] = sub
+        sub.start()
+        return sub
+
+    def unsubscribe(self, url):
+        with self.cond:
+            sub = self.subscribers.pop(url, None)
+        if sub is None:
+            return False
+        sub.stop()
+        return True
+
+
+class Subscriber(threading.Thread):
+    """ Delivers batches of events to a callback URL 
+    
+    A batch is sent again until the subscriber accepts it, backing off 
+    between attempts.  Subscribers that fail for longer than the bus's 
+    expire time are dropped, and may subscribe again from their last event.
+    """
+
+    def __init__(self, bus, url, since, domains):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.bus = bus
+        self.url = url
+        self.seq = since
+        self.domains = domains
+        self.proxy = connect(url, 1, timeout=10)
+        self.stopped = False
+        self.sent = 0
+        self.failed = None  # Time of the first failure in a row
+
+    def stop(self):
+        self.stopped = True
+        with self.bus.cond:
+            self.bus.cond.notify_all()
+
+    def run(self):
+        backoff = 0.1
+        while not self.stopped:
+            batch = self.bus.wait(self.seq, 1.0, domains=self.domains)
+            if self.stopped:
+                break
+            if not batch['events'] and not batch['lost']:
+                self.seq = batch['last']
+                continue
+            
+            try:
+                self.proxy.events(batch)
+            except Exception:
+                now = time()
+                self.failed = self.failed or now
+                if now - self.failed > self.bus.expire:
+                    self.bus.unsubscribe(self.url)
+                    break
+                sleep(backoff)
+                backoff = min(backoff * 2, 30)
+                continue
+
+            self.seq = batch['last']
+            self.sent += len(batch['events'])
+            self.failed = None
+            backoff = 0.1
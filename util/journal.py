@@ -0,0 +1,87 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Monitor State Journal
+
+Filename:    journal.py
+            
+Description: Durable per-domain monitor state so a restarted VMServer can
+             reattach to domains that kept running instead of restarting 
+             them.  Each domain's state is a pickle that is replaced
+             atomically on every save.
+
+"""
+import os
+import pickle
+from threading import Lock
+
+class Journal():
+    """ Directory of per-domain monitor state 
+    
+    Monitors may defer writes of state that can be recovered from the VM,
+    such as measurements, by up to @interval seconds.
+    """
+
+    def __init__(self, path, interval=1.0):
+        self.path = path
+        self.interval = interval
+        self.lock = Lock()
+        if not os.path.isdir(path):
+            os.makedirs(path)
+
+    def file(self, name):
+        return os.path.join(self.path, name + '.state')
+
+    def save(self, name, state):
+        """ Replaces the journaled state of domain @name """
+        
+        tmp = self.file(name) + '.tmp'
+        with self.lock:
+            f = open(tmp, 'wb')
+            pickle.dump(state, f, pickle.HIGHEST_PROTOCOL)
+            f.flush()
+            os.fsync(f.fileno())
+            f.close()
+            os.rename(tmp, self.file(name))
+
+    def load(self, name):
+        """ Returns the journaled state of domain @name or None """
+        
+        try:
+            return pickle.load(open(self.file(name), 'rb'))
+        except IOError:
+            return None
+
+    def remove(self, name):
+        try:
+            os.remove(self.file(name))
+        except OSError:
+            pass
@@ -0,0 +1,205 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Guest Memory Reader
+
+Filename:    memory.py
+            
+Description: Reads guest memory straight out of the QEMU process backing a
+             domain.  QEMU keeps guest RAM in anonymous mappings of its own
+             address space, so reading /proc/<pid>/mem at the right host
+             address returns guest memory without halting the VM the way a
+             gdb memory read does.
+
+"""
+import os
+import ctypes
+import struct
+from threading import Lock
+
+# Kernel address layout for the x86-64 2.6 kernels we monitor.  These can be
+# overridden from the [Memory] section of the monitor configuration.
+PAGE_OFFSET = 0xffff880000000000
+START_KERNEL_MAP = 0xffffffff80000000
+
+# QEMU's pc machine leaves a hole for PCI below 4GB once guest RAM is this big.
+BELOW_4G_LIMIT = 0xe0000000
+
+class Reader():
+    """ Introspection interface shared by the raw guest memory backends 
+    
+    Addresses are kernel virtual addresses.  Backends implement read().
+    """
+
+    ptr_size = 8
+
+    # Whether reading halts the VM
+    halts = False
+
+    def read(self, vaddr, size):
+        """ Reads @size bytes at kernel virtual address @vaddr """
+        raise NotImplementedError("Readers should implement read.")
+
+    def read_int(self, vaddr):
+        """ Reads a 32-bit signed int """
+        return struct.unpack('<i', self.read(vaddr, 4))[0]
+
+    def read_ulong(self, vaddr):
+        """ Reads an unsigned long, which is also the size of a pointer """
+        return struct.unpack('<Q', self.read(vaddr, self.ptr_size))[0]
+
+
+class GuestMemory(Reader):
+    """ Raw guest memory reader for a running QEMU process
+    
+    @regions is a list of (guest physical start, host virtual start, length)
+    tuples describing where guest RAM lives in the QEMU process.
+    """
+
+    def __init__(self, pid, regions, page_offset=PAGE_OFFSET, 
+                 kernel_map=START_KERNEL_MAP, phys_base=0):
+        self.pid = pid
+        self.regions = sorted(regions)
+        self.page_offset = page_offset
+        self.kernel_map = kernel_map
+        self.phys_base = phys_base
+        self.lock = Lock()
+        self.fd = os.open('/proc/%d/mem' % pid, os.O_RDONLY)
+
+    def close(self):
+        os.close(self.fd)
+
+    def phys(self, vaddr):
+        """ Translates a kernel virtual address to a guest physical address.
+        
+        Only the kernel image and the direct map are supported, which covers
+        static kernel data and kmalloc'd objects such as IMA queue entries.
+        """
+        if vaddr >= self.kernel_map:
+            return vaddr - self.kernel_map + self.phys_base
+        if vaddr >= self.page_offset:
+            return vaddr - self.page_offset
+        raise Exception("%#x is not a direct-mapped kernel address" % vaddr)
+
+    def host(self, paddr):
+        """ Returns the host address of guest physical address @paddr and the
+        number of bytes that are contiguous from there. """
+        
+        for (start, host, length) in self.regions:
+            if start <= paddr < start + length:
+                return (host + paddr - start, start + length - paddr)
+        raise Exception("%#x is outside of guest RAM" % paddr)
+
+    def read(self, vaddr, size):
+        """ Reads @size bytes at kernel virtual address @vaddr """
+        
+        res = []
+        while size > 0:
+            (addr, avail) = self.host(self.phys(vaddr))
+            n = min(size, avail)
+            with self.lock:
+                os.lseek(self.fd, addr, os.SEEK_SET)
+                data = os.read(self.fd, n)
+            if not data:
+                raise Exception("Short read of guest memory at %#x" % vaddr)
+            res.append(data)
+            vaddr += len(data)
+            size -= len(data)
+        return "".join(res)
+
+
+class LocalMemory(GuestMemory):
+    """ Test double that exposes a buffer in this process as guest RAM 
+    
+    Guest physical address 0 is the start of the buffer.  Kernel virtual
+    addresses translate exactly as they would for a real guest, so modules
+    can be exercised against a synthetic kernel image written with write().
+    """
+    
+    def __init__(self, size, **kw):
+        self.buf = ctypes.create_string_buffer(size)
+        GuestMemory.__init__(self, os.getpid(), 
+            [(0, ctypes.addressof(self.buf), size)], **kw)
+
+    def write(self, vaddr, data):
+        """ Writes @data at kernel virtual address @vaddr """
+        
+        (addr, avail) = self.host(self.phys(vaddr))
+        if len(data) > avail:
+            raise Exception("Write past the end of guest RAM at %#x" % vaddr)
+        ctypes.memmove(addr, data, len(data))
+
+    def write_ulong(self, vaddr, value):
+        self.write(vaddr, struct.pack('<Q', value))
+
+
+def qemu_regions(pid, ram_size):
+    """ Finds guest RAM in QEMU's address space 
+    
+    Guest RAM is the anonymous read/write mapping of @ram_size bytes (or the 
+    smallest one larger than that).  The pc machine maps the first part of it
+    below the PCI hole and the rest above 4GB.
+    """
+    
+    base = None
+    best = None
+    for line in open('/proc/%d/maps' % pid):
+        fields = line.split()
+        if len(fields) > 5 or not fields[1].startswith('rw'):
+            continue
+        (start, end) = [int(x, 16) for x in fields[0].split('-')]
+        length = end - start
+        if length >= ram_size and (best is None or length < best):
+            (base, best) = (start, length)
+    if base is None:
+        raise Exception("No guest RAM mapping found in QEMU process %d" % pid)
+    
+    below = min(ram_size, BELOW_4G_LIMIT)
+    regions = [(0, base, below)]
+    if ram_size > below:
+        regions += [(1 << 32, base + below, ram_size - below)]
+    return regions
+
+def attach(cfg, tree):
+    """ Builds a GuestMemory for the domain described by @tree using the
+    [Memory] section of @cfg. """
+    
+    name = tree.xpath('/domain/name/text()')[0]
+    pid = int(open(cfg.get('Memory', 'pidfile') % name).read().strip())
+
+    # Domain memory is given in KiB
+    ram_size = int(tree.xpath('/domain/memory/text()')[0]) * 1024
+    
+    kw = {}
+    for opt in ['page_offset', 'kernel_map', 'phys_base']:
+        if cfg.has_option('Memory', opt):
+            kw[opt] = int(cfg.get('Memory', opt), 0)
+    return GuestMemory(pid, qemu_regions(pid, ram_size), **kw)
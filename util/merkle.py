@@ -0,0 +1,196 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Disk Image Merkle Trees
+
+Filename:    merkle.py
+            
+Description: Measures large disk images as a Merkle tree of fixed size chunk
+             hashes.  Chunks that lie entirely in holes of a sparse image are
+             hashed without reading them, data chunks are hashed in parallel,
+             and the tree is stored so an image whose inode, size and times
+             are unchanged is not read at all on the next measurement.
+
+"""
+import os
+import errno
+import pickle
+from hashlib import sha1
+
+SEEK_DATA = getattr(os, 'SEEK_DATA', 3)
+SEEK_HOLE = getattr(os, 'SEEK_HOLE', 4)
+
+# Bytes read at a time while hashing a chunk
+BLOCK = 1 << 20
+
+def data_ranges(fd, size):
+    """ Returns the (start, end) ranges of a file that hold data """
+    
+    ranges = []
+    off = 0
+    while off < size:
+        try:
+            start = os.lseek(fd, off, SEEK_DATA)
+        except OSError as e:
+            if e.errno == errno.ENXIO:
+                break
+            # No sparse file support; it is all data
+            return [(off, size)]
+        end = os.lseek(fd, start, SEEK_HOLE)
+        ranges += [(start, end)]
+        off = end
+    return ranges
+
+def zeros(length):
+    digest = sha1()
+    block = '\0' * min(length, BLOCK)
+    while length > 0:
+        digest.update(block[:length])
+        length -= len(block)
+    return digest.digest()
+
+def root(leaves):
+    """ Folds leaf digests into the Merkle root """
+    
+    level = leaves or [sha1().digest()]
+    while len(level) > 1:
+        nxt = []
+        for i in range(0, len(level) - 1, 2):
+            nxt += [sha1(level[i] + level[i+1]).digest()]
+        if len(level) % 2:
+            nxt += [level[-1]]
+        level = nxt
+    return level[0]
+
+
+class Tree():
+    """ Merkle tree of an image file's chunk hashes """
+    
+    def __init__(self, path, chunk=4 << 20):
+        self.path = path
+        self.chunk = chunk
+        self.stamp = None
+        self.leaves = []
+        self.root = None
+        self.rehashed = 0   # Chunks read by the last update
+        self.changed = 0    # Chunks whose hash changed in the last update
+
+    def stat(self):
+        st = os.stat(self.path)
+        return (st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+
+    def hash_chunk(self, i):
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            os.lseek(fd, i * self.chunk, os.SEEK_SET)
+            digest = sha1()
+            left = self.chunk
+            while left > 0:
+                data = os.read(fd, min(left, BLOCK))
+                if not data:
+                    break
+                digest.update(data)
+                left -= len(data)
+            return digest.digest()
+        finally:
+            os.close(fd)
+
+    def update(self, workers=4):
+        """ Brings the tree up to date with the image and returns True if the
+        image changed since the last update. """
+        
+        stamp = self.stat()
+        if stamp == self.stamp:
+            self.rehashed = 0
+            self.changed = 0
+            return False
+        
+        size = stamp[2]
+        count = (size + self.chunk - 1) / self.chunk
+        fd = os.open(self.path, os.O_RDONLY)
+        try:
+            ranges = data_ranges(fd, size)
+        finally:
+            os.close(fd)
+        
+        # Chunks that overlap data have to be read; the rest are holes
+        data = set()
+        for (start, end) in ranges:
+            data.update(range(start / self.chunk, 
+                min(count, (end + self.chunk - 1) / self.chunk)))
+        
+        leaves = [None] * count
+        hole = zeros(self.chunk)
+        for i in range(count):
+            if i not in data:
+                leaves[i] = hole
+        if count and count - 1 not in data and size % self.chunk:
+            leaves[-1] = zeros(size % self.chunk)
+
+        from multiprocessing.pool import ThreadPool
+        pool = ThreadPool(workers)
+        try:
+            todo = sorted(data)
+            for (i, digest) in zip(todo, pool.map(self.hash_chunk, todo)):
+                leaves[i] = digest
+        finally:
+            pool.close()
+        
+        self.changed = len([i for i in range(count) if 
+            i >= len(self.leaves) or self.leaves[i] != leaves[i]])
+        self.leaves = leaves
+        self.root = root(leaves).encode('hex')
+        self.stamp = stamp
+        self.rehashed = len(data)
+        return True
+
+    def save(self, path):
+        tmp = path + '.tmp'
+        pickle.dump(self, open(tmp, 'wb'), pickle.HIGHEST_PROTOCOL)
+        os.rename(tmp, path)
+
+
+def measure(path, cache, chunk=4 << 20, workers=4):
+    """ Returns the up to date Tree of image @path, keeping trees in the
+    @cache directory between measurements. """
+    
+    if not os.path.isdir(cache):
+        os.makedirs(cache)
+    saved = os.path.join(cache, sha1(os.path.abspath(path)).hexdigest())
+    
+    tree = None
+    if os.path.exists(saved):
+        tree = pickle.load(open(saved, 'rb'))
+    if tree is None or tree.chunk != chunk:
+        tree = Tree(path, chunk)
+    if tree.update(workers):
+        tree.save(saved)
+    return tree
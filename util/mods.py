@@ -39,13 +39,26 @@ Description: Introspection modules for the VM Integrity Monitor.
 
 """
 
+import os
 import pickle
+import threading
+from time import time, sleep
 from debug import Dbg
-from lxml import etree
+from util import merkle
+from util.store import Store
 from hashlib import sha1
 from util.timing import timecall
 from ConfigParser import ConfigParser
 
+# Sizes of the C types dynamic modules watch
+WATCHSIZE = {'int': 4, 'long': 8}
+
+# Trusted hash sets for Prima
+SETS_CFG = "cfg/hashes.cfg"
+
+# Digest of measurements that failed to hash; always trusted
+ZERO = "0" * 40
+
 
 class Introspection_Module:
     """ Abstract module interface 
@@ -55,6 +68,31 @@ class Introspection_Module:
     
     name = "Abstract Introspection Module"
     kind = None # Either "Static" or "Dynamic"
+
+    # Raw guest memory reader and kernel symbol table.  When the watcher sets
+    # these, dynamic modules read guest state without halting the VM.
+    mem = None
+    syms = None
+
+    # Symbol table entry and C type of the variable a dynamic module watches
+    watchsym = None
+    watchtype = 'int'
+
+    # Symbol table entries the module reads, and those the kernel may lack
+    symbols = []
+    optional = []
+
+    # Watcher the module is attached to
+    watcher = None
+
+    # Audit log the monitor records the module's measurements in
+    audit = None
+
+    # Measurements and static verdicts shared by every module and monitor
+    store = Store()
+
+    def __init__(self, cfg=None):
+        self.cfg = cfg
     
     def Callback(self, event, dbg): 
         """ Introspection Callback function for the GDB Watcher 
@@ -83,6 +121,53 @@ class Introspection_Module:
 
         raise NotImplementedError("Modules should implement Initialize.")
 
+    def Watch(self, dbg):
+        """ Sets the module's watchpoint and returns gdb's description of it.
+        
+        Watches by address when a symbol table is loaded, so gdb does not need
+        the kernel's symbols.  With no @dbg the watchpoint is set through the
+        module's RSP reader and its address is returned instead.
+        """
+        
+        if dbg is None:
+            # Native RSP: the reader sets the watchpoint on the gdbstub
+            return self.mem.watch(self.syms[self.watchsym], 
+                WATCHSIZE[self.watchtype])
+        if self.syms is None:
+            expr = self.watchpoint
+        else:
+            expr = '*(%s *) %d' % (self.watchtype, self.syms[self.watchsym])
+        return dbg.cmd('watch ' + expr, feed=1)[0][6:].strip()
+
+    def Refresh(self):
+        """ Re-reads the module's state from raw guest memory 
+        
+        Used instead of Callback when a memory reader is attached.  The watcher
+        has already resumed the VM, so this must not touch gdb.
+        
+        Returns True if state has changed (should call Check).
+        """
+
+        raise NotImplementedError("Dynamic modules should implement Refresh.")
+
+    def Stats(self):
+        """ Returns a dict of module counters for the monitor's status """
+        return {}
+
+    def Stop(self):
+        """ Called when the monitor detaches or destroys the VM; stops any
+        work the module does in the background """
+        pass
+
+    def Save(self):
+        """ Returns the module's measurements for the monitor journal """
+        return None
+
+    def Restore(self, state):
+        """ Restores measurements returned by Save when reattaching to a 
+        running VM.  Static modules are not initialized again. """
+        pass
+
     def Check(self, criteria): 
         """ Called to re-evaluate client-specific conditions when 
         state changes or there is a new connection. Returns True if criteria
@@ -97,17 +182,18 @@ class Hash(Introspection_Module):
     """ Load-Time Hash module 
     
     This module measures hashes of configuration specific files before the
-    VM is started.
+    VM is started.  Files are measured through the shared store, so 
+    domains booting the same images hash them once.
     """
 
     name = "Hash"
     kind = "Static"
-    hashes = {}
     
     def __init__(self,cfg,dom):
 
         self.cfg = cfg
         self.dom = dom
+        self.hashes = {}
 
     def Initialize(self):
         """ Gather hashes 
@@ -116,10 +202,16 @@ class Hash(Introspection_Module):
         Provide an xpath query in the config file to obtain the path.
         """
         
-        tree = etree.ElementTree(etree.XML(self.dom.XMLDesc(0)))
+        tree = describe(self.dom)
 
         for (k,v) in self.cfg.items(self.name):
-            self.hashes[k]=sha1(open(tree.xpath(v)[0],'rb').read()).hexdigest()
+            self.hashes[k] = self.store.measure(tree.xpath(v)[0])
+
+    def Save(self):
+        return self.hashes
+
+    def Restore(self, state):
+        self.hashes = state
 
     def Check(self, criteria):
         if not criteria.has_section(self.name):
@@ -131,12 +223,75 @@ class Hash(Introspection_Module):
                 return False
         return True
 
+    def Stats(self):
+        return self.store.stats()
+
+class Disk(Introspection_Module):
+    """ Load-Time disk image measurement module 
+    
+    Measures the disk images named by xpath queries in the config's [Disk]
+    section as Merkle trees of chunk hashes.  Criteria give the expected
+    root hash of each image.  Trees are kept in the 'cache' directory so
+    unchanged images are not read again on the next start.
+    """
+
+    name = "Disk"
+    kind = "Static"
+    
+    # [Disk] options that are settings rather than images
+    settings = ['cache', 'chunk', 'workers']
+    
+    def __init__(self,cfg,dom):
+
+        self.cfg = cfg
+        self.dom = dom
+        self.roots = {}
+        self.cache = "cfg/disk"
+        self.chunk = 4 << 20
+        self.workers = 4
+        if cfg.has_option(self.name, 'cache'):
+            self.cache = cfg.get(self.name, 'cache')
+        if cfg.has_option(self.name, 'chunk'):
+            self.chunk = cfg.getint(self.name, 'chunk')
+        if cfg.has_option(self.name, 'workers'):
+            self.workers = cfg.getint(self.name, 'workers')
+
+    @timecall
+    def Initialize(self):
+        """ Measure images """
+        
+        tree = describe(self.dom)
+
+        for (k,v) in self.cfg.items(self.name):
+            if k in self.settings:
+                continue
+            image = merkle.measure(tree.xpath(v)[0], self.cache, self.chunk,
+                self.workers)
+            self.roots[k] = image.root
+
+    def Save(self):
+        return self.roots
+
+    def Restore(self, state):
+        self.roots = state
+
+    def Check(self, criteria):
+        if not criteria.has_section(self.name):
+            return True
+            
+        for (k,v) in criteria.items(self.name):
+            if self.roots.get(k, None) != v:
+                return False
+        return True
+
 class SELinux_Enforce(Introspection_Module):
     """ Run-time SELinux enforcing monitoring module """
     
     name = "SELinux_Enforce"
     kind = "Dynamic"
     watchpoint = "selinux_enforcing"
+    watchsym = "selinux_enforcing"
+    symbols = ["selinux_enforcing"]
     
     @timecall
     def Callback(self, dbg):
@@ -150,12 +305,20 @@ class SELinux_Enforce(Introspection_Module):
             self.enforcing = '0'
         return True
         
+    def Refresh(self):
+        self.enforcing = str(self.mem.read_int(self.syms['selinux_enforcing']))
+        return True
+
     def Initialize(self, dbg):
         # Get current selinux state
-        self.enforcing = dbg.cmd("get_selinux_enforcing", feed=1)[0][6:].strip()
+        if self.mem is not None:
+            self.Refresh()
+        else:
+            self.enforcing = dbg.cmd("get_selinux_enforcing", 
+                feed=1)[0][6:].strip()
         
         # Register watchpoint and return the value to the watcher
-        return [dbg.cmd('watch ' + self.watchpoint, feed=1)[0][6:].strip()]
+        return [self.Watch(dbg)]
         
     def Check(self, criteria):
         if not criteria.has_section(self.name):
@@ -172,50 +335,196 @@ class Prima(Introspection_Module):
     name = "Prima"
     kind = "dynamic"
     watchpoint = "ima_measurements->prev"
+    watchsym = "ima_measurements_prev"
+    watchtype = "long"
+    symbols = ["ima_measurements", "ima_measurements_prev", "ima_htable_len",
+        "qe_later", "qe_entry", "te_digest"]
     
-    # Measurement List
-    mlist = set()
+    # Criteria hash sets, shared by all instances, and the (path, mtime) 
+    # each was loaded from
     sets = {}    
+    loaded = {}
 
-    def __init__(self):
+    def __init__(self, cfg=None):
         
-        # Load criteria hash sets for fast lookup
-        cfg = ConfigParser()
-        cfg.read("cfg/hashes.cfg")
+        self.cfg = cfg
+
+        # Measurement List
+        self.mlist = set()
+
+        # List node and count of the measurements read from raw guest memory
+        self.tail = None
+        self.count = 0
+        self.lock = threading.Lock()
+
+        # Under a high measurement rate the watchpoint is dropped and the list
+        # is polled instead.  Rates are in measurements per second; a zero
+        # poll_rate always watches.
+        self.poll_rate = 0
+        self.watch_rate = 0
+        self.rate_window = 1.0
+        self.poll_interval = 0.1
+        if cfg is not None and cfg.has_section(self.name):
+            for opt in ['poll_rate', 'watch_rate', 'rate_window', 
+                    'poll_interval']:
+                if cfg.has_option(self.name, opt):
+                    setattr(self, opt, cfg.getfloat(self.name, opt))
+        self.polling = False
+        self.events = 0         # Measurements in the current rate window
+        self.since = time()
+        self.halts = 0          # Watchpoint events handled
+        self.polled = 0         # Measurements picked up by polling instead
+        self.switches = 0
 
-        for (k, v) in cfg.items("Sets"):
-            self.sets[k] = pickle.load(open(v,'r'))
+        # Load criteria hash sets for fast lookup
+        if not self.sets:
+            reload_sets()
                 
     @timecall
     def Callback(self, dbg):
 
         # clear the watchpoint info
         dbg.feed(5)
+        self.halts += 1
 
         # Get the most recent measurement
         feed = dbg.cmd('last_hash',feed=1)
-        self.mlist.add(feed[0][6:].strip())
+        self.record(self.count + 1, feed[0][6:].strip())
         #feed = dbg.cmd('xlast_hash',feed=2)
         #print "feed is",feed
         #h = "".join([w[2:] for w in feed[0][6:].strip()[1:]])
         #h += feed[1].split()[1][2:]
         #self.mlist.add(h)
-        print "last added hash is---",feed[0][6:].strip()
+        self.count += 1
         # Always return true
         return True 
 
+    def record(self, seq, digest):
+        """ Adds measurement number @seq of the list and audits it """
+        
+        self.mlist.add(digest)
+        if self.audit is not None:
+            self.audit.measurement(seq, digest)
+
+    def digest(self, node):
+        """ Reads the template digest of the queue entry owning list @node """
+        
+        entry = self.mem.read_ulong(node - self.syms['qe_later'] + 
+            self.syms['qe_entry'])
+        return self.mem.read(entry + self.syms['te_digest'], 20).encode('hex')
+
+    def catchup(self):
+        """ Adds every measurement appended after the last one we read and
+        returns how many there were. """
+        
+        head = self.syms['ima_measurements']
+        n = 0
+        with self.lock:
+            node = self.mem.read_ulong(self.tail)
+            while node != head:
+                n += 1
+                self.record(self.count + n, self.digest(node))
+                self.tail = node
+                node = self.mem.read_ulong(node)
+            self.count += n
+        return n
+
+    def Refresh(self):
+        """ Adds every measurement appended after the last one we read. 
+        
+        The VM keeps running while we walk, so more than one entry may have
+        been appended since the watchpoint fired.  Switches to polling if
+        the watchpoint fires too often.
+        """
+        
+        # Count measurements rather than calls, since the events that arrive
+        # during a refresh are merged into the next one
+        self.events += self.catchup()
+        self.halts += 1
+        
+        now = time()
+        if now - self.since >= self.rate_window:
+            rate = self.events / (now - self.since)
+            (self.events, self.since) = (0, now)
+            
+            # Polling is only cheaper if reads do not halt the VM
+            if self.poll_rate and rate >= self.poll_rate and not \
+                    self.polling and not self.mem.halts and \
+                    self.watcher.disarm(self.name):
+                self.polling = True
+                self.switches += 1
+                poller = threading.Thread(target=self.poll)
+                poller.daemon = True
+                poller.start()
+        return True
+
+    def poll(self):
+        """ Polls the measurement list length until the rate drops enough to
+        go back to the watchpoint. """
+        
+        arming = False
+        while self.polling:
+            sleep(self.poll_interval)
+            if not self.polling:
+                break
+            n = 0
+            if self.mem.read_ulong(self.syms['ima_htable_len']) != self.count:
+                n = self.catchup()
+                self.polled += n
+                self.watcher.trigger(self.name)
+            if not arming and n / self.poll_interval < self.watch_rate:
+                arming = self.watcher.arm(self.name, self.armed)
+
+    def armed(self):
+        """ Called by the watcher once the watchpoint is set again """
+        
+        self.polling = False
+        self.switches += 1
+        if self.catchup():
+            self.watcher.trigger(self.name)
+
+    def Stop(self):
+        self.polling = False
+
+    def resume(self):
+        """ Reads the measurements appended since a restored checkpoint 
+        
+        The list only grows, so the new entries are the last ones.  They are
+        found by walking backwards from the list head.
+        """
+        
+        head = self.syms['ima_measurements']
+        prev = self.syms['ima_measurements_prev'] - head
+        num = self.mem.read_ulong(self.syms['ima_htable_len']) - self.count
+        
+        node = head
+        for i in range(num):
+            node = self.mem.read_ulong(node + prev)
+            self.record(self.count + num - i, self.digest(node))
+        self.tail = self.mem.read_ulong(head + prev)
+        self.count += num
+
     def Initialize(self, dbg):
         """ Gets the current measurement list and returns watchpoint trigger"""
                 
-        # Get the list of prima measurements into the measurement_list
-        num = int(dbg.cmd("print_mlist", feed=1)[0][6:].strip())
-
-        # Parse list
-        for line in dbg.feed(num):
-            self.mlist.add(line.strip())
+        if self.mem is not None and self.count:
+            self.resume()
+        elif self.mem is not None:
+            # Walk the list in guest memory, starting from the list head
+            self.tail = self.syms['ima_measurements']
+            self.catchup()
+        else:
+            # Get the measurements we have not seen into the measurement_list
+            num = int(dbg.cmd("print_mlist_since %d" % self.count, 
+                feed=1)[0][6:].strip())
+
+            # Parse list, which the macro prints newest first
+            for (i, line) in enumerate(dbg.feed(num)):
+                self.record(self.count + num - i, line.strip())
+            self.count += num
         
         # Register watchpoint and return the value to the watcher
-        return [dbg.cmd('watch ' + self.watchpoint, feed=1)[0][6:].strip()]
+        return [self.Watch(dbg)]
 
     @timecall
     def Check(self, criteria):
@@ -225,38 +534,339 @@ class Prima(Introspection_Module):
         # only looking for trusted sets now. 
         # TODO: add other set types
         trusted = set()
-        trusted.add("0"*40)
         if criteria.has_option(self.name, 'trusted'):
-            trusted.update(self.sets[criteria.get(self.name, 'trusted')])
+            trusted = self.sets[criteria.get(self.name, 'trusted')]
         # Check if mlist is contained within the trusted set
-#        print self.mlist.difference(trusted)
-        if trusted.issuperset(self.mlist):
+        untrusted = self.mlist.difference(trusted)
+        untrusted.discard(ZERO)
+        if not untrusted:
             return True
         else:
             return False
+
+    def Affected(self, criteria, changes):
+        """ Returns True if a trusted set reload invalidates @criteria 
+        
+        @changes maps set names to the (added, removed) hashes of a reload.
+        Additions can never fail a running criteria, so only removals of 
+        hashes we have measured are considered.
+        """
+        
+        if not criteria.has_option(self.name, 'trusted'):
+            return False
+        name = criteria.get(self.name, 'trusted')
+        if name not in changes:
+            return False
+        removed = changes[name][1].intersection(self.mlist)
+        removed.discard(ZERO)
+        return len(removed) > 0
+
+    def Save(self):
+        """ Measurement list checkpoint """
+        
+        with self.lock:
+            return {'mlist': list(self.mlist), 'count': self.count}
+
+    def Restore(self, state):
+        self.mlist = set(state['mlist'])
+        self.count = state['count']
+
+    def Stats(self):
+        """ Every polled measurement is a guest pause saved over watching """
+        
+        return {'mode': self.polling and 'poll' or 'watch', 
+            'halts': self.halts, 'polled': self.polled, 
+            'switches': self.switches}
             
             
+class Kernel_Text(Introspection_Module):
+    """ Run-time kernel text and rodata integrity module 
+    
+    Hashes the guest kernel's text and read-only data page by page and 
+    folds the page hashes into a Merkle root that criteria compare against.
+    Pages are read from guest memory a chunk at a time and rehashed in the
+    background, a slice at a time, using at most a budget fraction of a CPU.
+    
+    The kernel patches its own text while it boots, so the reference root
+    should be taken from the status of a known good guest rather than 
+    computed from the kernel image.
+    """
+
+    name = "Kernel_Text"
+    kind = "dynamic"
+    
+    # Symbol table entries bounding the measured ranges.  Kernels without
+    # a separate rodata section have their text measured alone.
+    ranges = [('stext', 'etext'), ('start_rodata', 'end_rodata')]
+    symbols = ['stext', 'etext', 'start_rodata', 'end_rodata']
+    optional = ['start_rodata', 'end_rodata']
+    page = 4096
+    
+    def __init__(self, cfg=None):
+        
+        self.cfg = cfg
+        
+        # Bytes per read, fraction of a CPU spent hashing, seconds of hashing
+        # at a time, and minimum seconds between the starts of two sweeps
+        self.chunk = 1 << 20
+        self.budget = 0.05
+        self.slice = 0.01
+        self.period = 60.0
+        if cfg is not None and cfg.has_section(self.name):
+            if cfg.has_option(self.name, 'chunk'):
+                self.chunk = cfg.getint(self.name, 'chunk')
+            for opt in ['budget', 'slice', 'period']:
+                if cfg.has_option(self.name, opt):
+                    setattr(self, opt, cfg.getfloat(self.name, opt))
+        self.chunk = max(self.page, self.chunk - self.chunk % self.page)
+        
+        self.reads = []     # (vaddr, size, first page) of each chunk
+        self.leaves = []    # Page hashes
+        self.root = None
+        self.next = 0       # Next chunk of the current sweep
+        self.began = 0      # Start of the current sweep
+        self.rehashing = False
+        
+        self.sweeps = 0
+        self.modified = 0   # Pages whose hash changed after the first sweep
+        self.hashed = 0     # Bytes read and hashed
+        self.busy = 0.0     # Seconds spent reading and hashing
+        self.paused = 0.0   # Seconds the VM was halted for reads
+        self.longest = 0.0  # Longest single halt
+        self.last = 0.0     # Seconds the last sweep took from start to end
+        self.error = None
+        
+    def layout(self):
+        """ Splits the measured ranges into chunk sized reads """
+        
+        self.reads = []
+        count = 0
+        for (start, end) in self.ranges:
+            if start not in self.syms or end not in self.syms:
+                continue
+            (start, end) = (self.syms[start], self.syms[end])
+            if end <= start:
+                raise Exception("Empty kernel range %#x-%#x" % (start, end))
+            for vaddr in range(start, end, self.chunk):
+                size = min(self.chunk, end - vaddr)
+                self.reads += [(vaddr, size, count)]
+                count += (size + self.page - 1) / self.page
+        self.leaves = [None] * count
+
+    def step(self, deadline):
+        """ Hashes chunks until the sweep ends or @deadline passes.  Returns
+        the number of pages whose hash changed. """
+        
+        changed = 0
+        start = time()
+        while self.next < len(self.reads):
+            (vaddr, size, first) = self.reads[self.next]
+            data = self.mem.read(vaddr, size)
+            for (i, off) in enumerate(range(0, size, self.page)):
+                digest = sha1(data[off:off+self.page]).digest()
+                if self.leaves[first + i] != digest:
+                    self.leaves[first + i] = digest
+                    changed += 1
+            self.hashed += size
+            self.next += 1
+            if time() >= deadline:
+                break
+        spent = time() - start
+        self.busy += spent
+        if self.mem.halts:
+            self.paused += spent
+            self.longest = max(self.longest, spent)
+        
+        if self.next == len(self.reads):
+            self.next = 0
+            self.sweeps += 1
+            self.last = time() - self.began
+        if self.sweeps and (changed or self.root is None):
+            self.root = merkle.root(self.leaves).encode('hex')
+        return changed
+
+    def sweep(self):
+        """ Hashes one slice, on the watcher while the VM is halted if the
+        reader halts it """
+        
+        if not self.mem.halts:
+            return self.step(time() + self.slice)
+        
+        res = []
+        done = threading.Event()
+        def action():
+            try:
+                res.append(self.step(time() + self.slice))
+            finally:
+                done.set()
+        self.watcher.schedule(action, True)
+        while not done.wait(0.5):
+            if not self.rehashing:
+                return 0
+        return res and res[0] or 0
+
+    def rehash(self):
+        """ Sweeps the ranges until rehashing is cleared, sleeping between
+        slices so hashing stays within the budget """
+        
+        try:
+            while self.rehashing:
+                if self.next == 0:
+                    wait = self.began + self.period - time()
+                    if wait > 0:
+                        sleep(wait)
+                        if not self.rehashing:
+                            break
+                    self.began = time()
+                busy = self.busy
+                changed = self.sweep()
+                if changed:
+                    self.modified += changed
+                    self.watcher.trigger(self.name)
+                sleep((self.busy - busy) * (1 - self.budget) / self.budget)
+        except Exception as e:
+            # The VM is most likely gone
+            self.error = str(e)
+            
+    def Initialize(self, dbg):
+        """ Hashes every page once and starts rehashing in the background.
+        There is no watchpoint. """
+        
+        if self.mem is None:
+            raise Exception("Kernel_Text needs a [Memory] reader or the rsp "
+                "backend")
+        self.layout()
+        
+        # The first sweep is the baseline and is not held to the budget
+        self.began = time()
+        while not self.sweeps:
+            self.step(time() + self.slice)
+        
+        self.rehashing = True
+        rehasher = threading.Thread(target=self.rehash)
+        rehasher.daemon = True
+        rehasher.start()
+        return []
+
+    def Refresh(self):
+        return False
+
+    def Stop(self):
+        self.rehashing = False
+
+    def Check(self, criteria):
+        if not criteria.has_section(self.name):
+            return True
+        return self.root == criteria.get(self.name, 'root')
+
+    def Stats(self):
+        """ Hashing throughput and the time the VM was halted for reads.
+        XML-RPC ints are 32-bit, so bytes are reported in MB. """
+        
+        stats = {'pages': len(self.leaves), 'sweeps': self.sweeps, 
+            'modified': self.modified, 
+            'hashed_mb': round(self.hashed / float(1 << 20), 1), 
+            'paused': round(self.paused, 6), 
+            'longest': round(self.longest, 6), 'sweep': round(self.last, 6)}
+        if self.root is not None:
+            stats['root'] = self.root
+        if self.busy:
+            stats['rate'] = round(self.hashed / self.busy / (1 << 20), 1)
+        if self.error is not None:
+            stats['error'] = self.error
+        return stats
+
+
 class Timing(Introspection_Module):
     """ Timing module """
 
     name = "Timing"
     kind = "dynamic"
     watchpoint = "printk_ratelimit_state.interval"
+    watchsym = "ratelimit_interval"
+    symbols = ["ratelimit_interval"]
+    
+    # Writes to the watched interval
+    triggers = 0
                     
     @timecall
     def Callback(self, dbg):
 
         # clear the watchpoint info
         dbg.feed(5)
+        self.triggers += 1
+
+        return True
 
+    def Refresh(self):
+        self.triggers += 1
         return True
 
+    def Stats(self):
+        """ The monitor publishes these with each trigger """
+        return {'triggers': self.triggers}
+
     def Initialize(self, dbg):
         """ Gets the current measurement list and returns watchpoint trigger"""
                 
         # Register watchpoint and return the value to the watcher
-        return [dbg.cmd('watch ' + self.watchpoint, feed=1)[0][6:].strip()]
+        return [self.Watch(dbg)]
 
     def Check(self, criteria):
-        print "timing triggered"
         return True
+
+
+def describe(dom):
+    """ Returns the parsed domain XML of @dom 
+    
+    lxml is imported here rather than with the module, since it is only 
+    needed once a domain is started.
+    """
+    
+    from lxml import etree
+    return etree.ElementTree(etree.XML(dom.XMLDesc(0)))
+
+def sets_changed(path=SETS_CFG):
+    """ Returns True if the set config or any trusted set file changed """
+    
+    cfg = ConfigParser()
+    cfg.read(path)
+    files = dict(cfg.items("Sets"))
+    if sorted(files) != sorted(Prima.loaded):
+        return True
+    for (k, v) in files.items():
+        if Prima.loaded[k] != (v, os.stat(v).st_mtime):
+            return True
+    return False
+
+def reload_sets(path=SETS_CFG):
+    """ Applies changes to Prima's trusted sets in place 
+    
+    Only set files whose path or mtime changed are read again.  Returns a
+    dict mapping each changed set to its (added, removed) hashes.  A set
+    dropped from the config is emptied.
+    """
+    
+    cfg = ConfigParser()
+    cfg.read(path)
+    files = dict(cfg.items("Sets"))
+    
+    changes = {}
+    for (k, v) in files.items():
+        stamp = (v, os.stat(v).st_mtime)
+        if Prima.loaded.get(k, None) == stamp:
+            continue
+        new = set(pickle.load(open(v, 'rb')))
+        old = Prima.sets.setdefault(k, set())
+        (added, removed) = (new - old, old - new)
+        old.update(added)
+        old.difference_update(removed)
+        Prima.loaded[k] = stamp
+        if added or removed:
+            changes[k] = (added, removed)
+
+    for k in set(Prima.loaded) - set(files):
+        changes[k] = (set(), set(Prima.sets[k]))
+        Prima.sets[k].clear()
+        Prima.loaded.pop(k, None)
+    return changes
@@ -40,54 +40,211 @@ Description: Integrity Monitor that measures the integrity of a VM.  This module
              object is spawned per VM.  
 
 """
+import os
 import sys
 import mods
 import debug
-import libvirt
 import threading 
-import pdb
 from time import *
 from util import mods
-from lxml import etree
+from util import rsp
+from util import memory
+from util import symbols
+from util.clients import Registry
+from util import audit
 from subprocess import *
-from util.debug import Dbg
+from util.debug import Dbg, TraceMarker
+from util.mods import WATCHSIZE, describe
 from util.timing import timecall
+from hashlib import sha1
 from ConfigParser import ConfigParser
 
 
+def fingerprint(crt):
+    """ Returns a digest of a criteria's content 
+    
+    Sections and options are sorted and values stripped, so criteria files
+    that only differ in layout or comments share a fingerprint.
+    """
+    
+    canon = []
+    for section in sorted(crt.sections()):
+        options = sorted((k, v.strip()) for (k, v) in crt.items(section))
+        canon += [(section, options)]
+    return sha1(repr(canon)).hexdigest()
+
+def measured(module):
+    """ Returns a digest of a static module's measurements """
+    
+    state = module.Save()
+    if isinstance(state, dict):
+        state = sorted(state.items())
+    return sha1(repr(state)).hexdigest()
+
+def start_timer(delay, fn, args=[]):
+    """ Runs @fn in a thread of its own after @delay seconds """
+    
+    timer = threading.Timer(delay, fn, args)
+    timer.daemon = True
+    timer.start()
+    return timer
+
+
 class Watcher(threading.Thread):
-    """ Thread to watch for GDB output and dispatch to handle it. """
+    """ Thread to watch for GDB output and dispatch to handle it. 
     
-    watchpoints = {}
+    Instead of starting the thread, a watcher may attach() and be added to
+    a Reactor, which calls readable() when gdb has written output.
+    """
     
-    def __init__ (self, cfg, tree, trigger, modules):
+    reactor = None
+
+    def __init__ (self, snap, tree, trigger, modules):
+        cfg = snap.cfg
         self.cfg = cfg
         self.trigger = trigger
         self.modules = modules
-        self.dbg = Dbg()
+        self.watchpoints = {}
+        self.detaching = False
+        self.detached = False
+        self.actions = []   # Run the next time the VM halts
+        self.lock = threading.Lock()
+
+        # ftrace markers on stop events are opt-in
+        sink = None
+        if cfg.has_option('Watcher', 'trace_marker'):
+            sink = TraceMarker(cfg.get('Watcher', 'trace_marker'))
+        self.dbg = Dbg(sink=sink)
         
         kernel = tree.xpath('/domain/os/kernel/text()')[0]
         kernel += ".gdb"
         name = tree.xpath('/domain/name/text()')[0]
                 
-        self.port = cfg.get('Domains', name).split()[1]
+        self.port = snap.domains[name].port
         macros = cfg.get('Watcher', 'macros')
+
+        # Read guest memory directly from QEMU if configured
+        self.mem = None
+        if cfg.has_section('Memory'):
+            self.mem = memory.attach(cfg, tree)
+
+        # Only the symbols the configured modules read, from the table cached
+        # by the kernel's build-id if there is one
+        (needed, optional) = symbols.needs(modules.values())
+        self.syms = None
+        if cfg.has_option('Watcher', 'symcache'):
+            self.syms = symbols.lookup(kernel, cfg.get('Watcher', 'symcache'),
+                needed, optional)
         
-        # Load kernel symbols
-        self.dbg.cmd('file %s' % (kernel), feed=1)
+        # Load kernel symbols.  Raw memory readers with a cached table have no
+        # use for gdb's copy.
+        if self.mem is None or self.syms is None:
+            self.dbg.cmd('file %s' % (kernel), feed=1)
+            if self.syms is None:
+                self.syms = symbols.resolve(self.dbg, needed, optional)
 
         # Load macros
         self.dbg.cmd('source %s' % (macros))
+        if 'qe_later' in self.syms:
+            self.dbg.cmd('set $qe_later = %d' % self.syms['qe_later'])
                 
         threading.Thread.__init__(self)
 
+    def interrupt(self):
+        """ Halts the VM so the watcher detaches """
+        self.detaching = True
+        self.dbg.interrupt()
+
+    def schedule(self, action, wake):
+        """ Runs @action in the watcher thread the next time the VM halts.  
+        If @wake is set the VM is interrupted so that happens right away. """
+        
+        with self.lock:
+            if self.detached:
+                raise Exception("The watcher has detached")
+            self.actions += [action]
+        if wake:
+            self.dbg.interrupt()
+
+    def run_actions(self):
+        with self.lock:
+            (actions, self.actions) = (self.actions, [])
+        for action in actions:
+            action()
+
+    def detach(self):
+        """ Runs the actions still waiting for a halt, so nothing waits on 
+        them forever, then detaches from the halted VM.  Actions scheduled
+        from now on fail. """
+        
+        with self.lock:
+            self.detached = True
+        try:
+            self.run_actions()
+        finally:
+            self.dbg.cmd('detach')
+            exit()
+
+    def disarm(self, name):
+        """ Removes the watchpoints of module @name the next time the VM 
+        halts. """
+        
+        def action():
+            for (wp, n) in self.watchpoints.items():
+                if n == name:
+                    self.dbg.cmd('delete ' + wp.split()[2].rstrip(':'))
+                    self.watchpoints.pop(wp)
+        self.schedule(action, False)
+        return True
+
+    def arm(self, name, done=None):
+        """ Halts the VM to set the watchpoint of module @name again, then
+        calls @done while the VM is still halted. """
+        
+        def action():
+            self.watchpoints[self.modules[name].Watch(self.dbg)] = name
+            if done is not None:
+                done()
+        self.schedule(action, True)
+        return True
+
+    def check(self, name):
+        """ Checks module @name against the criteria, on the reactor's 
+        workers if there is one """
+        
+        if self.reactor is None:
+            self.trigger(name)
+        else:
+            self.reactor.submit(self.trigger, name)
+
+    def refresh(self, name):
+        """ Re-measures module @name while the VM runs and checks it if it 
+        changed.  On a reactor, events that arrive meanwhile are merged into 
+        the next refresh. """
+        
+        module = self.modules[name]
+        def job():
+            if module.Refresh():
+                self.trigger(name)
+        if self.reactor is None:
+            job()
+        else:
+            self.reactor.serial((self, name), job)
+
     @timecall
     def handle(self, line):
         
         flag = False
-	if "SIGINT" in line:
-		self.dbg.cmd('detach')
-		exit()
+        if "SIGINT" in line:
+            self.dbg.mark('interrupt')
+            # Halted on request.  Clear the rest of the stop report, whose 
+            # length depends on the frame, before actions read replies.
+            self.dbg.sync()
+            if self.detaching:
+                self.detach()
+            self.run_actions()
+            self.dbg.cmd('continue',feed=1)
+            return
 
         # Find the module for the event
         # name = self.watchpoints[line]
@@ -100,27 +257,64 @@ class Watcher(threading.Thread):
         if not flag:
             return
         
-        if self.modules[name].Callback(self.dbg):
+        self.dbg.mark(name)
+        module = self.modules[name]
+        if module.mem is not None:
+            # Clear the watchpoint info and let the VM run while we read
+            self.dbg.feed(5)
+            self.run_actions()
+            self.dbg.cmd('continue',feed=1)
+            self.refresh(name)
+            return
+
+        if module.Callback(self.dbg):
             # Check the module against the criteria
-            self.trigger(name)
+            self.check(name)
         
         # Resume the VM
+        self.run_actions()
         self.dbg.cmd('continue',feed=1)
 
 
-    def run(self):
-
+    def attach(self):
+        """ Attaches to the VM and sets the modules' watchpoints """
 
         # Connect to the running VM.  This will halt it.
         self.dbg.cmd('target extended-remote 127.0.0.1:' + self.port, feed=3)
 
-        # Each module registers watchpoints
+        # Hand the symbol table and memory reader to the modules
+        for module in self.modules.values():
+            module.mem = self.mem
+            module.syms = self.syms
+            module.watcher = self
+
+        # Each module registers watchpoints.  Modules that watch nothing 
+        # read guest memory once the VM runs again, if the reader allows.
+        later = []
         for (name, module) in self.modules.items():
+            if module.watchsym is None and self.mem is not None:
+                later += [module]
+                continue
             for watch in module.Initialize(self.dbg):
                 self.watchpoints[watch] = name
 
         # Resume VM
         self.dbg.cmd('continue',feed=1)
+        for module in later:
+            module.Initialize(None)
+
+    def fileno(self):
+        return self.dbg.fileno()
+
+    def readable(self):
+        """ Handles everything gdb has written so far """
+        
+        self.dbg.fill(block=False)
+        while self.dbg.pending():
+            self.handle(self.dbg.readline().strip())
+
+    def run(self):
+        self.attach()
         
         # The main loop
         while(True):
@@ -128,6 +322,284 @@ class Watcher(threading.Thread):
             self.handle(self.dbg.readline().strip())
     
 
+class RemoteWatcher(threading.Thread):
+    """ Watcher that speaks RSP to QEMU's gdbstub instead of driving gdb. 
+    
+    Modules read guest memory through the RSP connection, or through a
+    GuestMemory if one is configured, and never see gdb text output.  Like
+    Watcher, it may be run by a Reactor instead of its own thread.
+    """
+
+    reactor = None
+
+    def __init__ (self, snap, tree, trigger, modules):
+        cfg = snap.cfg
+        self.cfg = cfg
+        self.trigger = trigger
+        self.modules = modules
+        self.watchpoints = []
+        self.detaching = False
+        self.detached = False
+        self.actions = []   # Run the next time the VM halts
+        self.lock = threading.Lock()
+        
+        kernel = tree.xpath('/domain/os/kernel/text()')[0]
+        kernel += ".gdb"
+        name = tree.xpath('/domain/name/text()')[0]
+                
+        self.port = snap.domains[name].port
+
+        # Read guest memory directly from QEMU if configured
+        self.mem = None
+        if cfg.has_section('Memory'):
+            self.mem = memory.attach(cfg, tree)
+
+        # There is no gdb to ask for symbols
+        (needed, optional) = symbols.needs(modules.values())
+        if cfg.has_option('Watcher', 'symcache'):
+            self.syms = symbols.lookup(kernel, cfg.get('Watcher', 'symcache'),
+                needed, optional)
+        else:
+            self.syms = symbols.extract(kernel, needed, optional)
+
+        threading.Thread.__init__(self)
+
+    def interrupt(self):
+        """ Halts the VM so the watcher detaches """
+        self.detaching = True
+        self.target.interrupt()
+
+    def schedule(self, action, wake):
+        """ Runs @action in the watcher thread the next time the VM halts.  
+        If @wake is set the VM is interrupted so that happens right away. """
+        
+        with self.lock:
+            if self.detached:
+                raise Exception("The watcher has detached")
+            self.actions += [action]
+        if wake:
+            self.target.interrupt()
+
+    def run_actions(self):
+        with self.lock:
+            (actions, self.actions) = (self.actions, [])
+        for action in actions:
+            action()
+
+    def detach(self):
+        """ Runs the actions still waiting for a halt, so nothing waits on 
+        them forever, then detaches from the halted VM.  Actions scheduled
+        from now on fail. """
+        
+        with self.lock:
+            self.detached = True
+        try:
+            self.run_actions()
+        finally:
+            self.target.detach()
+            exit()
+
+    def disarm(self, name):
+        """ Removes the watchpoints of module @name the next time the VM 
+        halts. """
+        
+        def action():
+            for wp in [w for w in self.watchpoints if w[2] == name]:
+                self.target.unwatch(wp[0], wp[1])
+                self.watchpoints.remove(wp)
+        self.schedule(action, False)
+        return True
+
+    def arm(self, name, done=None):
+        """ Halts the VM to set the watchpoint of module @name again, then
+        calls @done while the VM is still halted. """
+        
+        module = self.modules[name]
+        def action():
+            size = WATCHSIZE[module.watchtype]
+            addr = self.target.watch(module.syms[module.watchsym], size)
+            self.watchpoints += [(addr, size, name)]
+            if done is not None:
+                done()
+        self.schedule(action, True)
+        return True
+
+    def check(self, name):
+        """ Checks module @name against the criteria, on the reactor's 
+        workers if there is one """
+        
+        if self.reactor is None:
+            self.trigger(name)
+        else:
+            self.reactor.submit(self.trigger, name)
+
+    def refresh(self, name):
+        """ Re-measures module @name while the VM runs and checks it if it 
+        changed.  On a reactor, events that arrive meanwhile are merged into 
+        the next refresh. """
+        
+        module = self.modules[name]
+        def job():
+            if module.Refresh():
+                self.trigger(name)
+        if self.reactor is None:
+            job()
+        else:
+            self.reactor.serial((self, name), job)
+
+    @timecall
+    def handle(self, sig, info):
+        
+        if self.detaching:
+            self.detach()
+        self.run_actions()
+
+        # Find the module for the event
+        addr = None
+        for key in rsp.WATCH_KEYS:
+            addr = info.get(key, addr)
+        for (start, size, name) in self.watchpoints:
+            if addr is not None and start <= addr < start + size:
+                break
+        else:
+            self.target.cont()
+            return
+        
+        module = self.modules[name]
+        if module.mem is self.target:
+            # Reads go over the gdbstub, so finish them before resuming
+            changed = module.Refresh()
+            self.target.cont()
+            if changed:
+                # Check the module against the criteria
+                self.check(name)
+        else:
+            self.target.cont()
+            self.refresh(name)
+
+    def attach(self):
+        """ Attaches to the VM and sets the modules' watchpoints """
+
+        # Connect to the running VM.  This will halt it.
+        self.target = rsp.Remote('127.0.0.1', self.port)
+
+        # Each module reads its initial state and registers watchpoints.
+        # Modules that watch nothing read through the non-halting reader,
+        # if there is one, once the VM runs again.
+        later = []
+        for (name, module) in self.modules.items():
+            module.syms = self.syms
+            module.watcher = self
+            if module.watchsym is None and self.mem is not None:
+                module.mem = self.mem
+                later += [module]
+                continue
+            module.mem = self.target
+            for addr in module.Initialize(None):
+                size = WATCHSIZE[module.watchtype]
+                self.watchpoints += [(addr, size, name)]
+            if self.mem is not None:
+                module.mem = self.mem
+        
+        # Resume VM
+        self.target.cont()
+        for module in later:
+            module.Initialize(None)
+
+    def fileno(self):
+        return self.target.fileno()
+
+    def readable(self):
+        """ Handles the stop replies received so far """
+        
+        self.target.fill()
+        while self.target.ready():
+            (sig, info) = self.target.wait()
+            if sig is None:
+                # The VM is gone
+                exit()
+            self.handle(sig, info)
+
+    def run(self):
+        self.attach()
+        
+        # The main loop
+        while(True):
+            (sig, info) = self.target.wait()
+            if sig is None:
+                # The VM is gone
+                exit()
+            self.handle(sig, info)
+    
+
+class Coalescer():
+    """ Coalesces bursts of module triggers into fewer criteria checks 
+    
+    Modules record their new state as soon as an event arrives; only the
+    criteria evaluation is deferred.  A module's pending events are evaluated
+    once @events of them have accumulated or @window seconds have passed
+    since its last evaluation, and never later than @stale seconds after they
+    arrived.  The defaults evaluate every event immediately.  Deferred
+    evaluations are started with @timer, which defaults to a thread each.
+    """
+
+    def __init__(self, trigger, window=0, events=1, stale=0, 
+            timer=start_timer):
+        self.trigger = trigger
+        self.timer = timer
+        self.window = window
+        self.events = events
+        self.stale = stale
+        self.lock = threading.Lock()
+        self.checking = threading.Lock()
+        self.pending = {}   # Module to events since its last evaluation
+        self.last = {}      # Module to time of its last evaluation
+        self.timers = {}    # Module to its deferred evaluation
+        self.coalesced = 0
+        self.evaluations = 0
+
+    def configure(self, window=0, events=1, stale=0):
+        """ Changes the limits for events from now on """
+        
+        with self.lock:
+            self.window = window
+            self.events = events
+            self.stale = stale
+
+    def event(self, module):
+        """ Records an event for @module and evaluates it if it is due """
+        
+        with self.lock:
+            self.pending[module] = self.pending.get(module, 0) + 1
+            wait = self.window - (time() - self.last.get(module, 0))
+            if self.pending[module] < self.events and wait > 0:
+                self.coalesced += 1
+                if module not in self.timers:
+                    if self.stale:
+                        wait = min(wait, self.stale)
+                    self.timers[module] = self.timer(wait, self.flush,
+                        [module])
+                return
+        self.flush(module)
+
+    def flush(self, module):
+        """ Evaluates @module if it has pending events """
+        
+        with self.checking:
+            with self.lock:
+                timer = self.timers.pop(module, None)
+                if timer is not None:
+                    timer.cancel()
+                if not self.pending.pop(module, 0):
+                    return
+                self.last[module] = time()
+                self.evaluations += 1
+            self.trigger(module)
+
+    def stats(self):
+        return {'coalesced': self.coalesced, 'evaluations': self.evaluations}
+
+
 class Monitor():
     """ Integrity Monitor for a VM
         
@@ -147,71 +619,224 @@ class Monitor():
         4) Init Dynamic Measurements:
             Registers the dynamic modules and sets up their watchpoints.
         5) Wait for VM terminate / pause / etc command
+
+        State changes, verdicts and new measurements are published as events
+        on @bus, if there is one.  With a @reactor, the watcher and the 
+        monitor's timers run on the reactor instead of threads of their own.
+        The monitor's config is a compiled config.Snapshot, which may be
+        replaced while it runs with update().  Measurements and verdicts are
+        recorded in the @log, an audit.Log, if there is one.
     """
 
-    static = {}     # Static Module
-    dynamic = {}    # Dynamic Modules
-    clients = {}    # Criteria to client list
-    criteria = {}   # Criteria file to criteria object
-   
-    def __init__ (self, cfg, dom, pxy):
-        self.cfg = cfg
+    def __init__ (self, snap, dom, pxy, journal=None, saved=None, bus=None,
+            reactor=None, log=None):
+        self.snap = snap
+        self.cfg = snap.cfg
+        self.log = log
         self.dom = dom
         self.pxy = pxy
+        self.journal = journal
+        self.bus = bus
+        self.reactor = reactor
+        self.timer = start_timer
+        if reactor is not None:
+            self.timer = reactor.timer
         self.state = "__init__"
+        self.started = time()
+        self.ready = None
+        self.warm = saved is not None
+        self.saving = None  # Pending lazy journal write
+
+        self.static = {}    # Static Module
+        self.measured = {}  # Static module to the digest of its measurements
+        self.dynamic = {}   # Dynamic Modules
+        self.clients = Registry()   # Clients admitted per criteria
+        self.criteria = {}  # Criteria fingerprint to criteria object
+        self.loaded = {}    # Criteria file to (mtime, fingerprint, criteria)
 
         # Get some info about the domain
-        self.tree = etree.ElementTree(etree.XML(self.dom.XMLDesc(0)))
+        self.tree = describe(self.dom)
         self.name = self.tree.xpath('/domain/name/text()')[0]
-        self.ip = cfg.get('Domains', self.name).split()[0]
+        self.ip = snap.domains[self.name].ip
+
+        # Watcher events go through the coalescer before the criteria checks
+        self.coalescer = Coalescer(self.trigger, timer=self.timer, 
+            **snap.coalesce)
+        
+        # Asynchronously triggers the VM start function, or reattaches to the
+        # running VM if we have its journaled state
+        if saved is None:
+            self.timer(0, self.start)
+        else:
+            self.timer(0, self.reattach, [saved])
+
+    def update(self, snap):
+        """ Switches to a reloaded config.  Client rules, the domain's IP 
+        and the coalescing limits apply right away; modules and the watcher
+        keep the config they were started with. """
         
-        # Asynchronously triggers the VM start function.  
-        threading.Timer(0, self.start).start()
+        if self.name in snap.domains:
+            self.ip = snap.domains[self.name].ip
+        self.coalescer.configure(**snap.coalesce)
+        self.snap = snap
+        self.cfg = snap.cfg
+
+    def audit(self, kind, key, ips):
+        if self.log is not None:
+            for ip in ips:
+                self.log.verdict(kind, key, ip)
+
+    def publish(self, kind, data):
+        if self.bus is not None:
+            self.bus.publish(self.name, kind, data)
+
+    def transition(self, state):
+        self.state = state
+        self.publish('state', {'state': state})
 
     def start(self):
         """ Start the VM """
         
-        self.state = "Registering Static Modules"
+        self.transition("Registering Static Modules")
         # 1) Register Static Modules
-        for m in self.cfg.get('Monitor', 'static').split():
+        for m in self.snap.static:
             module = getattr(mods, m)
             self.static[m] = module(self.cfg, self.dom)
             self.static[m].Initialize()
+            self.measured[m] = measured(self.static[m])
                     
         # 2) Launch VM
         self.dom.create()
-        self.state = "Domain created.  Pausing for startup."
+        self.transition("Domain created.  Pausing for startup.")
         
         # Wait for domain to load kernel into memory
-        sleep(self.cfg.getint('Monitor', 'pause'))
+        self.timer(self.snap.pause, self.launch)
 
+    def launch(self):
+        """ Starts watching the VM once its kernel is loaded """
+        
         # Register dynamic modules
-        for m in self.cfg.get('Monitor', 'dynamic').split():
+        for m in self.snap.dynamic:
             module = getattr(mods, m)
-            self.dynamic[m] = module()
+            self.dynamic[m] = module(self.cfg)
+            self.dynamic[m].audit = self.log
 
         # 3) Start watcher thread
-        self.watcher = Watcher(self.cfg, self.tree, self.trigger, 
+        self.start_watcher()
+        self.transition("Domain running.")
+        self.ready = time()
+        self.save()
+
+    def start_watcher(self):
+        watcher = Watcher
+        if self.snap.backend == 'rsp':
+            watcher = RemoteWatcher
+        self.watcher = watcher(self.snap, self.tree, self.coalescer.event, 
             self.dynamic)
+        if self.reactor is not None:
+            self.watcher.reactor = self.reactor
+            self.watcher.attach()
+            self.reactor.add(self.watcher)
+            return
         self.watcher.daemon = True  # Ensure it dies when we do.
         self.watcher.start()
-        self.state = "Domain running."
+
+    def reattach(self, saved):
+        """ Monitor a VM that kept running across a restart 
+        
+        Static measurements, criteria and clients come from the journal.  The
+        watcher attaches to the running VM and dynamic modules only read what
+        changed since their checkpoint.
+        """
+        
+        self.transition("Restoring Static Modules")
+        for m in self.snap.static:
+            module = getattr(mods, m)
+            self.static[m] = module(self.cfg, self.dom)
+            self.static[m].Restore(saved['static'].get(m, None))
+            self.measured[m] = measured(self.static[m])
+        
+        for (key, sections) in saved['criteria'].items():
+            crt = ConfigParser()
+            for (section, items) in sections:
+                crt.add_section(section)
+                for (k, v) in items:
+                    crt.set(section, k, v)
+            self.criteria[key] = crt
+            self.clients.restore(key, saved['clients'][key])
+
+        for m in self.snap.dynamic:
+            module = getattr(mods, m)
+            self.dynamic[m] = module(self.cfg)
+            self.dynamic[m].audit = self.log
+            if m in saved['dynamic']:
+                self.dynamic[m].Restore(saved['dynamic'][m])
+        
+        self.start_watcher()
+        self.transition("Domain running.")
+        self.ready = time()
+
+        # Criteria may have been violated while nobody was watching
+        for m in self.dynamic:
+            self.trigger(m)
+        self.save()
+
+    def save(self, lazy=False):
+        """ Journals the monitor's state.  A @lazy save is deferred so 
+        bursts of measurements cost at most one write per interval. """
+        
+        if self.journal is None or self.state != "Domain running.":
+            return
+        if lazy:
+            if self.saving is None:
+                self.saving = self.timer(self.journal.interval, self.save)
+            return
+        
+        saving = self.saving
+        self.saving = None
+        if saving is not None:
+            saving.cancel()
+        
+        criteria = {}
+        for (key, crt) in self.criteria.items():
+            criteria[key] = [(sec, crt.items(sec)) for sec in crt.sections()]
+        state = {
+            'static': dict((n, m.Save()) for (n, m) in self.static.items()),
+            'dynamic': dict((n, m.Save()) for (n, m) in self.dynamic.items()),
+            'criteria': criteria,
+            'clients': self.clients.save(),
+        }
+        self.journal.save(self.name, state)
+
+    def stop_modules(self):
+        """ Stops the modules' background work before the VM goes """
+        
+        for module in self.static.values() + self.dynamic.values():
+            module.Stop()
 
     def destroy(self):
         """ Destroy the running VM """
         
+        self.stop_modules()
         self.dom.destroy()
+        self.transition("Domain destroyed.")
 
         # Kill lingering connections
-        for key in self.clients:
-            for ip in self.clients[key]:
+        for (key, ips) in self.clients.items():
+            for ip in ips:
                 self.pxy.kill(ip, self.ip)
-                
+        
+        if self.log is not None:
+            self.log.close()
         return True
 
     def detach(self):
-	""" Detach GDB from running VM """ 
-	self.watcher.dbg.interrupt()
+        """ Detach GDB from running VM """ 
+        self.stop_modules()
+        self.watcher.interrupt()
+        self.transition("Detached.")
+        if self.log is not None:
+            self.log.close()
 
     @timecall
     def trigger(self, module):
@@ -222,19 +847,60 @@ class Monitor():
         """
 
         m = self.dynamic[module]
+        self.publish('measurement', {'module': module, 'stats': m.Stats()})
+        revoked = False
         for (key, crt) in self.criteria.items():
             if not m.Check(crt):
-                # Need to kill all connections for that criteria
-                for ip in self.clients.pop(key):
-                    self.pxy.kill(ip, self.ip)
-                self.criteria.pop(key)
+                self.revoke(key)
+                revoked = True
+        
+        # Measurements can be checkpointed lazily, revocations can not
+        self.save(lazy=not revoked)
+
+    def revoke(self, key):
+        """ Kills all connections for a criteria and drops it """
+        
+        ips = self.clients.revoke(key)
+        for ip in ips:
+            self.pxy.kill(ip, self.ip)
+        self.criteria.pop(key)
+        self.publish('verdict', {'criteria': key, 'clients': ips, 
+            'verdict': False})
+        self.audit(audit.REVOKE, key, ips or [None])
+
+    def reload_sets(self, changes):
+        """ Re-evaluates only the criteria affected by a trusted set reload 
+        and returns how many were revoked. """
+        
+        prima = self.dynamic.get(mods.Prima.name, None)
+        if prima is None or self.state != "Domain running.":
+            return 0
+        
+        revoked = 0
+        for (key, crt) in self.criteria.items():
+            if prima.Affected(crt, changes):
+                self.revoke(key)
+                revoked += 1
+        if revoked:
+            self.save()
+        return revoked
 
     @timecall
-    def check(self, crt):
-        """ Checks a criteria against all modules """
+    def check(self, crt, key=None):
+        """ Checks a criteria against all modules 
+        
+        Static verdicts of criteria with fingerprint @key are memoized in 
+        the shared store, so domains with the same static measurements only
+        check a criteria once.
+        """
         
         for (name, module) in self.static.items():
-            if not module.Check(crt):
+            if key is None:
+                verdict = module.Check(crt)
+            else:
+                verdict = module.store.verdict((name, self.measured[name], 
+                    key), lambda: module.Check(crt))
+            if not verdict:
 #                print name
                 return False
         
@@ -245,55 +911,102 @@ class Monitor():
         
         return True
         
+    def load(self, crt_file):
+        """ Returns the fingerprint and criteria object of a criteria file. 
+        Files are only parsed again when they change. """
+        
+        mtime = os.stat(crt_file).st_mtime
+        cached = self.loaded.get(crt_file, None)
+        if cached is not None and cached[0] == mtime:
+            return cached[1:]
+        
+        crt = ConfigParser()
+        crt.read(crt_file)
+        self.loaded[crt_file] = (mtime, fingerprint(crt), crt)
+        return self.loaded[crt_file][1:]
+
     @timecall
     def register(self,ip):
         """ Register client and returns whether criteria is satisfied. """
 
-        crt_file = self.cfg.get("Clients",ip)
+        crt_file = self.snap.rules.lookup(ip)
+        if crt_file is None:
+            # No rule covers the client
+            self.audit(audit.REJECT, '', [ip])
+            return False
 
-        # Lookup criteria file
-        crt = self.criteria.get(crt_file,None)
+        # Lookup criteria by content, so identical policies are only 
+        # checked once
+        (key, crt) = self.load(crt_file)
         
-        if crt is None:
-            crt = ConfigParser()
-            crt.read(crt_file)
-        else:            
+        if key in self.criteria:
             # Add client since criteria is satisfied
-            if ip not in self.clients[crt_file]:
-                self.clients[crt_file] += [ip]
+            if self.admit(key, ip):
+                self.save()
+                self.publish('verdict', {'criteria': key, 'clients': [ip],
+                    'verdict': True})
+            else:
+                # Another connection of a known client
+                self.save(lazy=True)
             return True
             
-        if self.check(crt):
+        if self.check(crt, key):
             # Add client to the satisfied criteria list.
-            self.clients[crt_file] = [ip]
+            self.admit(key, ip)
 
             # Add running criteria
-            self.criteria[crt_file] = crt
+            self.criteria[key] = crt
+            self.save()
+            self.publish('verdict', {'criteria': key, 'clients': [ip],
+                'verdict': True})
             
             # success
             return True
         else:
+            self.publish('verdict', {'criteria': key, 'clients': [ip],
+                'verdict': False})
+            self.audit(audit.REJECT, key, [ip])
             return False
 
+    def admit(self, key, ip):
+        """ Counts a connection of @ip under criteria @key and returns 
+        whether the client is new to it.  A client whose rule moved it from
+        other criteria leaves them, and they are dropped once unused. """
+        
+        old = self.clients.criteria(ip)
+        new = self.clients.add(key, ip)
+        self.audit(audit.ADMIT, key, [ip])
+        if old not in (None, key) and not self.clients.has(old):
+            self.criteria.pop(old)
+        return new
+
     def unregister(self,ip):
         """ Unregister client. """
 
-        crt_file = self.cfg.get("Clients",ip)
-
-        if self.clients.get(crt_file,None) is None:
-            return False
-            
-        if ip not in self.clients[crt_file]:
+        (key, connected) = self.clients.remove(ip)
+        if key is None:
             return False
+        self.audit(audit.RELEASE, key, [ip])
+        if connected:
+            # The client has other connections open
+            self.save(lazy=True)
+            return True
 
-        self.clients[crt_file].remove(ip)
-        if len(self.clients[crt_file]) == 0:
-            self.clients.pop(crt_file)
-            self.criteria.pop(crt_file)
+        if not self.clients.has(key):
+            self.criteria.pop(key)
+        self.save()
         return True
             
 
     def status(self):
         """ Dump status of monitor """
         
-        return [self.state, self.clients.items(), self.static.keys(), self.dynamic.keys()]
+        stats = self.coalescer.stats()
+        stats['start'] = self.warm and 'warm' or 'cold'
+        stats['config'] = self.snap.loaded
+        if self.ready is not None:
+            stats['startup'] = self.ready - self.started
+        for (name, module) in self.static.items() + self.dynamic.items():
+            stats[name] = module.Stats()
+        return [self.state, self.clients.items(), self.static.keys(), 
+            self.dynamic.keys(), stats]
@@ -28,12 +28,12 @@
 
 
 
-from xmlrpclib import ServerProxy
+from util.transport import connect
 
 class Proxy():
     
-    def __init__(self, url):
-        self.server = ServerProxy(url)
+    def __init__(self, url, connections=4):
+        self.server = connect(url, connections)
         
     def kill(self, src, dest):
         """ Kill a connection """
@@ -0,0 +1,206 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Watcher Reactor
+
+Filename:    reactor.py
+            
+Description: A single epoll loop in place of a thread per domain.  Watchers
+             register their gdb output or RSP socket and are called when it
+             is readable; they parse the stop events and answer the halted VM
+             from the loop, and hand measurement reads and criteria checks to
+             a pool of worker threads.  Timers run their calls on the pool
+             too, so deferred work does not need a thread of its own.
+
+"""
+import os
+import heapq
+import select
+import threading
+import traceback
+from time import time
+from Queue import Queue
+
+class Call():
+    """ A call scheduled with Reactor.later """
+    
+    def __init__(self, when, fn, args):
+        self.when = when
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+    def cancel(self):
+        self.cancelled = True
+
+
+class Reactor(threading.Thread):
+    """ Dispatches readable sources, timers and pool work 
+    
+    A source has a fileno() and a readable() method, which must consume
+    everything that is buffered, since the loop only calls it again once more
+    input arrives.  Sources are dropped when readable() raises.
+    """
+
+    def __init__(self, workers=4):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.epoll = select.epoll()
+        self.sources = {}   # fd to source
+        self.timers = []    # heap of (when, seq, Call)
+        self.seq = 0
+        self.lock = threading.Lock()
+        self.serials = {}   # key to the call merged into its running job
+        self.queue = Queue()
+        self.dispatched = 0
+        for i in range(workers):
+            worker = threading.Thread(target=self.work)
+            worker.daemon = True
+            worker.start()
+
+        # Wakes up the loop when a timer is added
+        (self.wake_r, self.wake_w) = os.pipe()
+        self.epoll.register(self.wake_r, select.EPOLLIN)
+
+    def add(self, source):
+        with self.lock:
+            self.sources[source.fileno()] = source
+        self.epoll.register(source.fileno(), select.EPOLLIN)
+
+    def remove(self, source):
+        # The source may have closed its file already
+        with self.lock:
+            fds = [fd for (fd, s) in self.sources.items() if s is source]
+            for fd in fds:
+                self.sources.pop(fd)
+        for fd in fds:
+            try:
+                self.epoll.unregister(fd)
+            except (IOError, OSError, ValueError):
+                pass
+
+    def submit(self, fn, *args):
+        """ Runs @fn on the worker pool """
+        
+        self.queue.put((fn, args))
+
+    def work(self):
+        while True:
+            (fn, args) = self.queue.get()
+            self.call(fn, args)
+
+    def call(self, fn, args):
+        try:
+            fn(*args)
+        except Exception:
+            traceback.print_exc()
+
+    def serial(self, key, fn):
+        """ Runs @fn on the worker pool, one call per @key at a time.  Calls
+        made while one for @key runs are merged into a single call after it,
+        so @fn must catch up on everything that happened before it ran. """
+        
+        with self.lock:
+            if key in self.serials:
+                self.serials[key] = fn
+                return
+            self.serials[key] = None
+        self.queue.put((self.run_serial, [key, fn]))
+
+    def run_serial(self, key, fn):
+        while True:
+            self.call(fn, [])
+            with self.lock:
+                fn = self.serials[key]
+                if fn is None:
+                    del self.serials[key]
+                    return
+                self.serials[key] = None
+
+    def later(self, delay, fn, *args):
+        """ Runs @fn on the worker pool after @delay seconds.  Returns a
+        Call that may be cancelled. """
+        
+        call = Call(time() + delay, fn, args)
+        with self.lock:
+            self.seq += 1
+            heapq.heappush(self.timers, (call.when, self.seq, call))
+        os.write(self.wake_w, 'x')
+        return call
+
+    def timer(self, delay, fn, args=[]):
+        """ Stands in for a started threading.Timer """
+        return self.later(delay, fn, *args)
+
+    def timeout(self):
+        with self.lock:
+            if not self.timers:
+                return -1
+            return max(0, self.timers[0][0] - time())
+
+    def expire(self):
+        now = time()
+        due = []
+        with self.lock:
+            while self.timers and self.timers[0][0] <= now:
+                due.append(heapq.heappop(self.timers)[2])
+        for call in due:
+            if not call.cancelled:
+                self.submit(call.fn, *call.args)
+
+    def run(self):
+        while True:
+            try:
+                events = self.epoll.poll(self.timeout())
+            except IOError:
+                # Interrupted by a signal
+                continue
+            for (fd, mask) in events:
+                if fd == self.wake_r:
+                    os.read(self.wake_r, 4096)
+                    continue
+                source = self.sources.get(fd, None)
+                if source is None:
+                    continue
+                self.dispatched += 1
+                try:
+                    source.readable()
+                except SystemExit:
+                    self.remove(source)
+                except Exception:
+                    traceback.print_exc()
+                    self.remove(source)
+            self.expire()
+
+    def stats(self):
+        with self.lock:
+            return {'sources': len(self.sources), 'timers': len(self.timers),
+                'dispatched': self.dispatched}
@@ -0,0 +1,321 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Offline Policy Replay
+
+Filename:    replay.py
+            
+Description: Replays recorded measurement lists against candidate criteria 
+             and trusted sets, to see which VMs and clients a new policy 
+             would revoke before it is rolled out.  Measurement lists come 
+             from monitor journal checkpoints (*.state), audit logs (*.audit)
+             or dumps of one digest per line, which may be a guest's IMA 
+             ascii_runtime_measurements.  Checkpoints also give the criteria 
+             each VM has admitted clients under, which are replayed against
+             the candidate sets.
+
+             Digests are encoded as fixed width 20 byte numpy strings.  Every
+             (VM, trusted set) verdict is computed in one vectorized pass: a
+             bitmap of the sets each measured digest is missing from, OR'ed
+             together over each VM's digests.  Only the Prima part of a 
+             criteria is replayed.
+
+                python -m util.replay [-s sets.cfg ...] [-c criteria ...] 
+                    [-v] <checkpoint, audit log, dump or directory> ...
+
+"""
+import os
+import sys
+import pickle
+import numpy
+from getopt import getopt
+from ConfigParser import ConfigParser
+from util import audit
+from util.mods import Prima, ZERO, SETS_CFG
+
+# Digests OR'ed together at a time, to bound memory
+BATCH = 1 << 18
+
+def encode(digests):
+    """ Returns the sorted unique 20 byte encoding of hex @digests, without
+    the always trusted ZERO digest """
+    
+    raw = [d.decode('hex') for d in digests if d != ZERO]
+    return numpy.unique(numpy.array(raw, dtype='S20'))
+
+def decode(raw):
+    # numpy drops trailing NULs from fixed width strings
+    return raw.ljust(20, '\0').encode('hex')
+
+def trusted(crt):
+    """ Returns the trusted set a criteria's Prima section names, '' for an
+    empty set, or None if it has no Prima section and always passes """
+    
+    if not crt.has_section(Prima.name):
+        return None
+    if crt.has_option(Prima.name, 'trusted'):
+        return crt.get(Prima.name, 'trusted')
+    return ''
+
+
+class VM():
+    """ A recorded measurement list and the criteria admitted against it """
+    
+    def __init__(self, name, digests):
+        self.name = name
+        self.digests = encode(digests)
+        self.criteria = {}  # Key to criteria
+        self.clients = {}   # Key to admitted client IPs
+
+
+class Replay():
+    """ Recorded VMs, trusted sets and candidate criteria """
+    
+    def __init__(self):
+        self.vms = []
+        self.sets = {'': encode([])}
+        self.candidates = []    # (name, criteria)
+
+    def load_sets(self, path):
+        """ Loads the trusted sets of a set config like cfg/hashes.cfg.  Sets
+        replace any loaded before under the same name. """
+        
+        cfg = ConfigParser()
+        if not cfg.read(path):
+            raise Exception("Cannot read set config %s" % path)
+        for (k, v) in cfg.items("Sets"):
+            self.sets[k] = encode(pickle.load(open(v, 'rb')))
+
+    def load_criteria(self, path):
+        crt = ConfigParser()
+        if not crt.read(path):
+            raise Exception("Cannot read criteria %s" % path)
+        self.candidates.append((path, crt))
+
+    def load(self, path):
+        """ Loads the VMs recorded at @path, a file or a directory of them """
+        
+        if os.path.isdir(path):
+            for f in sorted(os.listdir(path)):
+                if f.endswith('.state') or f.endswith('.audit'):
+                    self.load(os.path.join(path, f))
+            return
+        
+        name = os.path.splitext(os.path.basename(path))[0]
+        if path.endswith('.state'):
+            self.load_state(name, path)
+        elif path.endswith('.audit'):
+            self.vms.append(VM(name, [r[3] for r in audit.read(path) 
+                if r[1] == audit.MEASUREMENT]))
+        else:
+            self.vms.append(VM(name, self.dump(path)))
+
+    def load_state(self, name, path):
+        """ Loads a monitor journal checkpoint """
+        
+        state = pickle.load(open(path, 'rb'))
+        prima = state['dynamic'].get(Prima.name, None) or {}
+        vm = VM(name, prima.get('mlist', []))
+        for (key, sections) in state['criteria'].items():
+            crt = ConfigParser()
+            for (section, items) in sections:
+                crt.add_section(section)
+                for (k, v) in items:
+                    crt.set(section, k, v)
+            vm.criteria[key] = crt
+            vm.clients[key] = [isinstance(c, basestring) and c or c[0] 
+                for c in state['clients'].get(key, [])]
+        self.vms.append(vm)
+
+    def dump(self, path):
+        """ Reads a dump of one digest per line.  Lines of IMA's 
+        ascii_runtime_measurements give the template digest second. """
+        
+        digests = []
+        for line in open(path):
+            fields = line.split()
+            if not fields or fields[0].startswith('#'):
+                continue
+            digests.append(len(fields) >= 4 and fields[1] or fields[0])
+        return digests
+
+    def index(self):
+        """ Encodes every VM's digests as rows of the sorted array of all 
+        measured digests """
+        
+        digests = numpy.concatenate([vm.digests for vm in self.vms] + 
+            [encode([])])
+        self.measured = numpy.unique(digests)
+        self.rows = numpy.searchsorted(self.measured, digests)
+        sizes = [len(vm.digests) for vm in self.vms]
+        self.owner = numpy.repeat(numpy.arange(len(self.vms)), sizes)
+        
+        # The entries of measured digest d are order[bounds[d]:bounds[d+1]]
+        self.order = numpy.argsort(self.rows, kind='mergesort')
+        self.bounds = numpy.searchsorted(self.rows[self.order], 
+            numpy.arange(len(self.measured) + 1))
+
+    def evaluate(self, names):
+        """ Returns a bool matrix of whether each VM's measurements are all 
+        in each of the trusted sets @names """
+        
+        self.index()
+        
+        # Bit j of a measured digest's row is set if set j lacks it
+        width = (len(names) + 7) / 8
+        self.missing = numpy.zeros((len(self.measured), width), 
+            dtype=numpy.uint8)
+        for (j, name) in enumerate(names):
+            trusted = self.sets.get(name, self.sets[''])
+            absent = numpy.ones(len(self.measured), dtype=bool)
+            if len(trusted):
+                pos = numpy.searchsorted(trusted, self.measured)
+                pos[pos == len(trusted)] = 0
+                absent = trusted[pos] != self.measured
+            self.missing[:, j / 8] |= absent.astype(numpy.uint8) << (7 - j % 8)
+        
+        # OR together the rows of each VM's digests that some set lacks, 
+        # a batch of them at a time
+        failed = numpy.zeros((len(self.vms), width), dtype=numpy.uint8)
+        keep = numpy.flatnonzero(self.missing.any(axis=1)[self.rows])
+        for first in range(0, len(keep), BATCH):
+            batch = keep[first:first+BATCH]
+            owners = self.owner[batch]
+            starts = numpy.r_[0, numpy.flatnonzero(numpy.diff(owners)) + 1]
+            failed[owners[starts]] |= numpy.bitwise_or.reduceat(
+                self.missing[self.rows[batch]], starts, axis=0)
+        
+        return numpy.unpackbits(failed, axis=1)[:, :len(names)] == 0
+
+    def culprits(self, j):
+        """ Returns {VM index: rows of its digests that set @j lacks} for the
+        VMs that fail set @j of the last evaluate """
+        
+        lacking = numpy.flatnonzero((self.missing[:, j / 8] >> (7 - j % 8)) 
+            & 1)
+        counts = self.bounds[lacking + 1] - self.bounds[lacking]
+        if not counts.sum():
+            return {}
+        
+        # Every entry of a lacking digest, then grouped by VM
+        entries = numpy.repeat(self.bounds[lacking] - numpy.cumsum(
+            numpy.r_[0, counts[:-1]]), counts) + numpy.arange(counts.sum())
+        owners = self.owner[self.order[entries]]
+        rows = numpy.repeat(lacking, counts)
+        by = numpy.argsort(owners, kind='mergesort')
+        (owners, rows) = (owners[by], rows[by])
+        split = numpy.flatnonzero(numpy.diff(owners)) + 1
+        return dict(zip(owners[numpy.r_[0, split]], numpy.split(rows, split)))
+
+    def digests(self, rows):
+        """ Returns the hex digests of @rows of the measured digests """
+        return [decode(d) for d in self.measured[rows]]
+
+    def run(self):
+        """ Returns the verdicts of the candidate criteria on every VM as
+        {criteria: [(vm, culprits)]} for the VMs it fails, and of the 
+        admitted criteria as [(vm, key, clients, culprits)] for those the 
+        sets would revoke.  Culprits are rows to pass to digests(). """
+        
+        names = self.referenced()
+        passed = self.evaluate(names)
+        culprits = dict((name, self.culprits(j)) for (j, name) in 
+            enumerate(names) if not passed[:, j].all())
+        
+        candidates = {}
+        for (path, crt) in self.candidates:
+            bad = culprits.get(trusted(crt), {})
+            candidates[path] = [(self.vms[i], bad[i]) for i in sorted(bad)]
+        
+        revoked = []
+        for (i, vm) in enumerate(self.vms):
+            for (key, crt) in sorted(vm.criteria.items()):
+                bad = culprits.get(trusted(crt), {})
+                if i in bad:
+                    revoked.append((vm, key, vm.clients[key], bad[i]))
+        return (candidates, revoked)
+
+    def referenced(self):
+        """ Returns the trusted sets named by any criteria """
+        
+        names = set(trusted(crt) for (path, crt) in self.candidates)
+        for vm in self.vms:
+            names.update(trusted(crt) for crt in vm.criteria.values())
+        names.discard(None)
+        return sorted(names)
+
+    def unknown(self):
+        """ Returns the trusted sets criteria name that were not loaded """
+        return [n for n in self.referenced() if n and n not in self.sets]
+
+
+def show(replay, culprits, verbose):
+    if verbose or len(culprits) <= 3:
+        return " ".join(replay.digests(culprits))
+    return "%s (+%d)" % (" ".join(replay.digests(culprits[:3])), 
+        len(culprits) - 3)
+
+
+if __name__ == "__main__":
+    
+    (opts, args) = getopt(sys.argv[1:], 's:c:v')
+    if not args:
+        print "replay [-s sets.cfg ...] [-c criteria ...] [-v] " \
+            "<checkpoint, audit log, dump or directory> ..."
+        exit()
+    verbose = ('-v', '') in opts
+    
+    replay = Replay()
+    sets = [v for (k, v) in opts if k == '-s'] or [SETS_CFG]
+    for path in sets:
+        replay.load_sets(path)
+    for (k, v) in opts:
+        if k == '-c':
+            replay.load_criteria(v)
+    for path in args:
+        replay.load(path)
+    for name in replay.unknown():
+        print "unknown trusted set %s; treated as empty" % name
+    
+    (candidates, revoked) = replay.run()
+    
+    for (path, crt) in replay.candidates:
+        failed = candidates[path]
+        print "%s: %d of %d VMs fail" % (path, len(failed), len(replay.vms))
+        for (vm, culprits) in failed:
+            print "  %s: %s" % (vm.name, show(replay, culprits, verbose))
+    
+    admitted = sum(len(vm.criteria) for vm in replay.vms)
+    print "%d of %d admitted criteria would be revoked" % (len(revoked), 
+        admitted)
+    for (vm, key, clients, culprits) in revoked:
+        print "  %s %s [%s]: %s" % (vm.name, key, " ".join(clients), 
+            show(replay, culprits, verbose))
@@ -0,0 +1,423 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+VM Server Router
+
+Filename:    router.py
+            
+Description: Spreads domains over several VMServer backends.  The router
+             accepts the same XML-RPC calls as VMServer and forwards each one
+             to the backend that owns the domain on a consistent hash ring.
+             export_connect and export_disconnect are routed by the domain
+             that owns dom_ip, and the reloads go to every backend.  Event
+             calls merge the event buses of every backend, with a cursor
+             per backend.  Backends that fail health checks leave the ring,
+             and the domains they ran are started on their new owner, which
+             reattaches to them if it shares the journal.
+
+"""
+import os
+import sys
+import bisect
+import threading
+from time import time, sleep
+from hashlib import md5
+from collections import deque
+from urlparse import urlsplit
+from ConfigParser import ConfigParser
+from util import config
+from util.server import Server
+from util.transport import PooledTransport, connect
+
+class Ring():
+    """ Consistent hash ring with @replicas points per node """
+
+    def __init__(self, nodes=[], replicas=100):
+        self.replicas = replicas
+        self.points = []
+        self.owners = {}
+        for node in nodes:
+            self.add(node)
+
+    def hash(self, key):
+        return int(md5(key).hexdigest()[:16], 16)
+
+    def add(self, node):
+        for i in range(self.replicas):
+            h = self.hash("%s#%d" % (node, i))
+            bisect.insort(self.points, h)
+            self.owners[h] = node
+
+    def remove(self, node):
+        for i in range(self.replicas):
+            h = self.hash("%s#%d" % (node, i))
+            self.points.remove(h)
+            self.owners.pop(h)
+
+    def lookup(self, key):
+        if not self.points:
+            return None
+        i = bisect.bisect(self.points, self.hash(key)) % len(self.points)
+        return self.owners[self.points[i]]
+
+
+class Mirror(threading.Thread):
+    """ Copy of the last @size events of one backend's bus 
+    
+    Long-polls the backend for as long as the router runs, so event calls
+    are answered from the copy, with the backend's own epoch and sequence
+    numbers, and never leave polls of their own behind.  @cond guards the
+    copy and is notified when events arrive.
+    """
+
+    def __init__(self, proxy, cond, size=10000, hold=30):
+        threading.Thread.__init__(self)
+        self.daemon = True
+        self.proxy = proxy
+        self.cond = cond
+        self.events = deque(maxlen=size)
+        self.hold = hold
+        self.epoch = 0      # Not heard from the backend yet
+        self.last = 0
+
+    def run(self):
+        backoff = 0.1
+        while True:
+            try:
+                batch = self.proxy.events(self.last, self.hold, self.epoch)
+            except Exception:
+                # Health checks deal with dead backends
+                sleep(backoff)
+                backoff = min(backoff * 2, 5)
+                continue
+            backoff = 0.1
+            with self.cond:
+                # A restarted backend numbers events anew, and events the 
+                # copy fell behind on leave a gap
+                if batch['epoch'] != self.epoch or batch['lost']:
+                    self.events.clear()
+                    self.epoch = batch['epoch']
+                self.events.extend(batch['events'])
+                self.last = batch['last']
+                self.cond.notify_all()
+
+    def since(self, seq, epoch, limit, domains=None):
+        """ Returns a batch of at most @limit events after event @seq of
+        backend epoch @epoch, as Bus.since does.  Call with @cond held. """
+        
+        if not self.epoch:
+            return {'epoch': epoch, 'last': seq, 'lost': False, 'events': []}
+        if (epoch and epoch != self.epoch) or seq > self.last:
+            seq = 0
+        first = self.last + 1
+        if self.events:
+            first = self.events[0][0]
+        lost = first > seq + 1
+        events = []
+        last = max(seq, first - 1)
+        # The copy has every event from first on, so skip straight to seq
+        for i in xrange(max(0, seq + 1 - first), len(self.events)):
+            if len(events) >= limit:
+                break
+            event = self.events[i]
+            last = event[0]
+            if not domains or event[2] in domains:
+                events.append(event)
+        return {'epoch': self.epoch, 'last': last, 'lost': lost, 
+            'events': events}
+
+
+class Router(Server):
+    """ XML-RPC front end for several VMServer backends 
+    
+    Every VMServer export must be listed below; the router rejects the rest
+    rather than guess where they go.
+    """
+    
+    # Methods answered by every live backend, routed by the domain in their
+    # first parameter, or routed by the domain that owns dom_ip
+    broadcast = ['reload_sets', 'reload']
+    routed = ['start', 'stop', 'force_stop', 'detach', 'status', 'profile']
+    by_ip = ['connect', 'disconnect']
+    
+    # Methods that merge the event buses of every live backend, and those
+    # that may take longer than the timeout to answer
+    merged = ['events', 'subscribe', 'unsubscribe']
+    slow = ['profile']
+    
+    # Seconds backends may hold a long-poll or profile open, seconds to 
+    # gather the events published together with the first, and events per
+    # backend in a batch
+    hold = 300
+    gather = 0.05
+    batch = 100
+    
+    def __init__(self, cfg):
+        self.cfg = cfg
+        host = cfg.get("Router", "host")
+        port = cfg.getint("Router", "port")
+        self.backends = cfg.get("Router", "backends").split()
+        
+        replicas = 100
+        if cfg.has_option("Router", "replicas"):
+            replicas = cfg.getint("Router", "replicas")
+        self.ring = Ring(self.backends, replicas)
+        self.alive = set(self.backends)
+        
+        self.timeout = 5.0
+        if cfg.has_option("Router", "timeout"):
+            self.timeout = cfg.getfloat("Router", "timeout")
+        connections = 8
+        if cfg.has_option("Router", "connections"):
+            connections = cfg.getint("Router", "connections")
+        self.transport = PooledTransport(connections, self.timeout)
+        self.proxies = dict((b, self.proxy(b)) for b in self.backends)
+        
+        # Long-polls and profiles get connections of their own, so they do
+        # not hold up other calls
+        self.waits = PooledTransport(connections, self.timeout + self.hold)
+        self.waiters = dict((b, connect(b, transport=self.waits)) 
+            for b in self.backends)
+        
+        # Copies of the backends' events
+        size = 10000
+        if cfg.has_option("Events", "size"):
+            size = cfg.getint("Events", "size")
+        self.cond = threading.Condition()
+        self.mirrors = dict((b, Mirror(self.waiters[b], self.cond, size)) 
+            for b in self.backends)
+        for mirror in self.mirrors.values():
+            mirror.start()
+        
+        # Domain that owns each VM IP, and backend each started domain is on
+        self.ip_to_dom = config.domains(cfg)[1]
+        self.placement = {}
+        self.lock = threading.Lock()
+
+        interval = 5.0
+        if cfg.has_option("Router", "health_interval"):
+            interval = cfg.getfloat("Router", "health_interval")
+        health = threading.Thread(target=self.health, args=[interval])
+        health.daemon = True
+        health.start()
+
+        Server.__init__(self, (host, port))
+
+    def proxy(self, backend):
+        return connect(backend, transport=self.transport)
+
+    def owner(self, domain):
+        """ Backend a domain is running on, or the one it would start on """
+        
+        with self.lock:
+            return self.placement.get(domain, None) or self.ring.lookup(domain)
+
+    def _dispatch(self, method, params):
+        
+        if method == 'ping':
+            return True
+        if method in self.merged:
+            return getattr(self, 'export_' + method)(*params)
+        if method in self.broadcast:
+            # Every backend monitors its own domains
+            res = {}
+            for backend in sorted(self.alive):
+                res[backend] = getattr(self.proxies[backend], method)(*params)
+            return res
+        if method in self.by_ip:
+            domain = self.ip_to_dom.get(params[1], None)
+            if domain is None:
+                # No Domain with that IP.
+                return False
+        elif method in self.routed and params:
+            domain = params[0]
+        else:
+            raise Exception('method "%s" is not supported' % method)
+
+        backend = self.owner(domain)
+        if backend is None:
+            raise Exception('No backend is available')
+        proxies = method in self.slow and self.waiters or self.proxies
+        res = getattr(proxies[backend], method)(*params)
+
+        # Remember where domains run so ring changes do not move them
+        with self.lock:
+            if method == 'start':
+                self.placement[domain] = backend
+            elif method in ['stop', 'force_stop', 'detach']:
+                self.placement.pop(domain, None)
+        return res
+
+    def export_events(self, since=0, timeout=30, epoch=0, domains=[]):
+        """ Long-polls for the events of every live backend.
+        
+        @since and @epoch are the 'last' and 'epoch' of the previous batch,
+        which map each backend to its own cursor, or 0 to start over.  
+        Returns once a backend has events, with the events of every backend 
+        published within @gather of the first.
+        """
+        
+        end = time() + min(timeout, self.hold)
+        with self.cond:
+            while True:
+                res = self.merge(since, epoch, domains)
+                if res['events'] or res['lost']:
+                    break
+                left = end - time()
+                if left <= 0:
+                    return res
+                self.cond.wait(left)
+        
+        sleep(self.gather)
+        with self.cond:
+            return self.merge(since, epoch, domains)
+
+    def merge(self, since, epoch, domains):
+        """ Returns the events of every live backend after the cursors
+        @since and @epoch in one batch.  Call with cond held. """
+        
+        res = {'epoch': {}, 'last': {}, 'lost': False, 'events': []}
+        for backend in sorted(self.alive):
+            batch = self.mirrors[backend].since(cursor(since, backend), 
+                cursor(epoch, backend), self.batch, domains or None)
+            res['epoch'][backend] = batch['epoch']
+            res['last'][backend] = batch['last']
+            res['lost'] = res['lost'] or batch['lost']
+            res['events'] += batch['events']
+        res['events'].sort(key=lambda event: event[1])
+        return res
+
+    def export_subscribe(self, url, since=0, epoch=0, domains=[]):
+        """ Subscribes @url to the events of every live backend.  Each one 
+        pushes its own batches, with its own epoch and sequence numbers.
+        Returns whether each backend accepted. """
+        
+        res = {}
+        for backend in sorted(self.alive):
+            try:
+                res[backend] = self.proxies[backend].subscribe(url, 
+                    cursor(since, backend), cursor(epoch, backend), domains)
+            except Exception:
+                res[backend] = False
+        return res
+
+    def export_unsubscribe(self, url):
+        res = {}
+        for backend in sorted(self.alive):
+            try:
+                res[backend] = self.proxies[backend].unsubscribe(url)
+            except Exception:
+                res[backend] = False
+        return res
+
+    def ping(self, backend):
+        try:
+            return self.proxies[backend].ping()
+        except Exception:
+            return False
+
+    def health(self, interval):
+        """ Removes dead backends from the ring and moves their domains """
+        
+        while True:
+            sleep(interval)
+            for backend in self.backends:
+                up = self.ping(backend)
+                moved = []
+                with self.lock:
+                    if up and backend not in self.alive:
+                        # Back up; new domains may land on it again
+                        self.alive.add(backend)
+                        self.ring.add(backend)
+                    elif not up and backend in self.alive:
+                        self.alive.remove(backend)
+                        self.ring.remove(backend)
+                        moved = [d for (d, b) in self.placement.items() 
+                            if b == backend]
+                        for domain in moved:
+                            self.placement.pop(domain)
+                for domain in moved:
+                    self.rebalance(domain)
+
+    def rebalance(self, domain):
+        """ Starts a domain of a dead backend on its new owner """
+        
+        backend = self.owner(domain)
+        if backend is None:
+            return
+        try:
+            self.proxies[backend].start(domain)
+        except Exception:
+            return
+        with self.lock:
+            self.placement[domain] = backend
+
+
+def cursor(value, backend):
+    """ Returns @backend's part of a merged events cursor, which is a dict 
+    keyed by backend, or a number every backend starts from """
+    
+    if isinstance(value, dict):
+        return value.get(backend, 0)
+    return value
+
+def backend_config(cfg, backend):
+    """ Returns a copy of @cfg for the backend at URL @backend 
+    
+    The slice listens on the backend's host and port.  It keeps every
+    domain, since any backend may take over a domain when another fails.
+    """
+    
+    res = ConfigParser()
+    for section in cfg.sections():
+        res.add_section(section)
+        for (k, v) in cfg.items(section, raw=True):
+            res.set(section, k, v)
+    url = urlsplit(backend)
+    res.set('VMServer', 'host', url.hostname)
+    res.set('VMServer', 'port', str(url.port))
+    return res
+
+
+if __name__ == "__main__":
+    
+    if len(sys.argv) < 3:
+        print "router <config> <output dir>"
+        exit()
+    
+    # Write one config slice per backend
+    cfg = ConfigParser()
+    cfg.read(sys.argv[1])
+    for backend in cfg.get("Router", "backends").split():
+        path = os.path.join(sys.argv[2], "backend-%d.cfg" % 
+            urlsplit(backend).port)
+        backend_config(cfg, backend).write(open(path, 'w'))
+        print path
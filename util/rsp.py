@@ -0,0 +1,338 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+GDB Remote Serial Protocol Client
+
+Filename:    rsp.py
+            
+Description: Talks to QEMU's gdbstub directly instead of driving a gdb process
+             with text macros.  Remote implements the memory Reader interface
+             on top of 'm' packets and sets hardware watchpoints with Z2/Z3,
+             so introspection modules can use it in place of a GuestMemory.
+             Stub is a minimal local RSP server backed by a LocalMemory for
+             exercising the client without a VM.
+
+"""
+import re
+import socket
+import threading
+from util.memory import Reader
+
+# Z packet types for write and read watchpoints
+WATCH_WRITE = 2
+WATCH_READ = 3
+
+# Stop reply keys that carry a watchpoint address
+WATCH_KEYS = ['watch', 'rwatch', 'awatch']
+
+def checksum(data):
+    return "%02x" % (sum(map(ord, data)) & 0xff)
+
+def frame(data):
+    return "$%s#%s" % (data, checksum(data))
+
+def decode(data):
+    """ Expands run-length encoded packet data """
+    
+    if '*' not in data:
+        return data
+    res = []
+    i = 0
+    while i < len(data):
+        if data[i] == '*':
+            res.append(res[-1][-1] * (ord(data[i+1]) - 29))
+            i += 2
+        else:
+            res.append(data[i])
+            i += 1
+    return "".join(res)
+
+def parse_stop(reply):
+    """ Parses a stop reply into its signal and a dict of its fields 
+    
+    Watchpoint addresses are converted to integers.  Exit replies ('W' and
+    'X') are returned with a signal of None.
+    """
+    
+    if reply[0] in 'WX':
+        return (None, {'exit': int(reply[1:3], 16)})
+    if reply[0] not in 'ST':
+        raise Exception("Unexpected stop reply: %s" % reply)
+
+    info = {}
+    for field in reply[3:].split(';'):
+        if ':' not in field:
+            continue
+        (k, v) = field.split(':', 1)
+        if k in WATCH_KEYS:
+            v = int(v, 16)
+        info[k] = v
+    return (int(reply[1:3], 16), info)
+
+
+class Connection():
+    """ Packet framing shared by the client and the stub """
+    
+    def __init__(self, sock):
+        self.sock = sock
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.buf = ''
+        self.ack = True
+
+    def fileno(self):
+        return self.sock.fileno()
+
+    def fill(self):
+        data = self.sock.recv(65536)
+        if not data:
+            raise EOFError("RSP connection closed")
+        self.buf += data
+
+    def ready(self):
+        """ Whether a whole packet or an interrupt byte is buffered """
+        
+        for (i, c) in enumerate(self.buf):
+            if c == '\x03':
+                return True
+            if c == '$':
+                end = self.buf.find('#', i)
+                return end >= 0 and len(self.buf) >= end + 3
+        return False
+
+    def send(self, data):
+        """ Sends a packet and waits for its acknowledgement """
+        
+        self.sock.sendall(frame(data))
+        while self.ack:
+            if not self.buf:
+                self.fill()
+            c = self.buf[0]
+            if c not in '+-':
+                # A packet overtook the acknowledgement; leave it for recv
+                return
+            self.buf = self.buf[1:]
+            if c == '+':
+                return
+            self.sock.sendall(frame(data))
+
+    def recv(self):
+        """ Returns the next packet's data.  A lone interrupt byte is 
+        returned as '\\x03'. """
+        
+        while True:
+            # Skip acknowledgements and stray bytes between packets
+            start = 0
+            while start < len(self.buf) and self.buf[start] not in '$\x03':
+                start += 1
+            self.buf = self.buf[start:]
+            if self.buf[:1] == '\x03':
+                self.buf = self.buf[1:]
+                return '\x03'
+            
+            end = self.buf.find('#')
+            if end >= 0 and len(self.buf) >= end + 3:
+                data = self.buf[1:end]
+                cs = self.buf[end+1:end+3]
+                self.buf = self.buf[end+3:]
+                if checksum(data) != cs:
+                    if self.ack:
+                        self.sock.sendall('-')
+                    continue
+                if self.ack:
+                    self.sock.sendall('+')
+                return decode(data)
+            self.fill()
+
+    def close(self):
+        self.sock.close()
+
+
+class Remote(Connection, Reader):
+    """ RSP client for a QEMU gdbstub """
+    
+    # Size of the packet buffer if the stub does not tell us
+    packetsize = 4096
+
+    # The gdbstub only answers while the VM is halted
+    halts = True
+
+    def __init__(self, host, port):
+        Connection.__init__(self, socket.create_connection((host, int(port))))
+        
+        # Connecting halts the VM
+        for feature in self.request('qSupported:swbreak+;hwbreak+').split(';'):
+            if feature.startswith('PacketSize='):
+                self.packetsize = int(feature[11:], 16)
+        if self.request('QStartNoAckMode') == 'OK':
+            self.ack = False
+
+    def request(self, data):
+        self.send(data)
+        return self.recv()
+
+    def read(self, vaddr, size):
+        """ Reads guest memory in as few 'm' packets as the stub allows """
+        
+        # Hex encoding doubles the size; leave room for the framing
+        batch = (self.packetsize - 4) / 2
+        res = []
+        while size > 0:
+            n = min(size, batch)
+            reply = self.request('m%x,%x' % (vaddr, n))
+            if reply == '' or (reply[0] == 'E' and len(reply) == 3):
+                raise Exception("Cannot read guest memory at %#x" % vaddr)
+            res.append(reply.decode('hex'))
+            vaddr += n
+            size -= n
+        return "".join(res)
+
+    def watch(self, vaddr, size, kind=WATCH_WRITE):
+        """ Sets a hardware watchpoint and returns its address """
+        
+        if self.request('Z%d,%x,%x' % (kind, vaddr, size)) != 'OK':
+            raise Exception("Cannot set watchpoint at %#x" % vaddr)
+        return vaddr
+
+    def unwatch(self, vaddr, size, kind=WATCH_WRITE):
+        if self.request('z%d,%x,%x' % (kind, vaddr, size)) != 'OK':
+            raise Exception("Cannot remove watchpoint at %#x" % vaddr)
+
+    def cont(self):
+        """ Resumes the VM.  The stub answers with a stop reply later. """
+        self.send('c')
+
+    def wait(self):
+        """ Blocks until the VM stops and returns the parsed stop reply """
+        return parse_stop(self.recv())
+
+    def interrupt(self):
+        """ Halts a running VM.  The stub answers with a stop reply. """
+        self.sock.sendall('\x03')
+
+    def detach(self):
+        self.request('D')
+        self.close()
+
+
+class Stub(threading.Thread):
+    """ Minimal RSP server for exercising Remote without a VM 
+    
+    Serves a single connection on localhost, reads and writes @mem (a
+    LocalMemory) and reports a watchpoint hit for each call to fire().
+    """
+    
+    # Zeroed x86-64 general purpose registers for gdb's 'g' packet
+    registers = '0' * 328
+    
+    def __init__(self, mem, port=0):
+        self.mem = mem
+        self.watches = set()
+        self.resumed = threading.Event()
+        self.lock = threading.Lock()
+        self.listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.listener.bind(('127.0.0.1', port))
+        self.listener.listen(1)
+        self.port = self.listener.getsockname()[1]
+        threading.Thread.__init__(self)
+        self.daemon = True
+
+    def fire(self, vaddr):
+        """ Waits for the client to resume the VM, then reports a write to
+        the watchpoint at @vaddr. """
+        
+        self.resumed.wait()
+        self.resumed.clear()
+        self.reply('T05watch:%x;' % vaddr)
+
+    def reply(self, data):
+        with self.lock:
+            self.conn.sock.sendall(frame(data))
+
+    def handle(self, pkt):
+        """ Returns the reply to @pkt, or None if there is none yet """
+        
+        if pkt == 'c':
+            self.resumed.set()
+            return None
+        if pkt == '\x03':
+            self.resumed.clear()
+            return 'T02'
+        if pkt == '?':
+            return 'S05'
+        if pkt == 'g':
+            return self.registers
+        if pkt.startswith('qSupported'):
+            return 'PacketSize=%x' % 65536
+        if pkt == 'QStartNoAckMode':
+            return 'OK'
+        m = re.match(r'm([0-9a-f]+),([0-9a-f]+)$', pkt)
+        if m is not None:
+            try:
+                return self.mem.read(int(m.group(1), 16), 
+                    int(m.group(2), 16)).encode('hex')
+            except Exception:
+                return 'E14'
+        m = re.match(r'M([0-9a-f]+),[0-9a-f]+:([0-9a-f]*)$', pkt)
+        if m is not None:
+            self.mem.write(int(m.group(1), 16), m.group(2).decode('hex'))
+            return 'OK'
+        m = re.match(r'([Zz])([23]),([0-9a-f]+),([0-9a-f]+)$', pkt)
+        if m is not None:
+            key = (int(m.group(3), 16), int(m.group(4), 16))
+            if m.group(1) == 'Z':
+                self.watches.add(key)
+            else:
+                self.watches.discard(key)
+            return 'OK'
+        if pkt == 'D':
+            return 'OK'
+        # Unsupported
+        return ''
+
+    def run(self):
+        (sock, addr) = self.listener.accept()
+        self.conn = Connection(sock)
+        try:
+            while True:
+                pkt = self.conn.recv()
+                res = self.handle(pkt)
+                if pkt == 'QStartNoAckMode':
+                    self.reply(res)
+                    self.conn.ack = False
+                elif res is not None:
+                    self.reply(res)
+                if pkt == 'D':
+                    break
+        except (EOFError, socket.error):
+            pass
+        self.conn.close()
+        self.listener.close()
@@ -0,0 +1,84 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Keep-Alive XML-RPC Server
+
+Filename:    server.py
+            
+Description: XML-RPC server for the persistent HTTP/1.1 connections that
+             util.transport keeps open, one thread per connection.  Kept apart
+             from the transport so clients do not import the server modules.
+
+"""
+import thread
+from SocketServer import ThreadingMixIn
+from SimpleXMLRPCServer import SimpleXMLRPCServer, SimpleXMLRPCRequestHandler
+
+class KeepAliveHandler(SimpleXMLRPCRequestHandler):
+    """ Serves many requests per connection until it idles for @timeout """
+    
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    timeout = 60
+
+    def log_error(self, format, *args):
+        # Idle keep-alive connections timing out is routine
+        if not format.startswith("Request timed out"):
+            SimpleXMLRPCRequestHandler.log_error(self, format, *args)
+
+
+class Server(ThreadingMixIn, SimpleXMLRPCServer):
+    """ XML-RPC server for keep-alive clients 
+    
+    Each connection gets a thread, so an idle keep-alive client does not 
+    hold up others.  @threads has the idents of the thread serving the
+    socket and those handling connections.
+    """
+    
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, addr, logRequests=True):
+        self.threads = set()
+        SimpleXMLRPCServer.__init__(self, addr, KeepAliveHandler, 
+            logRequests)
+
+    def serve_forever(self, poll_interval=0.5):
+        self.threads.add(thread.get_ident())
+        SimpleXMLRPCServer.serve_forever(self, poll_interval)
+
+    def process_request_thread(self, request, client_address):
+        self.threads.add(thread.get_ident())
+        try:
+            ThreadingMixIn.process_request_thread(self, request, 
+                client_address)
+        finally:
+            self.threads.discard(thread.get_ident())
@@ -0,0 +1,148 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Shared Measurement Store
+
+Filename:    store.py
+            
+Description: Content-addressed measurements of image files shared by every
+             monitor.  Files are identified by device, inode, size, mtime and
+             ctime, so domains that boot the same kernel or initrd share one
+             measurement, concurrent starts of the same image wait for a 
+             single hash, and a file is hashed again only once it changes.
+             Verdicts of static criteria are memoized by the measurements 
+             they were checked against.
+
+"""
+import os
+import threading
+from hashlib import sha1
+
+# Bytes read at a time while hashing
+BLOCK = 1 << 20
+
+def stamp(path):
+    st = os.stat(path)
+    return (st.st_dev, st.st_ino, st.st_size, st.st_mtime, st.st_ctime)
+
+
+class Store():
+    """ Measurements by file stamp, and memoized verdicts 
+    
+    At most @limit verdicts are kept; the memo is cleared when it fills.
+    """
+    
+    def __init__(self, limit=4096):
+        self.limit = limit
+        self.lock = threading.Lock()
+        self.digests = {}   # Stamp to hex SHA1 digest
+        self.inflight = {}  # Stamp to the event set when its hash is done
+        self.verdicts = {}
+        
+        self.hashed = 0     # Files hashed
+        self.read = 0       # Bytes hashed
+        self.hits = 0       # Measurements found in the store
+        self.waits = 0      # Measurements that waited for another's hash
+        self.memoized = 0   # Verdicts found in the memo
+
+    def hash(self, path):
+        """ Returns the hex digest of @path and the bytes read """
+        
+        digest = sha1()
+        size = 0
+        f = open(path, 'rb')
+        try:
+            for block in iter(lambda: f.read(BLOCK), ''):
+                digest.update(block)
+                size += len(block)
+        finally:
+            f.close()
+        return (digest.hexdigest(), size)
+
+    def measure(self, path):
+        """ Returns the hex SHA1 digest of file @path 
+        
+        If another thread is hashing the same file, waits for its result
+        instead.  A file that changes while it is hashed is not stored.
+        """
+        
+        while True:
+            key = stamp(path)
+            with self.lock:
+                if key in self.digests:
+                    self.hits += 1
+                    return self.digests[key]
+                done = self.inflight.get(key, None)
+                if done is not None:
+                    self.waits += 1
+                else:
+                    done = self.inflight[key] = threading.Event()
+                    break
+            
+            # Look again once the other hash is done, or hash the file here 
+            # if it failed
+            done.wait()
+        
+        try:
+            (digest, size) = self.hash(path)
+            with self.lock:
+                self.hashed += 1
+                self.read += size
+                if stamp(path) == key:
+                    self.digests[key] = digest
+        finally:
+            with self.lock:
+                self.inflight.pop(key, None)
+            done.set()
+        return digest
+
+    def verdict(self, key, check):
+        """ Returns the memoized result of @check for @key, calling it on 
+        the first use of @key.  @key must cover everything @check reads. """
+        
+        with self.lock:
+            if key in self.verdicts:
+                self.memoized += 1
+                return self.verdicts[key]
+        res = check()
+        with self.lock:
+            if len(self.verdicts) >= self.limit:
+                self.verdicts.clear()
+            self.verdicts[key] = res
+        return res
+
+    def stats(self):
+        with self.lock:
+            # XML-RPC ints are 32-bit, so bytes are reported in MB
+            return {'images': len(self.digests), 'hashed': self.hashed, 
+                'read_mb': round(self.read / float(1 << 20), 1), 
+                'hits': self.hits, 'waits': self.waits, 
+                'verdicts': len(self.verdicts), 'memoized': self.memoized}
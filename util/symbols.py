@@ -0,0 +1,229 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Kernel Symbol Table
+
+Filename:    symbols.py
+            
+Description: Symbol addresses and struct member offsets needed by modules that
+             read guest memory directly instead of through gdb macros.  The
+             table is extracted from a kernel image once and cached by the
+             image's build-id, so monitors can load it without having gdb 
+             read the kernel's DWARF.
+
+                python -m util.symbols <vmlinux> <cache dir>
+
+"""
+import os
+import sys
+import struct
+from hashlib import sha1
+from subprocess import *
+from ConfigParser import ConfigParser
+
+# Name and gdb expression of every value the raw introspection path uses.
+SYMBOLS = [
+    ('ima_measurements', '&ima_measurements'),
+    ('ima_measurements_prev', '&ima_measurements.prev'),
+    ('ima_htable_len', '&ima_htable.len.counter'),
+    ('selinux_enforcing', '&selinux_enforcing'),
+    ('ratelimit_interval', '&printk_ratelimit_state.interval'),
+    ('qe_later', '&((struct ima_queue_entry *) 0)->later'),
+    ('qe_entry', '&((struct ima_queue_entry *) 0)->entry'),
+    ('te_digest', '&((struct ima_template_entry *) 0)->template.digest'),
+    ('stext', '&_stext'),
+    ('etext', '&_etext'),
+    ('start_rodata', '&__start_rodata'),
+    ('end_rodata', '&__end_rodata'),
+]
+
+def printf(expr):
+    return 'printf "%%lu\\n", (unsigned long) (%s)' % expr
+
+# Echoed after each symbol so a reply can be told apart from a miss
+MARKER = '@@ivp-symbol@@'
+
+def require(table, names=None, optional=()):
+    """ Returns the entries of @table for @names, all of SYMBOLS by default.
+    Raises if one not in @optional is missing. """
+    
+    if names is None:
+        names = [name for (name, expr) in SYMBOLS]
+    missing = [n for n in names if table.get(n) is None and n not in optional]
+    if missing:
+        raise Exception("Kernel symbols not found: %s" % ', '.join(missing))
+    return dict((n, table[n]) for n in names if table.get(n) is not None)
+
+def needs(modules):
+    """ Returns the symbols @modules read and the set of those that the 
+    kernel may lack """
+    
+    (names, optional) = (set(), set())
+    for module in modules:
+        names.update(module.symbols)
+        optional.update(module.optional)
+    return (sorted(names), optional)
+
+def resolve(dbg, names=None, optional=()):
+    """ Evaluates symbols @names through a gdb that has the kernel loaded.
+    
+    gdb reports an unknown symbol on stderr and prints nothing on stdout, so
+    every reply is read up to an echoed marker instead of a line count.
+    """
+    
+    exprs = dict(SYMBOLS)
+    table = {}
+    for name in (exprs.keys() if names is None else names):
+        dbg.cmd(printf(exprs[name]))
+        reply = ' '.join(dbg.sync(MARKER)).split()
+        if reply and reply[-1].isdigit():
+            table[name] = int(reply[-1])
+    return require(table, names, optional)
+
+def build_id(path):
+    """ Returns the GNU build-id of ELF image @path as a hex string.
+    
+    Falls back to the SHA1 of the whole file for images without one.
+    """
+    
+    f = open(path, 'rb')
+    ident = f.read(16)
+    if ident[:4] != '\x7fELF':
+        raise Exception("%s is not an ELF image" % path)
+    
+    # Pick struct layouts for 32 or 64-bit little endian images
+    if ident[4] == '\x02':
+        (ehdr, shdr) = ('<HHIQQQIHHHHHH', '<IIQQQQIIQQ')
+    else:
+        (ehdr, shdr) = ('<HHIIIIIHHHHHH', '<IIIIIIIIII')
+    fields = struct.unpack(ehdr, f.read(struct.calcsize(ehdr)))
+    (shoff, shentsize, shnum) = (fields[5], fields[10], fields[11])
+
+    for i in range(shnum):
+        f.seek(shoff + i * shentsize)
+        sh = struct.unpack(shdr, f.read(struct.calcsize(shdr)))
+        
+        # Only SHT_NOTE sections
+        if sh[1] != 7:
+            continue
+        f.seek(sh[4])
+        notes = f.read(sh[5])
+        pos = 0
+        while pos + 12 <= len(notes):
+            (namesz, descsz, kind) = struct.unpack('<III', notes[pos:pos+12])
+            name = pos + 12
+            desc = name + ((namesz + 3) & ~3)
+            if kind == 3 and notes[name:name+namesz] == 'GNU\x00':
+                return notes[desc:desc+descsz].encode('hex')
+            pos = desc + ((descsz + 3) & ~3)
+
+    f.seek(0)
+    digest = sha1()
+    for block in iter(lambda: f.read(1 << 20), ''):
+        digest.update(block)
+    return digest.hexdigest()
+
+def extract(path, names=None, optional=()):
+    """ Extracts symbols @names from kernel image @path with a single batch
+    run of gdb.  Each value is printed with its name, so symbols the image
+    lacks are simply absent from the output. """
+    
+    exprs = dict(SYMBOLS)
+    if names is None:
+        names = exprs.keys()
+    args = ['gdb', '-q', '-batch', '-nx']
+    for name in names:
+        args += ['-ex', 'printf "%s %%lu\\n", (unsigned long) (%s)' % 
+            (name, exprs[name])]
+    out = Popen(args + [path], stdout=PIPE).communicate()[0]
+    
+    table = {}
+    for line in out.splitlines():
+        fields = line.split()
+        if len(fields) == 2 and fields[0] in exprs and fields[1].isdigit():
+            table[fields[0]] = int(fields[1])
+    return require(table, names, optional)
+
+def save(table, path):
+    cfg = ConfigParser()
+    cfg.add_section('Symbols')
+    for (name, value) in sorted(table.items()):
+        if value is None:
+            cfg.set('Symbols', name, 'absent')
+        else:
+            cfg.set('Symbols', name, '%#x' % value)
+    cfg.write(open(path, 'w'))
+
+def load(path):
+    cfg = ConfigParser()
+    cfg.read(path)
+    table = {}
+    for (name, value) in cfg.items('Symbols'):
+        if value == 'absent':
+            table[name] = None
+        else:
+            table[name] = int(value, 16)
+    return table
+
+def lookup(kernel, cache, names=None, optional=()):
+    """ Returns symbols @names of @kernel, extracting the whole table into the
+    @cache directory on first use or when SYMBOLS has grown since.  Symbols
+    the kernel lacks are cached as absent. """
+    
+    everything = [name for (name, expr) in SYMBOLS]
+    path = os.path.join(cache, build_id(kernel) + '.sym')
+    if os.path.exists(path):
+        table = load(path)
+        if not [name for name in everything if name not in table]:
+            return require(table, names, optional)
+    
+    table = extract(kernel, optional=everything)
+    for name in everything:
+        table.setdefault(name, None)
+    if not os.path.isdir(cache):
+        os.makedirs(cache)
+    save(table, path)
+    return require(table, names, optional)
+
+
+if __name__ == "__main__":
+    
+    if len(sys.argv) < 3:
+        print "symbols <vmlinux> <cache dir>"
+        exit()
+    
+    everything = [name for (name, expr) in SYMBOLS]
+    table = lookup(sys.argv[1], sys.argv[2], optional=everything)
+    for name in sorted(everything):
+        if name in table:
+            print "%-24s %#x" % (name, table[name])
+        else:
+            print "%-24s absent" % name
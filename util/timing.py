@@ -28,10 +28,11 @@
 
 
 
+import os
 import atexit
 import time
-import numpy
 import sys
+import thread
 
 disable = False
 
@@ -106,9 +107,59 @@ class FuncTimer(object):
         funcname = self.fn.__name__
         filename = self.fn.func_code.co_filename
         lineno = self.fn.func_code.co_firstlineno
+        n = len(self.sample)
+        mean = sum(self.sample) / n
+        std = (sum((s - mean) ** 2 for s in self.sample) / n) ** 0.5
         print ("\n  %s (%s:%s) [time in ms]:\n"
                "    n: %d calls\t mean: %.6f\t std: %.6f\n"
                "    min: %.6f\t max: %.6f\n" % (
-                funcname, filename, lineno, len(self.sample), 
-                1000*numpy.mean(self.sample), 1000*numpy.std(self.sample), 
+                funcname, filename, lineno, n, 1000*mean, 1000*std, 
                 1000*min(self.sample), 1000*max(self.sample)))
+
+
+class Sampler(object):
+    """Samples the stacks of running threads for flame graphs.
+
+    Every `interval` seconds, `select` is given the ident of each thread and
+    returns a label for the threads to sample, or None.  Stacks are counted
+    in the collapsed format of flamegraph.pl, rooted at the thread label::
+
+        watcher;monitor.py:run;monitor.py:handle 42
+
+    Nothing is hooked into the sampled threads, so a sampler costs nothing
+    once `sample` returns.
+    """
+
+    def __init__(self, select, interval=0.005):
+        self.select = select
+        self.interval = interval
+        self.stacks = {}
+        self.samples = 0
+
+    def sample(self, seconds):
+        """Samples for `seconds` in the calling thread, which is skipped."""
+        me = thread.get_ident()
+        end = time.time() + seconds
+        while time.time() < end:
+            for (ident, frame) in sys._current_frames().items():
+                label = ident != me and self.select(ident)
+                if not label:
+                    continue
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append("%s:%s" % (os.path.basename(code.co_filename),
+                        code.co_name))
+                    frame = frame.f_back
+                stack.append(label)
+                key = ";".join(reversed(stack))
+                self.stacks[key] = self.stacks.get(key, 0) + 1
+            frame = None
+            self.samples += 1
+            time.sleep(self.interval)
+        return self.collapsed()
+
+    def collapsed(self):
+        """Returns the stacks sampled so far, most frequent first."""
+        stacks = sorted(self.stacks.items(), key=lambda s: -s[1])
+        return "".join("%s %d\n" % s for s in stacks)
@@ -0,0 +1,173 @@
+# The Integrity Verification Proxy (IVP) additions are ...
+#
+#  Copyright (c) 2012 The Pennsylvania State University
+#  Systems and Internet Infrastructure Security Laboratory
+#
+# they were developed by:
+# 
+#  Joshua Schiffman <jschiffm@cse.psu.edu>
+#  Hayawardh Vijayakumar <huv101@cse.psu.edu>
+#  Trent Jaeger <tjaeger@cse.psu.edu>
+#
+# Unless otherwise noted, all code additions are ...
+#
+#  * Licensed under the Apache License, Version 2.0 (the "License");
+#  * you may not use this file except in compliance with the License.
+#  * You may obtain a copy of the License at
+#  *
+#  * http://www.apache.org/licenses/LICENSE-2.0
+#  *
+#  * Unless required by applicable law or agreed to in writing, software
+#  * distributed under the License is distributed on an "AS IS" BASIS,
+#  * WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+#  * See the License for the specific language governing permissions and
+#  * limitations under the License.
+
+
+
+
+
+
+"""
+Keep-Alive XML-RPC Transport
+
+Filename:    transport.py
+            
+Description: XML-RPC over persistent HTTP/1.1 connections.  PooledTransport
+             keeps idle connections per host and reuses them across calls and
+             threads, with a limit on the connections open to each host.
+             The server side is in util.server.
+
+"""
+import socket
+import httplib
+import threading
+import xmlrpclib
+
+class Pool():
+    """ Connections to one host, at most @limit of them in use at once """
+    
+    def __init__(self, host, limit, timeout):
+        self.host = host
+        self.timeout = timeout
+        self.idle = []
+        self.lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(limit)
+        self.opened = 0
+        self.reused = 0
+
+    def get(self):
+        """ Returns an idle connection, or a new one, and whether it was 
+        used before.  Blocks while @limit connections are in use. """
+        
+        self.slots.acquire()
+        with self.lock:
+            if self.idle:
+                self.reused += 1
+                return (self.idle.pop(), True)
+            self.opened += 1
+        if self.timeout is None:
+            return (httplib.HTTPConnection(self.host), False)
+        return (httplib.HTTPConnection(self.host, timeout=self.timeout), False)
+
+    def put(self, conn):
+        with self.lock:
+            self.idle.append(conn)
+        self.slots.release()
+
+    def discard(self, conn):
+        conn.close()
+        self.slots.release()
+
+    def close(self):
+        with self.lock:
+            idle = self.idle
+            self.idle = []
+        for conn in idle:
+            conn.close()
+
+
+class PooledTransport(xmlrpclib.Transport):
+    """ Thread safe XML-RPC transport over keep-alive connections 
+    
+    One transport may be shared by several ServerProxy objects; connections
+    are pooled per host.
+    """
+
+    def __init__(self, limit=4, timeout=None, use_datetime=0):
+        xmlrpclib.Transport.__init__(self, use_datetime)
+        self.limit = limit
+        self.timeout = timeout
+        self.pools = {}
+        self.lock = threading.Lock()
+
+    def pool(self, host):
+        with self.lock:
+            if host not in self.pools:
+                self.pools[host] = Pool(host, self.limit, self.timeout)
+            return self.pools[host]
+
+    def request(self, host, handler, request_body, verbose=0):
+        (chost, headers, x509) = self.get_host_info(host)
+        pool = self.pool(chost)
+        
+        for attempt in (0, 1):
+            (conn, reused) = pool.get()
+            try:
+                self.send_request(conn, handler, request_body)
+                for (key, value) in headers or []:
+                    conn.putheader(key, value)
+                self.send_user_agent(conn)
+                self.send_content(conn, request_body)
+                response = conn.getresponse(buffering=True)
+            except (socket.error, httplib.HTTPException):
+                pool.discard(conn)
+                # The server may have closed an idle connection
+                if reused and not attempt:
+                    continue
+                raise
+            
+            try:
+                if response.status != 200:
+                    response.read()
+                    raise xmlrpclib.ProtocolError(host + handler,
+                        response.status, response.reason, response.msg)
+                self.verbose = verbose
+                result = self.parse_response(response)
+            except (xmlrpclib.Fault, xmlrpclib.ProtocolError):
+                # The response was read in full
+                self.release(pool, conn, response)
+                raise
+            except:
+                pool.discard(conn)
+                raise
+            self.release(pool, conn, response)
+            return result
+
+    def release(self, pool, conn, response):
+        if response.will_close:
+            pool.discard(conn)
+        else:
+            pool.put(conn)
+
+    def close(self):
+        with self.lock:
+            pools = self.pools.values()
+        for pool in pools:
+            pool.close()
+
+    def stats(self):
+        """ Connections opened and reused per host """
+        
+        with self.lock:
+            return dict((host, [pool.opened, pool.reused]) 
+                for (host, pool) in self.pools.items())
+
+
+def connect(url, limit=4, timeout=None, transport=None):
+    """ Returns a ServerProxy for @url over a keep-alive @transport """
+    
+    if transport is None:
+        transport = PooledTransport(limit, timeout)
+    return xmlrpclib.ServerProxy(url, transport=transport)
+
@@ -38,24 +38,43 @@ Description: Defines an XMLRPC server to manage VMs and attach its integrity
              monitor.
 
 """
-from SimpleXMLRPCServer import SimpleXMLRPCServer
+from util.server import Server
 from util.monitor import Monitor
+from util import mods
+from time import sleep, ctime
+import threading
 import libvirt
 from util.netproxy import Proxy
+from util.journal import Journal
+from util.events import Bus
+from util.timing import Sampler
+from util.reactor import Reactor
+from util import config
+from util import audit
+import os
 
-class VMServer(SimpleXMLRPCServer):
+class VMServer(Server):
         """ VM Management Server
         
         Accepts XML-RPC requests to start and stop VMs.  
         Also register's criteria in the VM's integrity monitor.
+        Clients may keep their connections open; calls from all connections
+        are still handled one at a time, except for the event calls in
+        @concurrent, which do not touch the monitors.
         """
         
+        concurrent = ['events', 'subscribe', 'unsubscribe', 'profile']
+        max_profile = 60
         kvm = None
         monitors = {}
-        ip_to_dom = {}
                     
-        def __init__(self, cfg):
-            self.cfg = cfg
+        def __init__(self, snap):
+            """ Serves with the compiled config @snap.  Reloads apply to 
+            the domains, clients and monitor options; the [VMServer], 
+            [Events] and [Reactor] sections take a restart. """
+            
+            self.snap = snap
+            cfg = snap.cfg
             host = cfg.get("VMServer","host")
             port = cfg.getint("VMServer","port")
 
@@ -64,9 +83,59 @@ class VMServer(SimpleXMLRPCServer):
                 print "No hypervisor found!"
                 exit()
 
-            self.pxy = Proxy(cfg.get('VMServer','netproxy'))
+            connections = 4
+            if cfg.has_option('VMServer', 'netproxy_connections'):
+                connections = cfg.getint('VMServer', 'netproxy_connections')
+            self.pxy = Proxy(cfg.get('VMServer','netproxy'), connections)
+            self.lock = threading.Lock()
+
+            # Monitor state survives restarts if a journal is configured
+            self.journal = None
+            if cfg.has_option('VMServer', 'journal'):
+                interval = 1.0
+                if cfg.has_option('VMServer', 'journal_interval'):
+                    interval = cfg.getfloat('VMServer', 'journal_interval')
+                self.journal = Journal(cfg.get('VMServer', 'journal'), 
+                    interval)
+
+            # Monitors publish their events for subscribers
+            opts = {}
+            for (opt, kind) in [('size', int), ('batch', int), 
+                    ('delay', float), ('expire', float)]:
+                if cfg.has_option('Events', opt):
+                    opts[opt] = kind(cfg.get('Events', opt))
+            self.bus = Bus(**opts)
+
+            # Audit logs of measurements and verdicts, one per domain
+            self.audit = None
+            if cfg.has_section('Audit'):
+                opts = {}
+                for (opt, kind) in [('interval', float), ('size', int)]:
+                    if cfg.has_option('Audit', opt):
+                        opts[opt] = kind(cfg.get('Audit', opt))
+                self.audit = audit.Writer(**opts)
+                self.audit.start()
+                self.audit_path = cfg.get('Audit', 'path')
+                if not os.path.isdir(self.audit_path):
+                    os.makedirs(self.audit_path)
+
+            # Watch all domains from one event loop instead of a thread each
+            self.reactor = None
+            if cfg.has_section('Reactor'):
+                workers = 4
+                if cfg.has_option('Reactor', 'workers'):
+                    workers = cfg.getint('Reactor', 'workers')
+                self.reactor = Reactor(workers)
+                self.reactor.start()
+
+            # Watch the trusted hash sets for changes
+            if cfg.has_option('VMServer', 'sets_poll'):
+                watch = threading.Thread(target=self.watch_sets, 
+                    args=[cfg.getfloat('VMServer', 'sets_poll')])
+                watch.daemon = True
+                watch.start()
                 
-            SimpleXMLRPCServer.__init__(self, (host, port))
+            Server.__init__(self, (host, port))
     
         def _dispatch(self, method, params):
             try:
@@ -77,13 +146,111 @@ class VMServer(SimpleXMLRPCServer):
             except AttributeError:
                 raise Exception('method "%s" is not supported' % method)
             else:
-                return func(*params)
+                if method in self.concurrent:
+                    return func(*params)
+                with self.lock:
+                    return func(*params)
     
+        def watch_sets(self, interval):
+            """ Reloads the trusted hash sets whenever their files change """
+            
+            while True:
+                sleep(interval)
+                if mods.Prima.loaded and mods.sets_changed():
+                    with self.lock:
+                        self.export_reload_sets()
+
+        def export_reload_sets(self):
+            """ Applies changes to the trusted hash sets to running monitors.
+            
+            Returns the number of hashes added and removed per changed set
+            and the number of criteria revoked per domain.
+            """
+            
+            changes = mods.reload_sets()
+            revoked = {}
+            for (domain, mon) in self.monitors.items():
+                revoked[domain] = mon.reload_sets(changes)
+            
+            counts = {}
+            for (name, (added, removed)) in changes.items():
+                counts[name] = [len(added), len(removed)]
+            return [counts, revoked]
+
+        def export_reload(self):
+            """ Compiles the config file again and swaps it in for new 
+            requests and running monitors.  A config that fails to compile
+            is not applied. """
+            
+            try:
+                snap = config.load(self.snap.path)
+            except Exception as e:
+                return "Reload failed: %s.  Serving the config loaded %s." % (
+                    e, ctime(self.snap.loaded))
+            self.snap = snap
+            
+            for (domain, mon) in self.monitors.items():
+                mon.update(snap)
+            return "Reloaded %d domains and %d client rules." % (
+                len(snap.domains), len(snap.rules))
+
+        def export_ping(self):
+            """ Health check """
+            return True
+
+        def export_events(self, since=0, timeout=30, epoch=0, domains=[]):
+            """ Long-polls for monitor events after sequence number @since.
+            
+            Returns a batch with the bus epoch, the sequence number to pass 
+            as @since next time, whether events were lost and the events.
+            """
+            
+            since = self.bus.resume(since, epoch)
+            return self.bus.wait(since, min(timeout, 300), 
+                domains=domains or None)
+
+        def export_subscribe(self, url, since=0, epoch=0, domains=[]):
+            """ Pushes batches of events after @since to the "events"
+            method of the XML-RPC server at @url. """
+            
+            self.bus.subscribe(url, since, epoch, domains or None)
+            return True
+
+        def export_unsubscribe(self, url):
+            return self.bus.unsubscribe(url)
+
+        def export_profile(self, domain, seconds=10, mode='both'):
+            """ Samples a domain's watcher thread, the XML-RPC server 
+            threads or both for up to @max_profile seconds.  Watchers run by 
+            the reactor are sampled through the reactor's thread, which 
+            serves every domain.
+
+            Returns the sampled stacks collapsed for flamegraph.pl.
+            """
+            
+            if mode not in ['watcher', 'server', 'both']:
+                return "mode must be watcher, server or both."
+            mon = self.monitors.get(domain, None)
+            watcher = getattr(mon, 'watcher', None)
+            if mode != 'server' and watcher is None:
+                return domain + " has no watcher."
+            if getattr(watcher, 'reactor', None) is not None:
+                watcher = watcher.reactor
+            
+            def select(ident):
+                if watcher is not None and ident == watcher.ident:
+                    return mode != 'server' and 'watcher'
+                return mode != 'watcher' and ident in self.threads and \
+                    'server'
+            
+            seconds = min(seconds, self.max_profile)
+            return Sampler(select).sample(seconds)
+
         def export_disconnect(self, src_ip, dom_ip):
             """ Unregisters a client's criteria for a connection. 
             """
             
-            monitor = self.ip_to_dom.get(dom_ip, None)
+            monitor = self.monitors.get(self.snap.ip_to_dom.get(dom_ip), None)
             if monitor is None:
                 # No Domain is running.
                 return False
@@ -101,7 +268,7 @@ class VMServer(SimpleXMLRPCServer):
             Returns True if the criteria is satisfied and False otherwise.
             """
             
-            monitor = self.ip_to_dom.get(dom_ip, None)
+            monitor = self.monitors.get(self.snap.ip_to_dom.get(dom_ip), None)
             if monitor is None:
                 # No Domain is running.
                 return False
@@ -124,18 +291,31 @@ class VMServer(SimpleXMLRPCServer):
                 return e.get_error_message()
 
             # Check if its running unmanaged
+            saved = None
             if dom.isActive():
-                return domain + " is running unmanaged."
+                if self.journal is not None:
+                    saved = self.journal.load(domain)
+                if saved is None:
+                    return domain + " is running unmanaged."
 
             # Setup our Domain's monitor object
-            self.monitors[domain] = Monitor(self.cfg, dom, self.pxy)
-            
-            # Set IP lookup table
-            ip = self.cfg.get("Domains",domain).split()[0]
-            self.ip_to_dom[ip] = self.monitors[domain]
+            log = None
+            if self.audit is not None:
+                log = self.audit.open(os.path.join(self.audit_path, 
+                    domain + '.audit'))
+            self.monitors[domain] = Monitor(self.snap, dom, self.pxy, 
+                self.journal, saved, self.bus, self.reactor, log)
             
+            if saved is not None:
+                return domain + " is reattaching."
             return domain + " is starting."
 
+        def forget(self, domain):
+            """ Drops the journaled state of a domain we no longer manage """
+            
+            if self.journal is not None:
+                self.journal.remove(domain)
+
         def export_stop(self, domain):
             """ Stop a VM Monitor """
             
@@ -154,6 +334,7 @@ class VMServer(SimpleXMLRPCServer):
                 if mon.destroy():
                     # clean up time.
                     self.monitors.pop(domain)
+                    self.forget(domain)
                     return domain + " destroyed."
                 else:
                     # This really should not happen.
@@ -176,6 +357,7 @@ class VMServer(SimpleXMLRPCServer):
             else:
                 if mon.destroy():
                     self.monitors.pop(domain)
+                    self.forget(domain)
                     return domain + " destroyed."
                 else:
                     return "An error occured."
@@ -188,9 +370,10 @@ class VMServer(SimpleXMLRPCServer):
                 except libvirt.libvirtError as e:
                     return e.get_error_message()
 
-	    mon.detach()
-	    self.monitors.pop(mon)
-	    return "GDB detached from VM"
+            mon.detach()
+            self.monitors.pop(domain)
+            self.forget(domain)
+            return "GDB detached from VM"
         
         def export_status(self,domain):
             mon = self.monitors.get(domain,None)